@@ -1 +1 @@
-from .agent import run_anomaly_detector
\ No newline at end of file
+from .agent import run_anomaly_detector, arun_anomaly_detector, astream_anomaly_detector, run_statistical_anomalies
@@ -1,22 +1,36 @@
+import functools
+import json
 import os
-import openai
-from dotenv import load_dotenv
 
-load_dotenv()
-openai.api_key = os.getenv("OPENAI_API_KEY")
+from agents.common.llm_client import get_client
+from agents.cost_estimator.backends import get_backend
+from agents.cost_estimator.cohorts import cohort_filter
+from config.tracing import span
 
-def run_anomaly_detector(inputs):
-    avg = inputs.get("avg_cost", 0)
-    median = inputs.get("median_cost", 0)
-    min_cost = inputs.get("min_cost", 0)
-    max_cost = inputs.get("max_cost", 0)
+# The row-level engine (numpy, pandas) is imported on first use, not with the task
+
+
+def _kpis(inputs):
+    return (
+        inputs.get("avg_cost", 0),
+        inputs.get("median_cost", 0),
+        inputs.get("min_cost", 0),
+        inputs.get("max_cost", 0),
+    )
 
+
+def detect_flags(inputs):
+    avg, _, min_cost, max_cost = _kpis(inputs)
     flags = []
     if min_cost == 0 or max_cost == 0:
         flags.append("zero_extremes")
     elif avg == 0:
         flags.append("zero_average")
+    return flags
+
 
+def build_messages(inputs):
+    avg, median, min_cost, max_cost = _kpis(inputs)
     prompt = f"""
     Based on the following healthcare cost KPIs, write a 2-sentence analysis of any data quality anomalies or red flags:
     - Average Cost: {avg}
@@ -24,12 +38,96 @@ def run_anomaly_detector(inputs):
     - Min Cost: {min_cost}
     - Max Cost: {max_cost}
     """
+    return [{"role": "user", "content": prompt}]
 
-    response = openai.ChatCompletion.create(
-        model="gpt-4",
-        messages=[{"role": "user", "content": prompt}]
-    )
 
-    explanation = response.choices[0].message["content"]
+def run_anomaly_detector(inputs):
+    flags = detect_flags(inputs)
+    explanation = get_client().chat(build_messages(inputs), model="gpt-4")
     return {"anomaly_flags": flags, "explanation": explanation}
 
+
+async def arun_anomaly_detector(inputs):
+    flags = detect_flags(inputs)
+    explanation = await get_client().achat(build_messages(inputs), model="gpt-4")
+    return {"anomaly_flags": flags, "explanation": explanation}
+
+
+async def astream_anomaly_detector(inputs):
+    # Yields growing partial results; the last one equals run_anomaly_detector's output
+    flags = detect_flags(inputs)
+    explanation = ""
+    yield {"anomaly_flags": flags, "explanation": explanation}
+    async for delta in get_client().astream(build_messages(inputs), model="gpt-4"):
+        explanation += delta
+        yield {"anomaly_flags": flags, "explanation": explanation}
+
+
+@functools.lru_cache(maxsize=4)
+def _load_rows(path):
+    from agents.cost_estimator.local_backend import LocalBackend
+
+    return LocalBackend(path)
+
+
+def _row_source():
+    # The row-level engine needs the rows: the local engine in use, or a file named by
+    # DATASAGE_ANOMALY_DATA_PATH when KPIs come from BigQuery
+    from agents.cost_estimator.local_backend import LocalBackend
+
+    backend = get_backend()
+    backend = getattr(backend, "backend", backend)
+    if isinstance(backend, LocalBackend):
+        return backend
+    path = os.getenv("DATASAGE_ANOMALY_DATA_PATH")
+    return _load_rows(path) if path else None
+
+
+def data_version():
+    # The rows behind the statistical report; None when the step only sees the KPIs
+    source = _row_source()
+    return source.data_version() if source is not None else None
+
+
+def build_summary_messages(summary):
+    prompt = f"""
+    A statistical scan of healthcare cost claims (robust z-scores on log cost, IQR fences, and insurance_paid + member_paid vs cost checks) found:
+    {json.dumps(summary)}
+    Write a 2-sentence analysis of the most important data quality anomalies or red flags.
+    """
+    return [{"role": "user", "content": prompt}]
+
+
+def run_statistical_anomalies(inputs, explain=False, max_rows=20):
+    # Structured row and cohort flags; the optional LLM call only sees the compact summary
+    from agents.anomaly_detector import engine
+
+    source = _row_source()
+    if source is None:
+        raise RuntimeError("No row-level data: use the local backend or set DATASAGE_ANOMALY_DATA_PATH")
+    with span("anomaly_scan", rows=source.size):
+        report = engine.scan(source).report(cohort_filter(inputs), max_rows=max_rows)
+    reasons = {reason for flag in report["cohort_flags"] + report["row_flags"] for reason in flag["reasons"]}
+    result = {"anomaly_flags": sorted(reasons), "explanation": None, **report}
+    if explain:
+        result["explanation"] = get_client().chat(build_summary_messages(engine.summarize(report)), model="gpt-4")
+    return result
+
+
+def run(estimate_cost=None, **inputs):
+    # task.yaml entry point. With row-level data the step makes no LLM call: the KPI flags plus
+    # the statistical report under "statistical", and an explanation of its summary only when
+    # DATASAGE_ANOMALY_EXPLAIN is on. Without rows, the KPI check and its LLM explanation.
+    from agents.narrative_fusion.agent import fused_enabled, fused_step
+
+    if _row_source() is not None:
+        explain = os.getenv("DATASAGE_ANOMALY_EXPLAIN", "off").lower() in ("1", "on", "true", "yes")
+        statistical = run_statistical_anomalies(inputs, explain=explain)
+        return {
+            "anomaly_flags": detect_flags(estimate_cost or {}),
+            "explanation": statistical["explanation"],
+            "statistical": statistical,
+        }
+    if fused_enabled():
+        return fused_step("detect_anomalies", estimate_cost or {})
+    return run_anomaly_detector(estimate_cost or {})
@@ -0,0 +1,252 @@
+import threading
+import weakref
+
+import numpy as np
+
+from agents.cost_estimator.local_backend import CATEGORY_COLUMNS
+
+# Iglewicz-Hoaglin modified z-score: 0.6745 * (x - median) / MAD, outlier above 3.5
+MAD_SCALE = 0.6745
+DEFAULT_Z_THRESHOLD = 3.5
+DEFAULT_IQR_K = 1.5
+DEFAULT_BAND_WIDTH = 10
+# Cells smaller than this have no stable median/MAD, so only the paid checks apply
+DEFAULT_MIN_CELL_SIZE = 5
+PAID_TOLERANCE = 0.01
+ROW_REASONS = ("robust_z", "iqr_fence", "paid_mismatch", "negative_amount")
+
+
+def _group_quantile(sorted_values, starts, counts, q):
+    # Linear-interpolated quantile of every contiguous group of a group-sorted array
+    position = starts + q * (counts - 1)
+    lower = np.floor(position).astype(np.int64)
+    upper = np.minimum(lower + 1, starts + counts - 1)
+    frac = position - lower
+    return sorted_values[lower] * (1 - frac) + sorted_values[upper] * frac
+
+
+def _sort_within_groups(values, groups, counts):
+    # Sorting group * span + value orders by group, then by value, with one float sort
+    # (several times faster than lexsort); the values are recovered by subtracting it back
+    low = values.min()
+    span = values.max() - low + 1.0
+    key = groups * span + (values - low)
+    key.sort()
+    return key - np.repeat(np.arange(len(counts)) * span, counts) + low
+
+
+def _group_quantiles(values, groups, counts, quantiles):
+    if values.size == 0:
+        # No valid rows (an empty table, or every row has an unknown category)
+        return [np.empty(0) for _ in quantiles]
+    sorted_values = _sort_within_groups(values, groups, counts)
+    starts = np.concatenate(([0], np.cumsum(counts)[:-1]))
+    return [_group_quantile(sorted_values, starts, counts, q) for q in quantiles]
+
+
+def _robust_z(values, groups, counts, quantiles=()):
+    # Returns the modified z-scores plus each group's median and any extra quantiles
+    median, *extra = _group_quantiles(values, groups, counts, (0.5,) + tuple(quantiles))
+    deviation = np.abs(values - median[groups])
+    mad, = _group_quantiles(deviation, groups, counts, (0.5,))
+    with np.errstate(divide="ignore", invalid="ignore"):
+        z = MAD_SCALE * (values - median[groups]) / mad[groups]
+    # A zero MAD (over half the group identical) makes z undefined rather than infinite
+    z[mad[groups] == 0] = np.nan
+    return z, median, extra
+
+
+class AnomalyScan:
+    # Row- and cell-level anomaly statistics for a whole cost table, computed in one
+    # vectorised pass. Costs are log-normal, so the MAD and IQR tests run on log(cost);
+    # cells are gender x region x visit_type x age band.
+    def __init__(self, backend, band_width=DEFAULT_BAND_WIDTH, z_threshold=DEFAULT_Z_THRESHOLD,
+                 iqr_k=DEFAULT_IQR_K, min_cell_size=DEFAULT_MIN_CELL_SIZE):
+        self.backend = backend
+        self.band_width = band_width
+        self.z_threshold = z_threshold
+        self.labels = {
+            column: sorted(backend.categories[column], key=backend.categories[column].get)
+            for column in CATEGORY_COLUMNS
+        }
+        self.max_band = 99 // band_width
+
+        codes = [backend.codes[column].astype(np.int64) for column in CATEGORY_COLUMNS]
+        valid = np.all([code >= 0 for code in codes], axis=0)
+        self.rows = np.flatnonzero(valid)
+        band = np.minimum(backend.age[valid] // band_width, self.max_band)
+        sizes = [len(self.labels[column]) for column in CATEGORY_COLUMNS]
+        shape = tuple(sizes) + (self.max_band + 1,)
+        cell_id = np.ravel_multi_index(tuple(code[valid] for code in codes) + (band,), shape)
+        # The cell space is small, so counting beats np.unique's sort
+        all_counts = np.bincount(cell_id, minlength=int(np.prod(shape)))
+        self.cell_ids = np.flatnonzero(all_counts)
+        remap = np.zeros(all_counts.size, dtype=np.int64)
+        remap[self.cell_ids] = np.arange(self.cell_ids.size)
+        self.row_cell = remap[cell_id]
+        cell_counts = self.cell_counts = all_counts[self.cell_ids]
+        self.cell_keys = np.stack(np.unravel_index(self.cell_ids, shape), axis=1)
+
+        cost = backend.cost[valid]
+        insurance_paid = backend.insurance_paid[valid]
+        member_paid = backend.member_paid[valid]
+        log_cost = np.log(np.maximum(cost, PAID_TOLERANCE))
+
+        z, log_median, (q1, q3) = _robust_z(log_cost, self.row_cell, cell_counts, (0.25, 0.75))
+        iqr = q3 - q1
+        low, high = (q1 - iqr_k * iqr)[self.row_cell], (q3 + iqr_k * iqr)[self.row_cell]
+
+        stable = cell_counts[self.row_cell] >= min_cell_size
+        z[~stable] = np.nan
+        self.z = z
+        self.cell_median_cost = np.exp(log_median)
+        self.cell_fences = np.exp(np.stack((q1 - iqr_k * iqr, q3 + iqr_k * iqr), axis=1))
+        self.cell_fences[cell_counts < min_cell_size] = np.nan
+        self.flags = {
+            "robust_z": np.abs(np.nan_to_num(z)) > z_threshold,
+            "iqr_fence": stable & ((log_cost < low) | (log_cost > high)),
+            "paid_mismatch": np.abs(insurance_paid + member_paid - cost) > PAID_TOLERANCE + 1e-9,
+            "negative_amount": (cost < 0) | (insurance_paid < 0) | (member_paid < 0),
+        }
+        self._cohort_stats(log_median, cell_counts, min_cell_size)
+
+    def _cohort_stats(self, log_median, cell_counts, min_cell_size):
+        # Each cell's median cost against its peers: every cell with the same visit type
+        outliers = np.bincount(self.row_cell, weights=self.flags["robust_z"], minlength=len(cell_counts))
+        mismatches = np.bincount(self.row_cell, weights=self.flags["paid_mismatch"], minlength=len(cell_counts))
+        self.cell_outlier_rate = outliers / cell_counts
+        self.cell_mismatches = mismatches.astype(np.int64)
+        self.base_outlier_rate = float(self.flags["robust_z"].mean()) if self.rows.size else 0.0
+
+        stable = cell_counts >= min_cell_size
+        self.cell_z = np.full(len(cell_counts), np.nan)
+        if stable.any():
+            peers = self.cell_keys[stable, CATEGORY_COLUMNS.index("visit_type")]
+            _, peer_groups, peer_counts = np.unique(peers, return_inverse=True, return_counts=True)
+            self.cell_z[stable], _, _ = _robust_z(log_median[stable], peer_groups, peer_counts)
+        self.cell_stable = stable
+
+    def _cell_label(self, cell):
+        gender, region, visit_type, band = self.cell_keys[cell]
+        low = int(band) * self.band_width
+        age_band = f"{low}+" if band == self.max_band else f"{low}-{low + self.band_width - 1}"
+        return {
+            "gender": self.labels["gender"][gender],
+            "region": self.labels["region"][region],
+            "visit_type": self.labels["visit_type"][visit_type],
+            "age_band": age_band,
+        }
+
+    def _cohort_cells(self, cohort):
+        # Cells whose categories match the cohort and whose age band overlaps its range
+        keep = np.ones(len(self.cell_ids), dtype=bool)
+        for position, column in enumerate(CATEGORY_COLUMNS):
+            code = self.backend.categories[column].get(getattr(cohort, column))
+            if code is None:
+                return np.zeros(len(self.cell_ids), dtype=bool)
+            keep &= self.cell_keys[:, position] == code
+        band = self.cell_keys[:, 3]
+        low = band * self.band_width
+        high = np.where(band == self.max_band, np.iinfo(np.int64).max, low + self.band_width - 1)
+        return keep & (high >= cohort.age_min) & (low <= cohort.age_max)
+
+    def report(self, cohort=None, max_rows: int = 20) -> dict:
+        in_cohort = np.ones(self.rows.size, dtype=bool)
+        cells = np.ones(len(self.cell_ids), dtype=bool)
+        if cohort is not None:
+            in_cohort = self.backend.mask(cohort)[self.rows]
+            cells = self._cohort_cells(cohort)
+        flagged = in_cohort & np.any([self.flags[reason] for reason in ROW_REASONS], axis=0)
+
+        # Negative amounts first, then the most extreme robust z-scores; a paid mismatch only
+        # breaks ties, since a bad feed can make nearly every row mismatch
+        candidates = np.flatnonzero(flagged)
+        severity = (
+            np.abs(np.nan_to_num(self.z[candidates]))
+            + 0.5 * self.flags["paid_mismatch"][candidates]
+            + 1000 * self.flags["negative_amount"][candidates]
+        )
+        top = candidates[np.argsort(-severity, kind="stable")[:max_rows]]
+        backend = self.backend
+        row_flags = []
+        for i in top:
+            row = int(self.rows[i])
+            z = self.z[i]
+            row_flags.append(dict(
+                self._cell_label(self.row_cell[i]),
+                row=row,
+                age=int(backend.age[row]),
+                cost=float(backend.cost[row]),
+                insurance_paid=float(backend.insurance_paid[row]),
+                member_paid=float(backend.member_paid[row]),
+                robust_z=None if np.isnan(z) else round(float(z), 2),
+                cell_median_cost=round(float(self.cell_median_cost[self.row_cell[i]]), 2),
+                reasons=[reason for reason in ROW_REASONS if self.flags[reason][i]],
+            ))
+
+        cohort_flags = []
+        high_outlier_rate = max(3 * self.base_outlier_rate, 0.05)
+        for cell in np.flatnonzero(cells):
+            reasons = []
+            if self.cell_stable[cell] and abs(self.cell_z[cell]) > self.z_threshold:
+                reasons.append("cost_level")
+            if self.cell_stable[cell] and self.cell_outlier_rate[cell] > high_outlier_rate:
+                reasons.append("outlier_rate")
+            if self.cell_mismatches[cell]:
+                reasons.append("paid_mismatch")
+            if reasons:
+                cohort_flags.append(dict(
+                    self._cell_label(cell),
+                    rows=int(self.cell_counts[cell]),
+                    median_cost=round(float(self.cell_median_cost[cell]), 2),
+                    robust_z=None if np.isnan(self.cell_z[cell]) else round(float(self.cell_z[cell]), 2),
+                    cost_fences=[round(float(value), 2) for value in self.cell_fences[cell]],
+                    outlier_rate=round(float(self.cell_outlier_rate[cell]), 4),
+                    paid_mismatches=int(self.cell_mismatches[cell]),
+                    reasons=reasons,
+                ))
+
+        # Distribution-level findings ahead of cells flagged only for paid mismatches
+        cohort_flags.sort(key=lambda flag: (
+            flag["reasons"] == ["paid_mismatch"], -abs(flag["robust_z"] or 0), -flag["outlier_rate"]
+        ))
+        return {
+            "rows_scanned": int(in_cohort.sum()),
+            "cells": int(cells.sum()),
+            "flag_counts": {reason: int((self.flags[reason] & in_cohort).sum()) for reason in ROW_REASONS},
+            "row_flags": row_flags,
+            "cohort_flags": cohort_flags,
+        }
+
+
+_scans = weakref.WeakKeyDictionary()
+_scans_lock = threading.Lock()
+
+
+def scan(backend, **params) -> AnomalyScan:
+    # One scan per backend and loaded data; a reload swaps the arrays and so the cache key
+    key = (backend.loaded_version, id(backend.cost), tuple(sorted(params.items())))
+    with _scans_lock:
+        cached = _scans.get(backend)
+        if cached is not None and cached[0] == key:
+            return cached[1]
+    result = AnomalyScan(backend, **params)
+    with _scans_lock:
+        _scans[backend] = (key, result)
+    return result
+
+
+def summarize(report: dict, limit: int = 5) -> dict:
+    # Compact enough to put in a prompt: counts plus the few worst cells and rows
+    return {
+        "rows_scanned": report["rows_scanned"],
+        "flag_counts": report["flag_counts"],
+        "cohort_flags": [
+            {key: flag[key] for key in ("gender", "region", "visit_type", "age_band", "median_cost", "reasons")}
+            for flag in report["cohort_flags"][:limit]
+        ],
+        "row_flags": [
+            {key: flag[key] for key in ("age", "cost", "cell_median_cost", "robust_z", "reasons")}
+            for flag in report["row_flags"][:limit]
+        ],
+    }
@@ -1 +1 @@
-from .agent import run_benefits_interpreter
+from .agent import run_benefits_interpreter, arun_benefits_interpreter, astream_benefits_interpreter
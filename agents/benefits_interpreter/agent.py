@@ -1,19 +1,17 @@
-import os
-import openai
-from dotenv import load_dotenv
+from agents.common.llm_client import get_client
 
-load_dotenv()
-openai.api_key = os.getenv("OPENAI_API_KEY")
 
-def run_benefits_interpreter(inputs):
-    avg = inputs.get("avg_cost", 0)
-    median = inputs.get("median_cost", 0)
-    min_cost = inputs.get("min_cost", 0)
-    max_cost = inputs.get("max_cost", 0)
+def _kpis(inputs):
+    return (
+        inputs.get("avg_cost", 0),
+        inputs.get("median_cost", 0),
+        inputs.get("min_cost", 0),
+        inputs.get("max_cost", 0),
+    )
 
-    if avg == 0 or max_cost == 0:
-        return {"benefit_summary": "⚠️ Not enough KPI data to generate a summary."}
 
+def build_messages(inputs):
+    avg, median, min_cost, max_cost = _kpis(inputs)
     prompt = f"""
 You are a healthcare benefits specialist. Your role is to interpret cost KPIs from a policy and plan design perspective.
 Explain what the following numbers could mean in terms of member coverage, plan utilization, access, and affordability:
@@ -28,15 +26,55 @@ Focus on:
 2. Whether these numbers suggest equitable or skewed access.
 3. How this could guide benefit redesign or communication strategy.
 """
+    return [
+        {"role": "system", "content": "You are a healthcare benefits interpretation expert."},
+        {"role": "user", "content": prompt}
+    ]
+
+
+def _insufficient(inputs):
+    avg, _, _, max_cost = _kpis(inputs)
+    if avg == 0 or max_cost == 0:
+        return {"benefit_summary": "⚠️ Not enough KPI data to generate a summary."}
+    return None
+
+
+def run_benefits_interpreter(inputs):
+    fallback = _insufficient(inputs)
+    if fallback:
+        return fallback
+
+    summary = get_client().chat(build_messages(inputs), model="gpt-4")
+    return {"benefit_summary": summary.strip()}
+
+
+async def arun_benefits_interpreter(inputs):
+    fallback = _insufficient(inputs)
+    if fallback:
+        return fallback
+
+    summary = await get_client().achat(build_messages(inputs), model="gpt-4")
+    return {"benefit_summary": summary.strip()}
+
+
+async def astream_benefits_interpreter(inputs):
+    # Yields growing partial results; the last one equals run_benefits_interpreter's output
+    fallback = _insufficient(inputs)
+    if fallback:
+        yield fallback
+        return
+
+    summary = ""
+    async for delta in get_client().astream(build_messages(inputs), model="gpt-4"):
+        summary += delta
+        yield {"benefit_summary": summary}
+    yield {"benefit_summary": summary.strip()}
 
-    response = openai.ChatCompletion.create(
-        model="gpt-4",
-        messages=[
-            {"role": "system", "content": "You are a healthcare benefits interpretation expert."},
-            {"role": "user", "content": prompt}
-        ]
-    )
 
-    summary = response.choices[0].message.content.strip()
-    return {"benefit_summary": summary}
+def run(estimate_cost=None, **inputs):
+    # task.yaml entry point: interprets the KPIs produced by the estimate_cost step
+    from agents.narrative_fusion.agent import fused_enabled, fused_step
 
+    if fused_enabled():
+        return fused_step("interpret_benefits", estimate_cost or {})
+    return run_benefits_interpreter(estimate_cost or {})
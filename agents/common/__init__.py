@@ -0,0 +1,2 @@
+from .llm_client import LLMClient, LLMResult, get_client, set_client
+from .llm_cache import LLMCache
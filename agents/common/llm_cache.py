@@ -0,0 +1,127 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+
+from agents.common.lru import LRUCache
+
+DEFAULT_TTL = float(os.getenv("DATASAGE_LLM_CACHE_TTL", str(24 * 3600)))
+DEFAULT_MAX_ENTRIES = int(os.getenv("DATASAGE_LLM_CACHE_SIZE", "2048"))
+
+
+def cache_key(model: str, messages: list, params: dict) -> str:
+    # Content address: identical model, messages and sampling params share an entry
+    payload = json.dumps(
+        {"model": model, "messages": messages, "params": params},
+        sort_keys=True,
+        separators=(",", ":"),
+        ensure_ascii=False,
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class SQLiteTier:
+    def __init__(self, path: str):
+        self.path = path
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS llm_cache ("
+            " key TEXT PRIMARY KEY, value TEXT NOT NULL, expires_at REAL)"
+        )
+        self._conn.commit()
+
+    def get(self, key: str):
+        entry = self.entry(key)
+        return None if entry is None else entry[0]
+
+    def entry(self, key: str):
+        # (value, expires_at) with expires_at in time.time() seconds, or None on a miss
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT value, expires_at FROM llm_cache WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                return None
+            value, expires_at = row
+            if expires_at is not None and expires_at <= time.time():
+                self._conn.execute("DELETE FROM llm_cache WHERE key = ?", (key,))
+                self._conn.commit()
+                return None
+        return json.loads(value), expires_at
+
+    def put(self, key: str, value: dict, ttl: float = None):
+        expires_at = time.time() + ttl if ttl else None
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO llm_cache (key, value, expires_at) VALUES (?, ?, ?)",
+                (key, json.dumps(value), expires_at),
+            )
+            self._conn.commit()
+
+    def purge_expired(self) -> int:
+        with self._lock:
+            cursor = self._conn.execute(
+                "DELETE FROM llm_cache WHERE expires_at IS NOT NULL AND expires_at <= ?",
+                (time.time(),),
+            )
+            self._conn.commit()
+            return cursor.rowcount
+
+    def clear(self):
+        with self._lock:
+            self._conn.execute("DELETE FROM llm_cache")
+            self._conn.commit()
+
+
+class LLMCache:
+    # In-memory LRU in front of an optional on-disk SQLite tier
+    def __init__(self, max_entries: int = DEFAULT_MAX_ENTRIES, ttl: float = DEFAULT_TTL,
+                 path: str = None):
+        self.ttl = ttl
+        self.memory = LRUCache(max_entries=max_entries, ttl=ttl)
+        self.disk = SQLiteTier(path) if path else None
+        self.disk_hits = 0
+
+    def get(self, key: str):
+        value = self.memory.get(key)
+        if value is not None or self.disk is None:
+            return value
+        entry = self.disk.entry(key)
+        if entry is None:
+            return None
+        value, expires_at = entry
+        self.disk_hits += 1
+        # Promoted with what is left of the stored TTL, not a fresh one (0 means no expiry)
+        self.memory.put(key, value, ttl=0 if expires_at is None else max(expires_at - time.time(), 1e-6))
+        return value
+
+    def put(self, key: str, value: dict):
+        self.memory.put(key, value)
+        if self.disk is not None:
+            self.disk.put(key, value, self.ttl)
+
+    def clear(self):
+        self.memory.clear()
+        if self.disk is not None:
+            self.disk.clear()
+
+    def stats(self) -> dict:
+        stats = self.memory.stats()
+        # A memory miss served from disk is still a cache hit overall
+        stats["disk_hits"] = self.disk_hits
+        stats["hits"] += self.disk_hits
+        stats["misses"] -= self.disk_hits
+        lookups = stats["hits"] + stats["misses"]
+        stats["hit_rate"] = stats["hits"] / lookups if lookups else 0.0
+        return stats
+
+
+def cache_from_env():
+    if os.getenv("DATASAGE_LLM_CACHE", "on").lower() in ("0", "off", "false", "no"):
+        return None
+    return LLMCache(path=os.getenv("DATASAGE_LLM_CACHE_PATH") or None)
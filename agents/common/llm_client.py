@@ -0,0 +1,360 @@
+import asyncio
+import atexit
+import os
+import threading
+from dataclasses import asdict, dataclass
+
+from agents.common.env import load_env
+from agents.common.llm_cache import cache_from_env, cache_key
+from agents.common.llm_scheduler import estimate_tokens, is_retryable, scheduler_from_env
+from config.tracing import span
+
+# openai and aiohttp are imported on first use; they dominate agent import time
+load_env()
+
+DEFAULT_MODEL = "gpt-4"
+DEFAULT_TIMEOUT = float(os.getenv("DATASAGE_LLM_TIMEOUT", "60"))
+DEFAULT_MAX_CONNECTIONS = int(os.getenv("DATASAGE_LLM_MAX_CONNECTIONS", "64"))
+
+
+class LLMError(Exception):
+    pass
+
+
+class LLMTimeoutError(LLMError):
+    pass
+
+
+def _retryable(exc) -> bool:
+    return isinstance(exc, LLMTimeoutError) or is_retryable(exc)
+
+
+@dataclass
+class LLMResult:
+    text: str
+    model: str
+    prompt_tokens: int = 0
+    completion_tokens: int = 0
+    cached: bool = False
+
+
+class OpenAIBackend:
+    name = "openai"
+
+    def __init__(self, api_key: str = None, api_base: str = None):
+        self.api_key = api_key or os.getenv("OPENAI_API_KEY")
+        self.api_base = api_base or os.getenv("OPENAI_API_BASE")
+
+    async def acomplete(self, session, model, messages, timeout, **params) -> LLMResult:
+        import openai
+
+        # openai reads the pooled session from a context variable for the current task
+        openai.aiosession.set(session)
+        extra = {"api_base": self.api_base} if self.api_base else {}
+        response = await openai.ChatCompletion.acreate(
+            model=model,
+            messages=messages,
+            api_key=self.api_key,
+            request_timeout=timeout,
+            **extra,
+            **params
+        )
+        usage = response.get("usage", {})
+        return LLMResult(
+            text=response["choices"][0]["message"]["content"],
+            model=model,
+            prompt_tokens=usage.get("prompt_tokens", 0),
+            completion_tokens=usage.get("completion_tokens", 0),
+        )
+
+    async def astream(self, session, model, messages, timeout, **params):
+        import openai
+
+        openai.aiosession.set(session)
+        extra = {"api_base": self.api_base} if self.api_base else {}
+        response = await openai.ChatCompletion.acreate(
+            model=model,
+            messages=messages,
+            api_key=self.api_key,
+            request_timeout=timeout,
+            stream=True,
+            **extra,
+            **params
+        )
+        async for chunk in response:
+            delta = chunk["choices"][0].get("delta", {}).get("content")
+            if delta:
+                yield delta
+
+
+class StubBackend:
+    # Deterministic offline backend for tests and local development
+    name = "stub"
+
+    def __init__(self, latency: float = 0.0, reply: str = None):
+        self.latency = latency
+        self.reply = reply
+        self.calls = 0
+
+    def _reply(self, model, messages):
+        if self.reply is not None:
+            return self.reply
+        prompt = messages[-1]["content"]
+        first_line = next((line.strip() for line in prompt.splitlines() if line.strip()), "")
+        return f"[stub:{model}] {first_line}"
+
+    async def acomplete(self, session, model, messages, timeout, **params) -> LLMResult:
+        self.calls += 1
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        text = self._reply(model, messages)
+        return LLMResult(
+            text=text,
+            model=model,
+            prompt_tokens=sum(len(m["content"].split()) for m in messages),
+            completion_tokens=len(text.split()),
+        )
+
+    async def astream(self, session, model, messages, timeout, **params):
+        # Word-sized chunks, with the configured latency spread across the stream
+        self.calls += 1
+        words = self._reply(model, messages).split(" ")
+        for i, word in enumerate(words):
+            if self.latency:
+                await asyncio.sleep(self.latency / len(words))
+            yield word if i == 0 else " " + word
+
+
+BACKENDS = {
+    "openai": OpenAIBackend,
+    "stub": StubBackend,
+}
+
+
+_FROM_ENV = object()
+
+
+class LLMClient:
+    def __init__(self, backend=None, timeout: float = DEFAULT_TIMEOUT,
+                 max_connections: int = DEFAULT_MAX_CONNECTIONS, cache=_FROM_ENV, scheduler=_FROM_ENV):
+        if backend is None:
+            backend = BACKENDS[os.getenv("DATASAGE_LLM_BACKEND", "openai")]()
+        self.backend = backend
+        # Pass cache=None to disable response caching for this client
+        self.cache = cache_from_env() if cache is _FROM_ENV else cache
+        self.timeout = timeout
+        self.max_connections = max_connections
+        # Pass scheduler=None to send calls straight to the backend, with no limits or retries
+        self.scheduler = scheduler_from_env(max_connections) if scheduler is _FROM_ENV else scheduler
+        # Every call runs on the client's own background loop, so one aiohttp session and
+        # connection pool serve sync callers and every asyncio.run caller alike
+        self._http = None
+        self._loop = None
+        self._thread = None
+        self._loop_lock = threading.Lock()
+
+    def _session(self):
+        if self._http is None or self._http.closed:
+            import aiohttp
+
+            connector = aiohttp.TCPConnector(limit=self.max_connections)
+            self._http = aiohttp.ClientSession(connector=connector)
+        return self._http
+
+    async def _on_loop(self, coro):
+        loop = self._background_loop()
+        if asyncio.get_running_loop() is loop:
+            return await coro
+        # The caller's context (tracing span, LLM lane) is copied into the task
+        return await asyncio.wrap_future(asyncio.run_coroutine_threadsafe(coro, loop))
+
+    async def acomplete(self, messages: list, model: str = DEFAULT_MODEL, timeout: float = None,
+                        use_cache: bool = True, priority: str = None, **params) -> LLMResult:
+        return await self._on_loop(self._acomplete(messages, model, timeout, use_cache, priority, **params))
+
+    async def _acomplete(self, messages: list, model: str, timeout: float, use_cache: bool, priority: str,
+                         **params) -> LLMResult:
+        with span("llm_call", model=model, backend=self.backend.name, retries=0) as call:
+            key = None
+            if use_cache and self.cache is not None:
+                key = cache_key(model, messages, params)
+                hit = self.cache.get(key)
+                if hit is not None:
+                    result = LLMResult(**dict(hit, cached=True))
+                    call.set(cache="hit", prompt_tokens=result.prompt_tokens,
+                             completion_tokens=result.completion_tokens)
+                    return result
+
+            timeout = timeout or self.timeout
+            attempts = 0
+
+            async def attempt():
+                nonlocal attempts
+                attempts += 1
+                try:
+                    return await asyncio.wait_for(
+                        self.backend.acomplete(self._session(), model, messages, timeout, **params),
+                        timeout,
+                    )
+                except asyncio.TimeoutError as exc:
+                    raise LLMTimeoutError(f"{model} call exceeded {timeout}s") from exc
+
+            try:
+                if self.scheduler is None:
+                    result = await attempt()
+                else:
+                    result = await self.scheduler.run(
+                        attempt, estimate_tokens(messages, params), priority, retryable=_retryable,
+                        usage=lambda r: r.prompt_tokens + r.completion_tokens,
+                    )
+            finally:
+                call.set(retries=max(attempts - 1, 0))
+
+            call.set(cache="miss" if key is not None else "bypass", prompt_tokens=result.prompt_tokens,
+                     completion_tokens=result.completion_tokens)
+            if key is not None:
+                self.cache.put(key, asdict(result))
+            return result
+
+    async def astream(self, messages: list, model: str = DEFAULT_MODEL, timeout: float = None,
+                      use_cache: bool = True, priority: str = None, **params):
+        # Yields text deltas as they arrive; a cached reply arrives as a single delta
+        stream = self._astream(messages, model, timeout, use_cache, priority, **params)
+        loop = self._background_loop()
+        if asyncio.get_running_loop() is loop:
+            async for delta in stream:
+                yield delta
+            return
+        try:
+            while True:
+                delta = await asyncio.wrap_future(asyncio.run_coroutine_threadsafe(_anext(stream), loop))
+                if delta is None:
+                    return
+                yield delta
+        finally:
+            await asyncio.wrap_future(asyncio.run_coroutine_threadsafe(stream.aclose(), loop))
+
+    async def _astream(self, messages: list, model: str, timeout: float, use_cache: bool, priority: str,
+                       **params):
+        key = None
+        if use_cache and self.cache is not None:
+            key = cache_key(model, messages, params)
+            hit = self.cache.get(key)
+            if hit is not None:
+                yield hit["text"]
+                return
+
+        timeout = timeout or self.timeout
+
+        async def next_delta(stream):
+            try:
+                # The timeout applies between chunks, so long answers are not cut off
+                return await asyncio.wait_for(stream.__anext__(), timeout)
+            except StopAsyncIteration:
+                return None
+            except asyncio.TimeoutError as exc:
+                raise LLMTimeoutError(f"{model} stream stalled for {timeout}s") from exc
+
+        async def open_stream():
+            stream = self.backend.astream(self._session(), model, messages, timeout, **params).__aiter__()
+            return stream, await next_delta(stream)
+
+        # Only opening the stream is retried; once text has been yielded it cannot be taken back.
+        # The scheduler slot is held until the stream ends.
+        ticket = None
+        if self.scheduler is None:
+            stream, delta = await open_stream()
+        else:
+            (stream, delta), ticket = await self.scheduler.run(
+                open_stream, estimate_tokens(messages, params), priority, retryable=_retryable, hold=True
+            )
+        chunks = []
+        outcome = "failed"
+        try:
+            while delta is not None:
+                chunks.append(delta)
+                yield delta
+                delta = await next_delta(stream)
+            outcome = "ok"
+        finally:
+            if ticket is not None:
+                self.scheduler.release(ticket, outcome=outcome)
+
+        if key is not None:
+            self.cache.put(key, asdict(LLMResult(text="".join(chunks), model=model)))
+
+    async def achat(self, messages: list, model: str = DEFAULT_MODEL, **params) -> str:
+        result = await self.acomplete(messages, model=model, **params)
+        return result.text
+
+    def _background_loop(self) -> asyncio.AbstractEventLoop:
+        with self._loop_lock:
+            if self._loop is None:
+                self._loop = asyncio.new_event_loop()
+                self._thread = threading.Thread(target=self._loop.run_forever,
+                                                name="llm-client-loop", daemon=True)
+                self._thread.start()
+                atexit.register(self.close)
+            return self._loop
+
+    def run_sync(self, coro):
+        return asyncio.run_coroutine_threadsafe(coro, self._background_loop()).result()
+
+    def complete(self, messages: list, model: str = DEFAULT_MODEL, **params) -> LLMResult:
+        return self.run_sync(self.acomplete(messages, model=model, **params))
+
+    def chat(self, messages: list, model: str = DEFAULT_MODEL, **params) -> str:
+        return self.complete(messages, model=model, **params).text
+
+    async def _close_session(self):
+        session, self._http = self._http, None
+        if session is not None:
+            await session.close()
+
+    async def aclose(self):
+        # Closes the pooled session; the next call opens a new one
+        if self._loop is not None:
+            await self._on_loop(self._close_session())
+
+    def close(self):
+        # Closes the session and stops the background loop (also run at interpreter exit)
+        with self._loop_lock:
+            loop, thread = self._loop, self._thread
+            self._loop = self._thread = None
+        if loop is None:
+            return
+        atexit.unregister(self.close)
+        if loop.is_running():
+            asyncio.run_coroutine_threadsafe(self._close_session(), loop).result(timeout=5)
+            loop.call_soon_threadsafe(loop.stop)
+            thread.join(timeout=5)
+        loop.close()
+
+
+async def _anext(stream):
+    # A coroutine for run_coroutine_threadsafe; None marks the end of the stream
+    try:
+        return await stream.__anext__()
+    except StopAsyncIteration:
+        return None
+
+
+_client = None
+_client_lock = threading.Lock()
+
+
+def get_client() -> LLMClient:
+    global _client
+    with _client_lock:
+        if _client is None:
+            _client = LLMClient()
+        return _client
+
+
+def set_client(client: LLMClient):
+    # The replaced client is closed; pass None to go back to a client built from the environment
+    global _client
+    with _client_lock:
+        previous, _client = _client, client
+    if previous is not None and previous is not client:
+        previous.close()
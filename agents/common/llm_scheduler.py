@@ -0,0 +1,302 @@
+import asyncio
+import contextlib
+import contextvars
+import email.utils
+import heapq
+import itertools
+import os
+import threading
+import time
+from collections import deque
+
+from tenacity import AsyncRetrying, retry_if_exception, stop_after_attempt, wait_random_exponential
+
+# Interactive (dashboard) calls are always dispatched before queued batch calls
+LANES = ("interactive", "batch")
+DEFAULT_LANE = "interactive"
+LANE = contextvars.ContextVar("datasage_llm_lane", default=None)
+
+RETRYABLE_STATUS = frozenset({408, 409, 429, 500, 502, 503, 504})
+# openai 0.28 network failures carry no HTTP status
+RETRYABLE_ERRORS = frozenset({"APIConnectionError", "Timeout", "ServiceUnavailableError", "TryAgain"})
+THROUGHPUT_WINDOW = 60.0
+
+
+def current_lane() -> str:
+    return LANE.get() or DEFAULT_LANE
+
+
+@contextlib.contextmanager
+def llm_priority(lane: str):
+    if lane not in LANES:
+        raise ValueError(f"Unknown LLM lane '{lane}', expected one of {LANES}")
+    token = LANE.set(lane)
+    try:
+        yield
+    finally:
+        LANE.reset(token)
+
+
+def is_retryable(exc: BaseException) -> bool:
+    if isinstance(exc, TimeoutError):
+        return True
+    status = getattr(exc, "http_status", None) or getattr(exc, "status", None)
+    return status in RETRYABLE_STATUS or type(exc).__name__ in RETRYABLE_ERRORS
+
+
+def retry_after_seconds(exc: BaseException):
+    headers = getattr(exc, "headers", None) or {}
+    value = headers.get("Retry-After") or headers.get("retry-after")
+    if value is None:
+        return None
+    try:
+        return max(float(value), 0.0)
+    except ValueError:
+        pass
+    try:
+        return max(email.utils.parsedate_to_datetime(value).timestamp() - time.time(), 0.0)
+    except (TypeError, ValueError):
+        return None
+
+
+def estimate_tokens(messages: list, params: dict, completion_tokens: int = 256) -> int:
+    # ~4 characters per token; refined with the reported usage once the call returns
+    prompt = sum(len(str(m.get("content") or "")) for m in messages) // 4
+    return prompt + int(params.get("max_tokens") or completion_tokens)
+
+
+class TokenBucket:
+    # per_minute units, refilled continuously, with a one-minute burst; 0 disables the limit.
+    # The level may go negative when a call turns out to cost more than estimated.
+    def __init__(self, per_minute: float, clock=time.monotonic):
+        self.capacity = float(per_minute)
+        self.rate = self.capacity / 60.0
+        self.level = self.capacity
+        self.clock = clock
+        self.updated = clock()
+
+    def _refill(self):
+        now = self.clock()
+        self.level = min(self.capacity, self.level + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def delay(self, amount: float) -> float:
+        if not self.rate:
+            return 0.0
+        self._refill()
+        # A single call larger than the whole bucket only waits for a full bucket
+        return max(min(amount, self.capacity) - self.level, 0.0) / self.rate
+
+    def take(self, amount: float):
+        if self.rate:
+            self._refill()
+            self.level -= amount
+
+
+class _Ticket:
+    __slots__ = ("loop", "future", "tokens", "lane", "enqueued_at", "granted_at", "granted", "cancelled")
+
+    def __init__(self, loop, tokens, lane, now):
+        self.loop = loop
+        self.future = loop.create_future()
+        self.tokens = tokens
+        self.lane = lane
+        self.enqueued_at = now
+        self.granted_at = None
+        self.granted = False
+        self.cancelled = False
+
+
+def _resolve(future):
+    if not future.done():
+        future.set_result(None)
+
+
+class LLMScheduler:
+    # Admission control for LLM calls: requests- and tokens-per-minute buckets, an AIMD
+    # concurrency limit (additive increase per success, halved on 429s and timeouts) and
+    # priority lanes. State is guarded by a thread lock and waiters are woken on their own
+    # event loop, so one scheduler serves the sync client loop and every asyncio.run caller.
+    def __init__(self, requests_per_minute: float = 0, tokens_per_minute: float = 0,
+                 max_concurrency: int = 64, min_concurrency: int = 1, initial_concurrency: int = None,
+                 max_attempts: int = 4, backoff: float = 0.2, max_backoff: float = 30.0,
+                 clock=time.monotonic):
+        self.requests = TokenBucket(requests_per_minute, clock)
+        self.tokens = TokenBucket(tokens_per_minute, clock)
+        self.max_concurrency = max_concurrency
+        self.min_concurrency = min_concurrency
+        self.limit = float(initial_concurrency or max_concurrency)
+        self.max_attempts = max_attempts
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.clock = clock
+        self.in_flight = 0
+        self.counters = {"granted": 0, "completed": 0, "throttled": 0, "failed": 0, "retries": 0}
+        self._queue = []
+        self._seq = itertools.count()
+        self._lock = threading.Lock()
+        self._paused_until = 0.0
+        self._last_decrease = float("-inf")
+        self._wakeup_at = None
+        self._waited = 0.0
+        self._window = deque()
+
+    async def acquire(self, tokens: int = 0, lane: str = None) -> _Ticket:
+        lane = lane or current_lane()
+        ticket = _Ticket(asyncio.get_running_loop(), tokens, lane, self.clock())
+        with self._lock:
+            heapq.heappush(self._queue, (LANES.index(lane), next(self._seq), ticket))
+        self._dispatch()
+        try:
+            await ticket.future
+        except asyncio.CancelledError:
+            with self._lock:
+                granted = ticket.granted
+                ticket.cancelled = True
+            if granted:
+                self.release(ticket, outcome="cancelled")
+            raise
+        return ticket
+
+    def release(self, ticket: _Ticket, tokens_used: int = None, outcome: str = "ok"):
+        # outcome: "ok", "throttled" (429/5xx/timeout: the provider is overloaded),
+        # "failed" (any other error) or "cancelled"
+        with self._lock:
+            self.in_flight -= 1
+            now = self.clock()
+            if tokens_used:
+                self.tokens.take(tokens_used - ticket.tokens)
+            if outcome == "ok":
+                self.limit = min(self.limit + 1.0 / self.limit, float(self.max_concurrency))
+                self.counters["completed"] += 1
+                self._window.append((now, tokens_used or ticket.tokens))
+            elif outcome == "throttled":
+                self.counters["throttled"] += 1
+                # Calls admitted before the last cut saw the same overload; cut once per wave
+                if ticket.granted_at >= self._last_decrease:
+                    self.limit = max(self.limit / 2, float(self.min_concurrency))
+                    self._last_decrease = now
+            elif outcome == "failed":
+                self.counters["failed"] += 1
+        self._dispatch()
+
+    def pause(self, seconds: float):
+        # Honours a Retry-After: nothing is dispatched until it has passed
+        with self._lock:
+            self._paused_until = max(self._paused_until, self.clock() + seconds)
+        self._dispatch()
+
+    def _dispatch(self):
+        with self._lock:
+            while self._queue:
+                ticket = self._queue[0][2]
+                if ticket.cancelled:
+                    heapq.heappop(self._queue)
+                    continue
+                if self.in_flight >= max(int(self.limit), self.min_concurrency):
+                    return
+                now = self.clock()
+                delay = max(self._paused_until - now, self.requests.delay(1), self.tokens.delay(ticket.tokens))
+                if delay > 0:
+                    self._schedule_wakeup(now, delay)
+                    return
+                heapq.heappop(self._queue)
+                try:
+                    ticket.loop.call_soon_threadsafe(_resolve, ticket.future)
+                except RuntimeError:
+                    # The waiter's event loop has already closed
+                    ticket.cancelled = True
+                    continue
+                self.requests.take(1)
+                self.tokens.take(ticket.tokens)
+                self.in_flight += 1
+                ticket.granted = True
+                ticket.granted_at = now
+                self.counters["granted"] += 1
+                self._waited += now - ticket.enqueued_at
+
+    def _schedule_wakeup(self, now, delay):
+        # Rate-limited waiters are not tied to one event loop, so a timer thread wakes them
+        at = now + delay
+        if self._wakeup_at is not None and self._wakeup_at <= at:
+            return
+        self._wakeup_at = at
+        timer = threading.Timer(delay, self._wakeup)
+        timer.daemon = True
+        timer.start()
+
+    def _wakeup(self):
+        with self._lock:
+            self._wakeup_at = None
+        self._dispatch()
+
+    def _wait(self, retry_state) -> float:
+        # Full-jitter exponential backoff, never shorter than the server's Retry-After
+        backoff = wait_random_exponential(multiplier=self.backoff, max=self.max_backoff)(retry_state)
+        return max(backoff, retry_after_seconds(retry_state.outcome.exception()) or 0.0)
+
+    def _before_sleep(self, retry_state):
+        with self._lock:
+            self.counters["retries"] += 1
+
+    async def run(self, call, tokens: int = 0, lane: str = None, retryable=is_retryable, usage=None,
+                  hold: bool = False):
+        # Runs `await call()` under admission control, retrying retryable failures with
+        # backoff. usage(result) reports the tokens actually spent. With hold=True the
+        # slot stays taken and (result, ticket) is returned for the caller to release.
+        retrying = AsyncRetrying(
+            stop=stop_after_attempt(self.max_attempts),
+            wait=self._wait,
+            retry=retry_if_exception(retryable),
+            before_sleep=self._before_sleep,
+            reraise=True,
+        )
+        async for attempt in retrying:
+            with attempt:
+                ticket = await self.acquire(tokens, lane)
+                try:
+                    result = await call()
+                except BaseException as exc:
+                    if not isinstance(exc, Exception):
+                        self.release(ticket, outcome="cancelled")
+                        raise
+                    throttled = retryable(exc)
+                    retry_after = retry_after_seconds(exc) if throttled else None
+                    if retry_after:
+                        self.pause(retry_after)
+                    self.release(ticket, outcome="throttled" if throttled else "failed")
+                    raise
+                if not hold:
+                    self.release(ticket, usage(result) if usage else None)
+        return (result, ticket) if hold else result
+
+    def stats(self) -> dict:
+        with self._lock:
+            now = self.clock()
+            while self._window and self._window[0][0] < now - THROUGHPUT_WINDOW:
+                self._window.popleft()
+            depth = {lane: 0 for lane in LANES}
+            for _, _, ticket in self._queue:
+                if not ticket.cancelled:
+                    depth[ticket.lane] += 1
+            granted = self.counters["granted"]
+            return {
+                "queue_depth": depth,
+                "queued": sum(depth.values()),
+                "in_flight": self.in_flight,
+                "concurrency_limit": round(self.limit, 2),
+                "requests_last_minute": len(self._window),
+                "tokens_last_minute": int(sum(tokens for _, tokens in self._window)),
+                "avg_wait_seconds": self._waited / granted if granted else 0.0,
+                **self.counters,
+            }
+
+
+def scheduler_from_env(max_concurrency: int = 64) -> LLMScheduler:
+    # DATASAGE_LLM_RPM / DATASAGE_LLM_TPM should match the account's rate limits (0 = none)
+    return LLMScheduler(
+        requests_per_minute=float(os.getenv("DATASAGE_LLM_RPM", "0")),
+        tokens_per_minute=float(os.getenv("DATASAGE_LLM_TPM", "0")),
+        max_concurrency=int(os.getenv("DATASAGE_LLM_MAX_CONCURRENCY", str(max_concurrency))),
+        max_attempts=int(os.getenv("DATASAGE_LLM_MAX_ATTEMPTS", "4")),
+    )
@@ -1,2 +1 @@
-from .agent import run_cost_estimator
-
+from .agent import run_cost_estimator, run_cost_estimator_batch, run_cost_percentiles
@@ -0,0 +1,173 @@
+import json
+import math
+import os
+
+import numpy as np
+
+from agents.cost_estimator.cohorts import EMPTY_KPIS
+
+CATEGORY_COLUMNS = ("gender", "region", "visit_type")
+PREFIX_ARRAYS = ("count", "cost_sum", "cost_sumsq", "insurance_sum", "member_sum")
+TABLE_ARRAYS = ("cost_min", "cost_max")
+
+
+def valid_rows(backend):
+    # Rows with a known category in every column; a missing label is code -1 and belongs to
+    # no cell. A slice when nothing is missing, so the common case indexes without a copy.
+    valid = np.all([backend.codes[column] >= 0 for column in CATEGORY_COLUMNS], axis=0)
+    return slice(None) if valid.all() else valid
+
+
+def cell_layout(backend):
+    # Flat (combo * ages + age) cell id per valid row of a LocalBackend (see valid_rows),
+    # combos ordered gender-major, then region, then visit_type
+    categories = {
+        column: sorted(backend.categories[column], key=backend.categories[column].get)
+        for column in CATEGORY_COLUMNS
+    }
+    n_regions = len(categories["region"])
+    n_visits = len(categories["visit_type"])
+    n_combos = len(categories["gender"]) * n_regions * n_visits
+    n_ages = int(backend.age.max()) + 1 if backend.size else 1
+
+    rows = valid_rows(backend)
+    combo = (
+        backend.codes["gender"][rows].astype(np.int64) * n_regions * n_visits
+        + backend.codes["region"][rows].astype(np.int64) * n_visits
+        + backend.codes["visit_type"][rows].astype(np.int64)
+    )
+    return categories, combo * n_ages + backend.age[rows], rows, n_combos, n_ages
+
+
+class AgePrefixIndex:
+    # Cumulative-over-age aggregates per (gender, region, visit_type) combination.
+    # Prefix arrays have shape (combos, ages + 1); range min/max use sparse tables
+    # of shape (levels, combos, ages), so any age range costs O(1) lookups.
+    def __init__(self, categories: dict, arrays: dict, data_version=None):
+        self.categories = categories
+        self.arrays = arrays
+        self.data_version = data_version
+        self._codes = {
+            column: {value: code for code, value in enumerate(values)}
+            for column, values in categories.items()
+        }
+        self.n_ages = arrays["count"].shape[1] - 1
+
+    @classmethod
+    def build(cls, backend, data_version=None):
+        categories, cell, rows, n_combos, n_ages = cell_layout(backend)
+        n_cells = n_combos * n_ages
+        cost = backend.cost[rows]
+
+        def per_cell(weights=None):
+            return np.bincount(cell, weights=weights, minlength=n_cells).reshape(n_combos, n_ages)
+
+        cost_min = np.full(n_cells, np.inf)
+        cost_max = np.full(n_cells, -np.inf)
+        np.minimum.at(cost_min, cell, cost)
+        np.maximum.at(cost_max, cell, cost)
+        cells = {
+            "count": per_cell(),
+            "cost_sum": per_cell(cost),
+            "cost_sumsq": per_cell(cost * cost),
+            "insurance_sum": per_cell(backend.insurance_paid[rows]),
+            "member_sum": per_cell(backend.member_paid[rows]),
+            "cost_min": cost_min.reshape(n_combos, n_ages),
+            "cost_max": cost_max.reshape(n_combos, n_ages),
+        }
+        return cls.from_cells(categories, cells, data_version)
+
+    @classmethod
+    def from_cells(cls, categories: dict, cells: dict, data_version=None):
+        # cells holds per-(combo, age) aggregates of shape (combos, ages); empty cells
+        # carry zero sums and +/-inf extremes
+        n_combos = cells["count"].shape[0]
+
+        def prefix(values):
+            return np.concatenate(
+                (np.zeros((n_combos, 1)), np.cumsum(values, axis=1, dtype=np.float64)), axis=1
+            )
+
+        arrays = {name: prefix(cells[name]) for name in PREFIX_ARRAYS}
+        arrays["cost_min"] = cls._sparse_table(cells["cost_min"], np.minimum, np.inf)
+        arrays["cost_max"] = cls._sparse_table(cells["cost_max"], np.maximum, -np.inf)
+        return cls(categories, arrays, data_version)
+
+    @staticmethod
+    def _sparse_table(values, reduce, fill):
+        n_ages = values.shape[1]
+        levels = int(math.log2(n_ages)) + 1
+        table = np.full((levels,) + values.shape, fill)
+        table[0] = values
+        for level in range(1, levels):
+            span = 1 << (level - 1)
+            width = n_ages - (1 << level) + 1
+            table[level, :, :width] = reduce(table[level - 1, :, :width], table[level - 1, :, span:span + width])
+        return table
+
+    def _combo(self, cohort):
+        codes = [self._codes[column].get(getattr(cohort, column)) for column in CATEGORY_COLUMNS]
+        if None in codes:
+            return None
+        gender, region, visit_type = codes
+        n_regions = len(self.categories["region"])
+        n_visits = len(self.categories["visit_type"])
+        return (gender * n_regions + region) * n_visits + visit_type
+
+    def _range(self, name, combo, lo, hi):
+        prefix = self.arrays[name]
+        return float(prefix[combo, hi + 1] - prefix[combo, lo])
+
+    def _extreme(self, name, combo, lo, hi, reduce):
+        level = int(math.log2(hi - lo + 1))
+        table = self.arrays[name][level, combo]
+        return float(reduce(table[lo], table[hi - (1 << level) + 1]))
+
+    def cost_stats(self, cohort, median_cost=None) -> dict:
+        combo = self._combo(cohort)
+        lo = max(cohort.age_min, 0)
+        hi = min(cohort.age_max, self.n_ages - 1)
+        if combo is None or lo > hi:
+            return dict(EMPTY_KPIS)
+
+        sample_size = int(self._range("count", combo, lo, hi))
+        if not sample_size:
+            return dict(EMPTY_KPIS)
+
+        cost_sum = self._range("cost_sum", combo, lo, hi)
+        avg_cost = cost_sum / sample_size
+        std_dev = None
+        if sample_size > 1:
+            variance = (self._range("cost_sumsq", combo, lo, hi) - cost_sum * avg_cost) / (sample_size - 1)
+            std_dev = math.sqrt(max(variance, 0.0))
+        insurance_avg = self._range("insurance_sum", combo, lo, hi) / sample_size
+        member_avg = self._range("member_sum", combo, lo, hi) / sample_size
+        return {
+            "avg_cost": avg_cost,
+            "median_cost": median_cost,
+            "min_cost": self._extreme("cost_min", combo, lo, hi, min),
+            "max_cost": self._extreme("cost_max", combo, lo, hi, max),
+            "std_dev": std_dev,
+            "sample_size": sample_size,
+            "insurance_coverage_ratio": insurance_avg / avg_cost if avg_cost else None,
+            "member_burden_ratio": member_avg / avg_cost if avg_cost else None
+        }
+
+    def save(self, directory: str):
+        os.makedirs(directory, exist_ok=True)
+        for name, values in self.arrays.items():
+            np.save(os.path.join(directory, f"{name}.npy"), values)
+        with open(os.path.join(directory, "index.json"), "w") as f:
+            json.dump({"categories": self.categories, "data_version": self.data_version}, f, default=str)
+
+    @classmethod
+    def load(cls, directory: str, mmap: bool = True):
+        with open(os.path.join(directory, "index.json"), "r") as f:
+            meta = json.load(f)
+        mode = "r" if mmap else None
+        arrays = {
+            name: np.load(os.path.join(directory, f"{name}.npy"), mmap_mode=mode)
+            for name in PREFIX_ARRAYS + TABLE_ARRAYS
+        }
+        version = meta["data_version"]
+        return cls(meta["categories"], arrays, tuple(version) if isinstance(version, list) else version)
@@ -0,0 +1,86 @@
+import importlib
+import os
+import threading
+
+from agents.common.env import load_env
+from agents.cost_estimator.cohorts import CohortFilter
+
+DEFAULT_DATA_PATH = os.path.abspath(
+    os.path.join(os.path.dirname(__file__), '..', '..', 'robust_healthcare_costs.csv')
+)
+
+# Backends are imported on demand so the local path never pulls in google-cloud
+BACKENDS = {
+    "bigquery": "agents.cost_estimator.bigquery_backend:BigQueryBackend",
+    "local": "agents.cost_estimator.local_backend:LocalBackend",
+    "dataset": "agents.cost_estimator.dataset:DatasetBackend",
+    "materialized": "agents.cost_estimator.materialized:MaterializedBackend",
+}
+
+
+class DataBackend:
+    name = "base"
+
+    def cost_stats(self, cohort: CohortFilter) -> dict:
+        raise NotImplementedError
+
+    def cost_stats_many(self, cohorts: list) -> list:
+        # Cohorts that canonicalise alike are computed once; each input gets its own copy
+        by_cohort = {cohort: self.cost_stats(cohort) for cohort in dict.fromkeys(cohorts)}
+        return [dict(by_cohort[cohort]) for cohort in cohorts]
+
+    def cost_percentiles(self, cohort: CohortFilter, quantiles: tuple) -> dict:
+        raise NotImplementedError
+
+    def data_version(self):
+        # Token that changes whenever the underlying data does; None means unknown
+        return None
+
+    def reload(self):
+        pass
+
+
+def load_backend(name: str, **kwargs) -> DataBackend:
+    if name not in BACKENDS:
+        raise ValueError(f"Unknown data backend '{name}', expected one of {sorted(BACKENDS)}")
+    module_path, class_name = BACKENDS[name].split(":")
+    backend_class = getattr(importlib.import_module(module_path), class_name)
+    return backend_class(**kwargs)
+
+
+_backend = None
+_backend_lock = threading.Lock()
+
+
+def get_backend() -> DataBackend:
+    global _backend
+    with _backend_lock:
+        if _backend is None:
+            load_env()
+            name = os.getenv("DATASAGE_DATA_BACKEND", "bigquery")
+            kwargs = {}
+            if name == "local":
+                kwargs["path"] = os.getenv("DATASAGE_DATA_PATH", DEFAULT_DATA_PATH)
+                kwargs["index_path"] = os.getenv("DATASAGE_AGE_INDEX_PATH") or None
+            elif name == "dataset":
+                kwargs["path"] = os.getenv("DATASAGE_DATA_PATH", os.path.splitext(DEFAULT_DATA_PATH)[0] + ".parquet")
+            elif name == "materialized":
+                # The source is the cost CSV or "bigquery"; the store file survives restarts
+                kwargs["source"] = os.getenv("DATASAGE_MATERIALIZED_SOURCE", os.getenv("DATASAGE_DATA_PATH", DEFAULT_DATA_PATH))
+                kwargs["store_path"] = os.getenv("DATASAGE_KPI_STORE_PATH") or None
+            _backend = load_backend(name, **kwargs)
+            if os.getenv("DATASAGE_KPI_CACHE", "on").lower() not in ("0", "off", "false", "no"):
+                from agents.cost_estimator.kpi_cache import CachedBackend
+                _backend = CachedBackend(_backend)
+        return _backend
+
+
+def data_version():
+    # The active backend's version; task.yaml's `data_version:` folds it into step checkpoints
+    return get_backend().data_version()
+
+
+def set_backend(backend: DataBackend):
+    global _backend
+    with _backend_lock:
+        _backend = backend
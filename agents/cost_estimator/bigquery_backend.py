@@ -0,0 +1,96 @@
+from agents.cost_estimator.backends import DataBackend
+from agents.cost_estimator.bq_client import get_provider
+from agents.cost_estimator.cohorts import DEFAULT_QUANTILES, EMPTY_KPIS, SKETCH_COLUMNS, quantile_label
+from agents.cost_estimator.queries import (
+    QUANTILE_BUCKETS,
+    TABLE,
+    batch_cost_stats_query,
+    cohort_parameters,
+    cohorts_parameter,
+    cost_stats_query,
+    cube_query,
+    incremental_cells_query,
+    incremental_parameters,
+    job_config,
+    job_stats,
+    percentiles_query,
+)
+from config.tracing import current_span
+
+
+def _row_to_kpis(row):
+    if row is None or row.avg_cost is None:
+        return dict(EMPTY_KPIS)
+    return {
+        "avg_cost": row.avg_cost,
+        "median_cost": row.median_cost,
+        "min_cost": row.min_cost,
+        "max_cost": row.max_cost,
+        "std_dev": row.std_dev,
+        "sample_size": row.sample_size,
+        "insurance_coverage_ratio": row.insurance_coverage_ratio,
+        "member_burden_ratio": row.member_burden_ratio
+    }
+
+
+class BigQueryBackend(DataBackend):
+    name = "bigquery"
+
+    def __init__(self, provider=None, table: str = TABLE):
+        self.provider = provider
+        self.table = table
+
+    def _provider(self):
+        return self.provider or get_provider()
+
+    def _run(self, query, parameters):
+        job, rows = self._provider().run_query(query, job_config=job_config(parameters))
+        stats = job_stats(job)
+        current_span().set(**{f"bq_{key}": value for key, value in stats.items()})
+        return rows, stats
+
+    def cost_stats(self, cohort):
+        rows, stats = self._run(cost_stats_query(self.table), cohort_parameters(cohort))
+        result = _row_to_kpis(rows[0] if rows else None)
+        result["query_stats"] = stats
+        return result
+
+    def cost_stats_many(self, cohorts):
+        unique = list(dict.fromkeys(cohorts))
+        if not unique:
+            return []
+
+        result, stats = self._run(batch_cost_stats_query(self.table), [cohorts_parameter(unique)])
+        rows = {row.cohort_id: row for row in result}
+
+        by_cohort = {cohort: _row_to_kpis(rows.get(i)) for i, cohort in enumerate(unique)}
+        for kpis in by_cohort.values():
+            # One job serves every cohort in the batch
+            kpis["query_stats"] = dict(stats, cohorts=len(unique))
+        return [dict(by_cohort[cohort]) for cohort in cohorts]
+
+    def cost_percentiles(self, cohort, quantiles=DEFAULT_QUANTILES):
+        rows, stats = self._run(percentiles_query(self.table), cohort_parameters(cohort))
+        row = rows[0]
+        result = {"sample_size": row.sample_size, "query_stats": stats}
+        if not row.sample_size:
+            return result
+        for column in SKETCH_COLUMNS:
+            buckets = row[column]
+            result[column] = {
+                quantile_label(q): buckets[int(round(q * QUANTILE_BUCKETS))] for q in quantiles
+            }
+        return result
+
+    def cube_rows(self, points: int = 20):
+        rows, _ = self._run(cube_query(self.table, points), [])
+        return rows
+
+    def incremental_cells(self, since=None, points: int = 20, lookback_days: int = 1):
+        query = incremental_cells_query(self.table, points)
+        rows, _ = self._run(query, incremental_parameters(since, lookback_days))
+        return rows
+
+    def data_version(self):
+        table = self._provider().client().get_table(self.table)
+        return (self.table, table.modified, table.num_rows)
@@ -0,0 +1,100 @@
+import datetime
+import os
+import threading
+
+import requests
+from google.auth.transport.requests import AuthorizedSession, Request
+from google.cloud import bigquery
+from google.oauth2 import service_account
+from requests.adapters import HTTPAdapter
+
+DEFAULT_KEY_PATH = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..', '.secrets', 'creds.json'))
+SCOPES = ["https://www.googleapis.com/auth/cloud-platform"]
+# Refresh the access token this long before it expires so no request waits on it
+REFRESH_MARGIN = datetime.timedelta(minutes=5)
+MAX_CONCURRENT_QUERIES = int(os.getenv("DATASAGE_BQ_MAX_CONCURRENT_QUERIES", "8"))
+POOL_SIZE = int(os.getenv("DATASAGE_BQ_POOL_SIZE", "32"))
+
+
+def _utcnow():
+    # google-auth stores expiry as a naive UTC datetime
+    return datetime.datetime.now(datetime.timezone.utc).replace(tzinfo=None)
+
+
+class BigQueryClientProvider:
+    def __init__(self, key_path: str = DEFAULT_KEY_PATH,
+                 max_concurrent_queries: int = MAX_CONCURRENT_QUERIES,
+                 pool_size: int = POOL_SIZE):
+        self.key_path = key_path
+        self.pool_size = pool_size
+        self.max_concurrent_queries = max_concurrent_queries
+        self._lock = threading.RLock()
+        self._credentials = None
+        self._client = None
+        self._refresh_request = None
+        self._query_slots = threading.BoundedSemaphore(max_concurrent_queries)
+        self.refreshes = 0
+
+    def _pooled_session(self, session: requests.Session) -> requests.Session:
+        adapter = HTTPAdapter(pool_connections=self.pool_size, pool_maxsize=self.pool_size)
+        session.mount("https://", adapter)
+        session.mount("http://", adapter)
+        return session
+
+    def credentials(self):
+        with self._lock:
+            if self._credentials is None:
+                self._credentials = service_account.Credentials.from_service_account_file(
+                    self.key_path, scopes=SCOPES
+                )
+                self._refresh_request = Request(session=self._pooled_session(requests.Session()))
+
+            expiry = self._credentials.expiry
+            if not self._credentials.token or expiry is None or expiry - _utcnow() < REFRESH_MARGIN:
+                self._credentials.refresh(self._refresh_request)
+                self.refreshes += 1
+            return self._credentials
+
+    def client(self) -> bigquery.Client:
+        with self._lock:
+            credentials = self.credentials()
+            if self._client is None:
+                http = self._pooled_session(AuthorizedSession(credentials))
+                self._client = bigquery.Client(
+                    credentials=credentials,
+                    project=credentials.project_id,
+                    _http=http,
+                )
+            return self._client
+
+    def run_query(self, query: str, job_config: bigquery.QueryJobConfig = None):
+        # Bounded so a burst of cohort requests cannot exhaust slots or the HTTP pool
+        with self._query_slots:
+            job = self.client().query(query, job_config=job_config)
+            rows = list(job.result())
+        return job, rows
+
+    def close(self):
+        with self._lock:
+            if self._client is not None:
+                self._client.close()
+            self._client = None
+            self._credentials = None
+
+
+_provider = None
+_provider_lock = threading.Lock()
+
+
+def get_provider() -> BigQueryClientProvider:
+    global _provider
+    with _provider_lock:
+        if _provider is None:
+            _provider = BigQueryClientProvider()
+        return _provider
+
+
+def set_provider(provider: BigQueryClientProvider):
+    global _provider
+    with _provider_lock:
+        _provider = provider
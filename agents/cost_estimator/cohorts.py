@@ -0,0 +1,36 @@
+from typing import NamedTuple
+
+
+class CohortFilter(NamedTuple):
+    age_min: int
+    age_max: int
+    gender: str
+    region: str
+    visit_type: str
+
+
+def _canonical(value) -> str:
+    # Case and whitespace never change which rows match, so they must not change the key
+    return " ".join(str(value or "").split()).lower()
+
+
+def cohort_filter(inputs: dict) -> CohortFilter:
+    # The dashboard sends the region as "state"; main.py and task payloads use "region"
+    region = inputs.get("state", inputs.get("region", ""))
+    return CohortFilter(
+        age_min=max(int(inputs.get("age_min", 0)), 0),
+        age_max=int(inputs.get("age_max", 100)),
+        gender=_canonical(inputs.get("gender", "")),
+        region=_canonical(region),
+        visit_type=_canonical(inputs.get("visit_type", "")),
+    )
+
+
+EMPTY_KPIS = {"avg_cost": 0, "median_cost": 0, "min_cost": 0, "max_cost": 0}
+
+DEFAULT_QUANTILES = (0.5, 0.9, 0.95, 0.99)
+SKETCH_COLUMNS = ("cost", "insurance_paid", "member_paid")
+
+
+def quantile_label(q: float) -> str:
+    return f"p{q * 100:g}"
@@ -0,0 +1,215 @@
+import json
+import os
+import threading
+
+import numpy as np
+
+from agents.common.lru import LRUCache
+from agents.cost_estimator.age_index import CATEGORY_COLUMNS, AgePrefixIndex, cell_layout
+from agents.cost_estimator.backends import DataBackend
+from agents.cost_estimator.cohorts import cohort_filter
+
+# Quantile points kept per cell; medians of merged cells are interpolated from them
+CUBE_POINTS = 20
+
+
+class CubeUnavailableError(ValueError):
+    pass
+
+
+def _version_token(version) -> str:
+    # Versions round-trip through JSON on disk, so compare their JSON form
+    return json.dumps(version, default=str)
+
+
+def _cell_points(cell, cost, n_cells, points=CUBE_POINTS):
+    order = np.lexsort((cost, cell))
+    ordered = cost[order]
+    counts = np.bincount(cell, minlength=n_cells)
+    starts = np.concatenate(([0], np.cumsum(counts)[:-1]))
+    filled = counts > 0
+
+    position = starts[filled, None] + np.linspace(0, 1, points + 1) * (counts[filled, None] - 1)
+    lo = np.floor(position).astype(np.int64)
+    hi = np.ceil(position).astype(np.int64)
+    result = np.full((n_cells, points + 1), np.nan)
+    result[filled] = ordered[lo] + (ordered[hi] - ordered[lo]) * (position - lo)
+    return result
+
+
+class CohortCube(DataBackend):
+    # KPIs for every gender x region x visit_type x age cell, computed once. Any cohort the
+    # dashboard can select is a contiguous age range of one combo, so sums come from the
+    # prefix index in O(1) and the median from the merged per-cell quantile points.
+    name = "cube"
+
+    def __init__(self, index: AgePrefixIndex, points: np.ndarray):
+        self.index = index
+        self.points = points
+        self._memo = LRUCache(max_entries=4096)
+
+    @property
+    def categories(self) -> dict:
+        return self.index.categories
+
+    def data_version(self):
+        return self.index.data_version
+
+    @classmethod
+    def from_local(cls, backend, data_version=None, points=CUBE_POINTS):
+        categories, cell, rows, n_combos, n_ages = cell_layout(backend)
+        # The backend's own prefix index already covers these cells
+        index = AgePrefixIndex(backend.age_index.categories, backend.age_index.arrays, data_version)
+        values = _cell_points(cell, backend.cost[rows], n_combos * n_ages, points)
+        return cls(index, values.reshape(n_combos, n_ages, points + 1))
+
+    @classmethod
+    def from_rows(cls, rows, data_version=None):
+        # One row per non-empty cell, shaped like queries.cube_query's output; a cell with a
+        # NULL category (which cube_query already leaves out) is skipped
+        rows = [row for row in rows if all(row[column] is not None for column in CATEGORY_COLUMNS)]
+        categories = {column: sorted({row[column] for row in rows}) for column in CATEGORY_COLUMNS}
+        codes = {column: {value: code for code, value in enumerate(values)} for column, values in categories.items()}
+        n_regions = len(categories["region"])
+        n_visits = len(categories["visit_type"])
+        n_combos = max(len(categories["gender"]) * n_regions * n_visits, 1)
+        n_ages = max((int(row["age"]) for row in rows), default=0) + 1
+        n_points = max((len(row["cost_points"]) for row in rows), default=CUBE_POINTS + 1)
+
+        cells = {name: np.zeros((n_combos, n_ages)) for name in ("count", "cost_sum", "cost_sumsq",
+                                                                  "insurance_sum", "member_sum")}
+        cells["cost_min"] = np.full((n_combos, n_ages), np.inf)
+        cells["cost_max"] = np.full((n_combos, n_ages), -np.inf)
+        points = np.full((n_combos, n_ages, n_points), np.nan)
+        for row in rows:
+            combo = (
+                codes["gender"][row["gender"]] * n_regions * n_visits
+                + codes["region"][row["region"]] * n_visits
+                + codes["visit_type"][row["visit_type"]]
+            )
+            age = int(row["age"])
+            for name in cells:
+                cells[name][combo, age] = row[name]
+            points[combo, age] = row["cost_points"]
+        return cls(AgePrefixIndex.from_cells(categories, cells, data_version), points)
+
+    def median(self, cohort):
+        combo = self.index._combo(cohort)
+        lo = max(cohort.age_min, 0)
+        hi = min(cohort.age_max, self.index.n_ages - 1)
+        if combo is None or lo > hi:
+            return None
+        counts = np.diff(self.index.arrays["count"][combo, lo:hi + 2])
+        filled = counts > 0
+        if not filled.any():
+            return None
+        # Each cell's points stand for equal shares of its rows
+        points = np.asarray(self.points[combo, lo:hi + 1][filled])
+        weights = np.repeat(counts[filled] / points.shape[1], points.shape[1])
+        order = np.argsort(points, axis=None)
+        cumulative = np.cumsum(weights[order])
+        return float(points.ravel()[order][np.searchsorted(cumulative, cumulative[-1] / 2)])
+
+    def cost_stats(self, cohort):
+        stats = self._memo.get(cohort)
+        if stats is None:
+            stats = self.index.cost_stats(cohort)
+            if stats.get("sample_size"):
+                stats["median_cost"] = self.median(cohort)
+            self._memo.put(cohort, stats)
+        return dict(stats)
+
+    def estimate(self, inputs: dict) -> dict:
+        # Same shape as run_cost_estimator(inputs), without touching the data backend
+        return self.cost_stats(cohort_filter(inputs))
+
+    def save(self, directory: str):
+        self.index.save(directory)
+        np.save(os.path.join(directory, "points.npy"), self.points)
+
+    @classmethod
+    def load(cls, directory: str):
+        return cls(AgePrefixIndex.load(directory), np.load(os.path.join(directory, "points.npy"), mmap_mode="r"))
+
+
+def build_cube(backend, data_version=None) -> CohortCube:
+    backend = getattr(backend, "backend", backend)
+    if backend.name == "bigquery":
+        return CohortCube.from_rows(backend.cube_rows(CUBE_POINTS), data_version)
+    if backend.name == "dataset":
+        from agents.cost_estimator.dataset import read_frame
+        from agents.cost_estimator.local_backend import LocalBackend
+        backend = LocalBackend(frame=read_frame(backend.path))
+    elif backend.name != "local":
+        raise CubeUnavailableError(f"No cohort cube for the '{backend.name}' backend")
+    return CohortCube.from_local(backend, data_version)
+
+
+def load_cube(backend, path: str = None) -> CohortCube:
+    # Reuses a cube saved under path when it was built from the same data version
+    backend = getattr(backend, "backend", backend)
+    version = backend.data_version()
+    persist = path is not None and version is not None
+    if persist and os.path.exists(os.path.join(path, "points.npy")):
+        cube = CohortCube.load(path)
+        if _version_token(cube.data_version()) == _version_token(version):
+            return cube
+    cube = build_cube(backend, version)
+    if persist:
+        cube.save(path)
+    return cube
+
+
+def neighbor_inputs(inputs: dict, categories: dict, age_step: int = 5) -> list:
+    # The filter changes a user is likely to make next: every other option of one
+    # selectbox, or one age slider nudged by age_step
+    region_key = "state" if "state" in inputs else "region"
+    neighbors = []
+    for key, column in (("gender", "gender"), (region_key, "region"), ("visit_type", "visit_type")):
+        for value in categories.get(column, ()):
+            if value != inputs.get(key):
+                neighbors.append(dict(inputs, **{key: value}))
+    for key in ("age_min", "age_max"):
+        for delta in (-age_step, age_step):
+            value = min(max(inputs[key] + delta, 0), 100)
+            candidate = dict(inputs, **{key: value})
+            if value != inputs[key] and candidate["age_min"] <= candidate["age_max"]:
+                neighbors.append(candidate)
+    return neighbors
+
+
+class Prefetcher:
+    # Calls fn for each submitted input on one daemon thread, purely for its caching
+    # side effect. A new submit replaces whatever the previous one had left.
+    def __init__(self, fn):
+        self.fn = fn
+        self.warmed = 0
+        self._pending = []
+        self._busy = False
+        self._condition = threading.Condition()
+        threading.Thread(target=self._loop, name="cohort-prefetch", daemon=True).start()
+
+    def submit(self, inputs_list):
+        with self._condition:
+            self._pending = list(inputs_list)
+            self._condition.notify_all()
+
+    def wait(self, timeout: float = None) -> bool:
+        with self._condition:
+            return self._condition.wait_for(lambda: not self._pending and not self._busy, timeout)
+
+    def _loop(self):
+        while True:
+            with self._condition:
+                self._condition.wait_for(lambda: self._pending)
+                inputs = self._pending.pop(0)
+                self._busy = True
+            try:
+                self.fn(inputs)
+            except Exception:
+                # Warming is best effort; the foreground request will surface real errors
+                pass
+            with self._condition:
+                self._busy = False
+                self.warmed += 1
+                self._condition.notify_all()
@@ -0,0 +1,195 @@
+import os
+
+import numpy as np
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.csv as pa_csv
+import pyarrow.dataset as ds
+from pyarrow import fs
+
+from agents.cost_estimator.backends import DEFAULT_DATA_PATH, DataBackend
+from agents.cost_estimator.cohorts import DEFAULT_QUANTILES, SKETCH_COLUMNS, quantile_label
+
+PARTITION_COLUMNS = ("gender", "region", "visit_type")
+MONEY_COLUMNS = ("cost", "insurance_paid", "member_paid")
+# Everything the cost queries read; member_id is dropped unless asked for
+DEFAULT_COLUMNS = ("age",) + PARTITION_COLUMNS + MONEY_COLUMNS
+FORMATS = {"parquet": "parquet", "arrow": "ipc"}
+EXTENSIONS = {".parquet": "parquet", ".arrow": "arrow", ".feather": "arrow", ".ipc": "arrow"}
+
+
+def _normalise_batch(batch: pa.RecordBatch, columns) -> pa.RecordBatch:
+    # Same canonical form as cohort_filter: trimmed, lower-cased, dictionary-encoded.
+    # Money is stored as int64 cents, exact at any amount (float32 loses cents past $167k).
+    arrays = []
+    for name in columns:
+        column = batch.column(name)
+        if name in PARTITION_COLUMNS:
+            column = pc.utf8_lower(pc.utf8_trim_whitespace(column)).dictionary_encode()
+        elif name in MONEY_COLUMNS:
+            column = pc.round(pc.multiply(column.cast(pa.float64()), 100)).cast(pa.int64())
+        elif name == "age":
+            column = column.cast(pa.int16())
+        arrays.append(column)
+    return pa.RecordBatch.from_arrays(arrays, names=list(columns))
+
+
+def convert(csv_path: str = DEFAULT_DATA_PATH, output: str = None, format: str = "parquet",
+            partition: bool = True, columns=DEFAULT_COLUMNS, block_size: int = 64 << 20) -> str:
+    # Streams the CSV in blocks, so converting a file larger than memory is fine
+    if format not in FORMATS:
+        raise ValueError(f"Unknown dataset format '{format}', expected one of {sorted(FORMATS)}")
+    if output is None:
+        output = os.path.splitext(csv_path)[0] + f".{format}"
+
+    reader = pa_csv.open_csv(
+        csv_path,
+        read_options=pa_csv.ReadOptions(block_size=block_size),
+        convert_options=pa_csv.ConvertOptions(include_columns=list(columns)),
+    )
+    batches = (_normalise_batch(batch, columns) for batch in reader)
+    first = next(batches, None)
+    if first is None:
+        raise ValueError(f"{csv_path} has no rows")
+
+    def _all():
+        yield first
+        yield from batches
+
+    partitioning = None
+    if partition:
+        partitioning = ds.partitioning(
+            pa.schema([first.schema.field(name) for name in PARTITION_COLUMNS]), flavor="hive"
+        )
+    ds.write_dataset(
+        _all(), output, schema=first.schema, format=FORMATS[format], partitioning=partitioning,
+        existing_data_behavior="delete_matching",
+    )
+    return output
+
+
+def detect_format(path: str) -> str:
+    if os.path.isdir(path):
+        for _, _, files in os.walk(path):
+            for name in files:
+                fmt = EXTENSIONS.get(os.path.splitext(name)[1])
+                if fmt:
+                    return fmt
+        raise ValueError(f"{path} contains no .parquet or .arrow files")
+    fmt = EXTENSIONS.get(os.path.splitext(path)[1])
+    if fmt is None:
+        raise ValueError(f"Cannot tell the dataset format of {path}")
+    return fmt
+
+
+def is_dataset(path: str) -> bool:
+    return os.path.isdir(path) or os.path.splitext(path)[1] in EXTENSIONS
+
+
+def dataset_version(path: str):
+    # A directory's own mtime misses in-place rewrites, so fold in every data file
+    if not os.path.isdir(path):
+        stat = os.stat(path)
+        return (path, stat.st_mtime_ns, stat.st_size)
+    latest, total = 0, 0
+    for root, _, files in os.walk(path):
+        for name in files:
+            stat = os.stat(os.path.join(root, name))
+            latest, total = max(latest, stat.st_mtime_ns), total + stat.st_size
+    return (path, latest, total)
+
+
+def open_dataset(path: str) -> ds.Dataset:
+    # Memory-mapped reads: Arrow IPC columns are used in place, Parquet skips a copy
+    partitioning = ds.HivePartitioning.discover(infer_dictionary=True) if os.path.isdir(path) else None
+    return ds.dataset(
+        path, format=FORMATS[detect_format(path)], partitioning=partitioning,
+        filesystem=fs.LocalFileSystem(use_mmap=True),
+    )
+
+
+def cohort_expression(cohort):
+    # Equality on partition keys prunes whole directories; the age range uses row-group stats
+    expression = (ds.field("age") >= cohort.age_min) & (ds.field("age") <= cohort.age_max)
+    for column in PARTITION_COLUMNS:
+        expression &= ds.field(column) == getattr(cohort, column)
+    return expression
+
+
+def _dollars(column):
+    # int64 cents back to float64 dollars: the same doubles the CSV parses to. Datasets
+    # written with float32 money are rounded back to cents.
+    if pa.types.is_integer(column.type):
+        return pc.divide(column.cast(pa.float64()), 100.0)
+    if column.type == pa.float32():
+        return pc.round(column.cast(pa.float64()), 2)
+    return column
+
+
+def read_table(path: str, columns=DEFAULT_COLUMNS, cohort=None, dataset: ds.Dataset = None) -> pa.Table:
+    dataset = dataset if dataset is not None else open_dataset(path)
+    table = dataset.to_table(
+        columns=list(columns), filter=cohort_expression(cohort) if cohort is not None else None
+    )
+    for name in MONEY_COLUMNS:
+        if name in table.column_names:
+            index = table.column_names.index(name)
+            table = table.set_column(index, name, _dollars(table.column(name)))
+    return table
+
+
+def read_frame(path: str, columns=DEFAULT_COLUMNS, cohort=None):
+    # Dictionary columns come back as pandas categoricals
+    return read_table(path, columns, cohort).to_pandas()
+
+
+class DatasetBackend(DataBackend):
+    # Nothing held in memory: each query reads only its cohort's partition and columns
+    name = "dataset"
+
+    def __init__(self, path: str):
+        self.path = path
+        self.dataset = open_dataset(path)
+
+    def data_version(self):
+        return dataset_version(self.path)
+
+    def reload(self):
+        self.dataset = open_dataset(self.path)
+
+    def _arrays(self, cohort, columns):
+        table = read_table(self.path, columns, cohort, dataset=self.dataset)
+        return [table.column(name).to_numpy().astype(np.float64, copy=False) for name in columns]
+
+    def cost_stats(self, cohort):
+        from agents.cost_estimator.local_backend import kpis_from_arrays
+
+        return kpis_from_arrays(*self._arrays(cohort, MONEY_COLUMNS))
+
+    def cost_percentiles(self, cohort, quantiles=DEFAULT_QUANTILES):
+        arrays = self._arrays(cohort, SKETCH_COLUMNS)
+        result = {"sample_size": int(arrays[0].size)}
+        if not result["sample_size"]:
+            return result
+        for column, values in zip(SKETCH_COLUMNS, arrays):
+            result[column] = {
+                quantile_label(q): float(value) for q, value in zip(quantiles, np.quantile(values, quantiles))
+            }
+        return result
+
+
+def main(argv=None):
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Convert the cost CSV to a columnar dataset.")
+    parser.add_argument("csv_path", nargs="?", default=DEFAULT_DATA_PATH)
+    parser.add_argument("--output")
+    parser.add_argument("--format", choices=sorted(FORMATS), default="parquet")
+    parser.add_argument("--no-partition", action="store_true")
+    args = parser.parse_args(argv)
+    output = convert(args.csv_path, args.output, args.format, partition=not args.no_partition)
+    print(f"✅ Dataset written to {output}")
+
+
+if __name__ == "__main__":
+    main()
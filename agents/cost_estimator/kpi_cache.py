@@ -0,0 +1,90 @@
+import copy
+import os
+import threading
+import time
+
+from agents.common.lru import LRUCache
+from agents.cost_estimator.backends import DataBackend
+from config.tracing import current_span
+
+MAX_ENTRIES = int(os.getenv("DATASAGE_KPI_CACHE_SIZE", "4096"))
+# How often the data version is re-checked; BigQuery needs an API call for it
+VERSION_CHECK_INTERVAL = float(os.getenv("DATASAGE_KPI_VERSION_TTL", "30"))
+
+
+def _cached(value):
+    # The stored copy is private to the cache, and a backend's job statistics (job id, bytes
+    # billed) describe the query that filled the entry, not the reads it serves later
+    value = copy.deepcopy(value)
+    if "query_stats" in value:
+        value["query_stats"] = {"source": "kpi_cache"}
+    return value
+
+
+class CachedBackend(DataBackend):
+    # Memoises KPI blocks per normalised CohortFilter, dropped when the data version moves
+    def __init__(self, backend: DataBackend, max_entries: int = MAX_ENTRIES,
+                 version_check_interval: float = VERSION_CHECK_INTERVAL):
+        self.backend = backend
+        self.name = backend.name
+        self.version_check_interval = version_check_interval
+        self.entries = LRUCache(max_entries=max_entries)
+        self.invalidations = 0
+        self._version = None
+        self._checked_at = None
+        self._lock = threading.Lock()
+
+    def data_version(self):
+        with self._lock:
+            now = time.monotonic()
+            if self._checked_at is not None and now - self._checked_at < self.version_check_interval:
+                return self._version
+
+            version = self.backend.data_version()
+            if self._checked_at is not None and version != self._version:
+                self.backend.reload()
+                self.entries.clear()
+                self.invalidations += 1
+            self._version = version
+            self._checked_at = now
+            return version
+
+    def reload(self):
+        with self._lock:
+            self.backend.reload()
+            self.entries.clear()
+            self.invalidations += 1
+
+    def cost_stats(self, cohort):
+        key = (self.data_version(), cohort)
+        hit = self.entries.get(key)
+        current_span().set(cache="miss" if hit is None else "hit")
+        if hit is not None:
+            return copy.deepcopy(hit)
+        result = self.backend.cost_stats(cohort)
+        self.entries.put(key, _cached(result))
+        return result
+
+    def cost_stats_many(self, cohorts):
+        version = self.data_version()
+        found = {cohort: self.entries.get((version, cohort)) for cohort in dict.fromkeys(cohorts)}
+        misses = [cohort for cohort, value in found.items() if value is None]
+        current_span().set(cache_hits=len(found) - len(misses), cache_misses=len(misses))
+        if misses:
+            for cohort, value in zip(misses, self.backend.cost_stats_many(misses)):
+                self.entries.put((version, cohort), _cached(value))
+                found[cohort] = value
+        return [copy.deepcopy(found[cohort]) for cohort in cohorts]
+
+    def cost_percentiles(self, cohort, quantiles):
+        key = (self.data_version(), "percentiles", cohort, tuple(quantiles))
+        hit = self.entries.get(key)
+        current_span().set(cache="miss" if hit is None else "hit")
+        if hit is not None:
+            return copy.deepcopy(hit)
+        result = self.backend.cost_percentiles(cohort, quantiles)
+        self.entries.put(key, _cached(result))
+        return result
+
+    def stats(self) -> dict:
+        return dict(self.entries.stats(), invalidations=self.invalidations, data_version=repr(self._version))
@@ -0,0 +1,138 @@
+import os
+
+import numpy as np
+import pandas as pd
+
+from agents.cost_estimator.age_index import AgePrefixIndex
+from agents.cost_estimator.backends import DEFAULT_DATA_PATH, DataBackend
+from agents.cost_estimator.cohorts import EMPTY_KPIS
+from agents.cost_estimator.sketches import DEFAULT_QUANTILES, LazySketchIndex
+
+CATEGORY_COLUMNS = ("gender", "region", "visit_type")
+
+
+def read_data(path: str) -> pd.DataFrame:
+    # Parquet/Arrow datasets (see dataset.py) load column-projected and memory-mapped
+    from agents.cost_estimator import dataset
+
+    if dataset.is_dataset(path):
+        return dataset.read_frame(path)
+    return pd.read_csv(path)
+
+
+def money_array(values) -> np.ndarray:
+    # Dollars as float64; dataset.read_table has already turned stored cents back into dollars
+    return np.asarray(values, dtype=np.float64)
+
+
+def _category_codes(series: pd.Series):
+    # Normalise the distinct labels rather than every row; dataset categoricals arrive ready-made
+    if not isinstance(series.dtype, pd.CategoricalDtype):
+        series = series.astype("category")
+    labels = pd.Categorical(series.cat.categories.astype(str).str.strip().str.lower())
+    # Missing values (code -1) pick the trailing -1, even when there are no labels at all
+    codes = np.append(labels.codes, -1)[series.cat.codes.to_numpy()].astype(np.int16)
+    return codes, {value: code for code, value in enumerate(labels.categories)}
+
+
+def kpis_from_arrays(cost, insurance_paid, member_paid):
+    # Mirrors the BigQuery cost_stats CTE (STDDEV is the sample standard deviation)
+    sample_size = int(cost.size)
+    if not sample_size:
+        return dict(EMPTY_KPIS)
+    avg_cost = float(cost.mean())
+    return {
+        "avg_cost": avg_cost,
+        "median_cost": float(np.median(cost)),
+        "min_cost": float(cost.min()),
+        "max_cost": float(cost.max()),
+        "std_dev": float(cost.std(ddof=1)) if sample_size > 1 else None,
+        "sample_size": sample_size,
+        "insurance_coverage_ratio": float(insurance_paid.mean()) / avg_cost if avg_cost else None,
+        "member_burden_ratio": float(member_paid.mean()) / avg_cost if avg_cost else None
+    }
+
+
+class LocalBackend(DataBackend):
+    # Columnar in-memory engine: the file is parsed once, filters are boolean masks
+    name = "local"
+
+    def __init__(self, path: str = DEFAULT_DATA_PATH, frame: pd.DataFrame = None,
+                 index_path: str = None):
+        # A backend built from an in-memory frame has no file to version against
+        self.path = path if frame is None else None
+        self.index_path = index_path
+        self.loaded_version = None
+        if frame is None:
+            self.loaded_version = self.data_version()
+            frame = read_data(path)
+        self._load(frame)
+
+    def data_version(self):
+        if self.path is None:
+            return None
+        if os.path.isdir(self.path):
+            from agents.cost_estimator.dataset import dataset_version
+            return dataset_version(self.path)
+        stat = os.stat(self.path)
+        return (self.path, stat.st_mtime_ns, stat.st_size)
+
+    def reload(self):
+        self.loaded_version = self.data_version()
+        self._load(read_data(self.path))
+
+    def _load(self, frame):
+        self.size = len(frame)
+        self.age = frame["age"].to_numpy(dtype=np.int64)
+        self.cost = money_array(frame["cost"])
+        self.insurance_paid = money_array(frame["insurance_paid"])
+        self.member_paid = money_array(frame["member_paid"])
+
+        # Filters compare lower-cased values, so categories are normalised once here
+        self.codes = {}
+        self.categories = {}
+        for column in CATEGORY_COLUMNS:
+            self.codes[column], self.categories[column] = _category_codes(frame[column])
+
+        self.sketches = LazySketchIndex()
+        self.age_index = self._load_age_index()
+
+    def _load_age_index(self):
+        # Reuse a persisted index (memory-mapped) when it was built from this exact file
+        version = self.loaded_version
+        persist = self.index_path is not None and version is not None
+        if persist and os.path.exists(os.path.join(self.index_path, "index.json")):
+            index = AgePrefixIndex.load(self.index_path)
+            if index.data_version == version:
+                return index
+        index = AgePrefixIndex.build(self, data_version=version)
+        if persist:
+            index.save(self.index_path)
+        return index
+
+    def mask(self, cohort):
+        mask = np.ones(self.size, dtype=bool)
+        for column in CATEGORY_COLUMNS:
+            code = self.categories[column].get(getattr(cohort, column))
+            if code is None:
+                return np.zeros(self.size, dtype=bool)
+            mask &= self.codes[column] == code
+        mask &= (self.age >= cohort.age_min) & (self.age <= cohort.age_max)
+        return mask
+
+    def cost_stats(self, cohort):
+        # O(1) prefix-sum lookups; the median comes from the merged cell sketches
+        stats = self.age_index.cost_stats(cohort)
+        if stats.get("sample_size"):
+            median = self.sketches.percentiles(self, cohort, (0.5,), columns=("cost",))
+            stats["median_cost"] = median["cost"]["p50"]
+        return stats
+
+    def scan_cost_stats(self, cohort):
+        # Exact full-scan equivalent of cost_stats, kept for verification and benchmarks
+        mask = self.mask(cohort)
+        return kpis_from_arrays(self.cost[mask], self.insurance_paid[mask], self.member_paid[mask])
+
+    def cost_percentiles(self, cohort, quantiles=DEFAULT_QUANTILES):
+        # Merges precomputed per-cell t-digests instead of sorting the filtered column
+        return self.sketches.percentiles(self, cohort, quantiles)
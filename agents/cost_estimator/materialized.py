@@ -0,0 +1,418 @@
+import csv
+import hashlib
+import json
+import os
+import threading
+
+import numpy as np
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.csv as pa_csv
+
+from agents.cost_estimator.age_index import CATEGORY_COLUMNS, AgePrefixIndex
+from agents.cost_estimator.backends import DEFAULT_DATA_PATH, DataBackend
+from agents.cost_estimator.cohorts import DEFAULT_QUANTILES, EMPTY_KPIS, quantile_label
+from agents.cost_estimator.sketches import DEFAULT_COMPRESSION, TDigest
+from config.tracing import current_span
+
+CELL_COLUMNS = CATEGORY_COLUMNS + ("age",)
+SUM_COLUMNS = ("count", "cost_sum", "cost_sumsq", "insurance_sum", "member_sum")
+SOURCE_COLUMNS = CELL_COLUMNS + ("service_date", "cost", "insurance_paid", "member_paid")
+# Quantile points per cell requested from the warehouse; they seed that cell's digest
+WAREHOUSE_POINTS = 20
+# Warehouse refreshes re-read this many days before the newest service_date, so claims
+# that arrive up to that late are still counted
+LOOKBACK_DAYS = int(os.getenv("DATASAGE_MATERIALIZED_LOOKBACK_DAYS", "1"))
+# Bytes hashed at each end of the CSV prefix already folded in, to tell appends from rewrites
+FINGERPRINT_BYTES = 1 << 16
+
+
+class _Cell:
+    __slots__ = SUM_COLUMNS + ("cost_min", "cost_max", "digest")
+
+    def __init__(self, compression: int = DEFAULT_COMPRESSION):
+        for name in SUM_COLUMNS:
+            setattr(self, name, 0.0)
+        self.cost_min = np.inf
+        self.cost_max = -np.inf
+        self.digest = TDigest(compression=compression)
+
+    def add(self, aggregates, digest: TDigest):
+        for name in SUM_COLUMNS:
+            setattr(self, name, getattr(self, name) + float(aggregates[name]))
+        self.cost_min = min(self.cost_min, float(aggregates["cost_min"]))
+        self.cost_max = max(self.cost_max, float(aggregates["cost_max"]))
+        self.digest = self.digest.merge(digest)
+
+    def merge(self, other: "_Cell"):
+        self.add({name: getattr(other, name) for name in SUM_COLUMNS + ("cost_min", "cost_max")}, other.digest)
+
+
+def aggregate_frame(frame, compression: int = DEFAULT_COMPRESSION):
+    # (cell key, aggregates, digest) per (gender, region, visit_type, age) cell of the frame
+    frame = frame.assign(cost_sq=frame["cost"] * frame["cost"])
+    grouped = frame.groupby(list(CELL_COLUMNS), sort=False, observed=True)
+    sums = grouped.agg(
+        count=("cost", "size"),
+        cost_sum=("cost", "sum"),
+        cost_sumsq=("cost_sq", "sum"),
+        cost_min=("cost", "min"),
+        cost_max=("cost", "max"),
+        insurance_sum=("insurance_paid", "sum"),
+        member_sum=("member_paid", "sum"),
+    ).to_dict("index")
+    cost = frame["cost"].to_numpy(dtype=np.float64)
+    for key, positions in grouped.indices.items():
+        gender, region, visit_type, age = key
+        yield (gender, region, visit_type, int(age)), sums[key], TDigest.from_values(cost[positions], compression)
+
+
+def aggregate_rows(rows, compression: int = DEFAULT_COMPRESSION):
+    # Warehouse rows shaped like queries.incremental_cells_query; each quantile point
+    # stands for an equal share of its cell's rows
+    for row in rows:
+        points = np.asarray(row["cost_points"], dtype=np.float64)
+        weights = np.full(points.size, row["count"] / points.size)
+        digest = TDigest(points, weights, row["cost_min"], row["cost_max"], compression)
+        yield (row["gender"], row["region"], row["visit_type"], int(row["age"])), row, digest
+
+
+class KPIStore:
+    # Running per-cell aggregates plus the newest service_date they cover. New rows are
+    # folded in cell by cell, so a refresh costs as much as the new data, not the table.
+    # What has been read is tracked per source: a CSV by byte offset (appended rows count
+    # whatever their date), a warehouse by an open window of recent service dates whose
+    # cells are kept per date and replaced on every refresh.
+    def __init__(self, watermark: str = None, compression: int = DEFAULT_COMPRESSION):
+        self.watermark = watermark
+        self.compression = compression
+        self.rows = 0
+        self.cells = {}
+        self.open_cells = {}
+        self.horizon = None
+        self.offset = 0
+        self.fingerprint = None
+        self.generation = 0
+        self._snapshot = None
+        self._lock = threading.Lock()
+
+    def version(self):
+        return (self.watermark, self.rows, self.generation)
+
+    def _fold(self, cells: dict, aggregates) -> int:
+        added = 0
+        for key, values, digest in aggregates:
+            cell = cells.get(key)
+            if cell is None:
+                cell = cells[key] = _Cell(self.compression)
+            cell.add(values, digest)
+            added += int(values["count"])
+        return added
+
+    def apply(self, aggregates, watermark: str = None, open_window=None) -> int:
+        # open_window=(horizon, {service_date: aggregates}) replaces every open cell
+        with self._lock:
+            before = self.rows
+            self.rows += self._fold(self.cells, aggregates)
+            if open_window is not None:
+                self.horizon, by_date = open_window
+                self.rows -= sum(int(cell.count) for cells in self.open_cells.values() for cell in cells.values())
+                self.open_cells = {}
+                for date, date_aggregates in by_date.items():
+                    self.rows += self._fold(self.open_cells.setdefault(date, {}), date_aggregates)
+            if watermark is not None and (self.watermark is None or watermark > self.watermark):
+                self.watermark = watermark
+            self.generation += 1
+            self._snapshot = None
+            return self.rows - before
+
+    def mark_read(self, offset: int, fingerprint: str):
+        with self._lock:
+            self.offset = offset
+            self.fingerprint = fingerprint
+
+    def replace(self, other: "KPIStore"):
+        # Swaps in a rebuilt store's contents at once, so readers never see a partial rebuild
+        with self._lock:
+            for name in ("watermark", "rows", "cells", "open_cells", "horizon", "offset", "fingerprint"):
+                setattr(self, name, getattr(other, name))
+            self.generation = max(self.generation, other.generation) + 1
+            self._snapshot = None
+
+    def _all_cells(self) -> dict:
+        if not self.open_cells:
+            return self.cells
+        merged = {}
+        for cells in (self.cells, *self.open_cells.values()):
+            for key, cell in cells.items():
+                if key not in merged:
+                    merged[key] = _Cell(self.compression)
+                merged[key].merge(cell)
+        return merged
+
+    def _build_snapshot(self):
+        cells = self._all_cells()
+        categories = {
+            column: sorted({key[i] for key in cells}) for i, column in enumerate(CATEGORY_COLUMNS)
+        }
+        codes = {column: {value: code for code, value in enumerate(values)} for column, values in categories.items()}
+        n_regions = len(categories["region"])
+        n_visits = len(categories["visit_type"])
+        n_combos = max(len(categories["gender"]) * n_regions * n_visits, 1)
+        n_ages = max((key[3] for key in cells), default=0) + 1
+
+        arrays = {name: np.zeros((n_combos, n_ages)) for name in SUM_COLUMNS}
+        arrays["cost_min"] = np.full((n_combos, n_ages), np.inf)
+        arrays["cost_max"] = np.full((n_combos, n_ages), -np.inf)
+        digests = np.empty((n_combos, n_ages), dtype=object)
+        for (gender, region, visit_type, age), cell in cells.items():
+            combo = (codes["gender"][gender] * n_regions + codes["region"][region]) * n_visits \
+                + codes["visit_type"][visit_type]
+            for name in arrays:
+                arrays[name][combo, age] = getattr(cell, name)
+            digests[combo, age] = cell.digest
+        return AgePrefixIndex.from_cells(categories, arrays, self.version()), digests
+
+    def snapshot(self):
+        with self._lock:
+            if self._snapshot is None:
+                self._snapshot = self._build_snapshot()
+            return self._snapshot
+
+    def _selected(self, cohort):
+        # (prefix index, digests of the cohort's non-empty cells), or None for no cells
+        index, digests = self.snapshot()
+        combo = index._combo(cohort)
+        lo = max(cohort.age_min, 0)
+        hi = min(cohort.age_max, index.n_ages - 1)
+        if combo is None or lo > hi:
+            return index, None
+        return index, [digest for digest in digests[combo, lo:hi + 1] if digest is not None]
+
+    def cost_stats(self, cohort) -> dict:
+        index, selected = self._selected(cohort)
+        if selected is None:
+            return dict(EMPTY_KPIS)
+        median = TDigest.merge_all(selected, self.compression).quantile(0.5) if selected else None
+        return index.cost_stats(cohort, median_cost=median)
+
+    def cost_percentiles(self, cohort, quantiles=DEFAULT_QUANTILES) -> dict:
+        # Only cost has per-cell digests; the paid splits are kept as sums
+        _, selected = self._selected(cohort)
+        if not selected:
+            return {"sample_size": 0}
+        digest = TDigest.merge_all(selected, self.compression)
+        values = digest.quantiles(quantiles)
+        return {
+            "sample_size": int(digest.count),
+            "cost": {quantile_label(q): float(value) for q, value in zip(quantiles, values)},
+        }
+
+    def save(self, path: str):
+        with self._lock:
+            # Open cells are saved with their service_date, the others with ""
+            entries = [("", key, cell) for key, cell in self.cells.items()] + [
+                (date, key, cell) for date, cells in self.open_cells.items() for key, cell in cells.items()
+            ]
+            cells = [cell for _, _, cell in entries]
+            arrays = {
+                column: np.array([key[i] for _, key, _ in entries], dtype=str if i < 3 else np.int64)
+                for i, column in enumerate(CELL_COLUMNS)
+            }
+            arrays["service_date"] = np.array([date for date, _, _ in entries], dtype=str)
+            for name in SUM_COLUMNS + ("cost_min", "cost_max"):
+                arrays[name] = np.array([getattr(cell, name) for cell in cells], dtype=np.float64)
+            arrays["digest_sizes"] = np.array([cell.digest.means.size for cell in cells], dtype=np.int64)
+            arrays["digest_means"] = np.concatenate([cell.digest.means for cell in cells] or [np.empty(0)])
+            arrays["digest_weights"] = np.concatenate([cell.digest.weights for cell in cells] or [np.empty(0)])
+            arrays["meta"] = np.array(json.dumps({
+                "watermark": self.watermark, "rows": self.rows, "compression": self.compression,
+                "horizon": self.horizon, "offset": self.offset, "fingerprint": self.fingerprint,
+                "generation": self.generation,
+            }))
+        # Written beside the target and renamed, so readers never see half a store
+        tmp = f"{path}.tmp"
+        with open(tmp, "wb") as f:
+            np.savez(f, **arrays)
+        os.replace(tmp, path)
+
+    @classmethod
+    def load(cls, path: str):
+        with np.load(path) as npz:
+            data = {name: npz[name] for name in npz.files}
+        meta = json.loads(str(data["meta"]))
+        store = cls(meta["watermark"], meta["compression"])
+        store.rows = meta["rows"]
+        store.horizon = meta.get("horizon")
+        store.offset = meta.get("offset", 0)
+        store.fingerprint = meta.get("fingerprint")
+        store.generation = meta.get("generation", 0)
+        dates = data.get("service_date", np.full(data["count"].size, ""))
+        offsets = np.concatenate(([0], np.cumsum(data["digest_sizes"])))
+        for i in range(data["count"].size):
+            key = tuple(str(data[column][i]) for column in CATEGORY_COLUMNS) + (int(data["age"][i]),)
+            cells = store.open_cells.setdefault(str(dates[i]), {}) if dates[i] else store.cells
+            cell = cells[key] = _Cell(store.compression)
+            for name in SUM_COLUMNS + ("cost_min", "cost_max"):
+                setattr(cell, name, float(data[name][i]))
+            span = slice(offsets[i], offsets[i + 1])
+            cell.digest = TDigest(
+                data["digest_means"][span], data["digest_weights"][span],
+                cell.cost_min, cell.cost_max, store.compression,
+            )
+        return store
+
+
+def _complete_size(path: str) -> int:
+    # Bytes up to the last newline; a line still being appended is left for the next refresh
+    with open(path, "rb") as f:
+        end = f.seek(0, os.SEEK_END)
+        while end > 0:
+            start = max(end - FINGERPRINT_BYTES, 0)
+            f.seek(start)
+            newline = f.read(end - start).rfind(b"\n")
+            if newline >= 0:
+                return start + newline + 1
+            end = start
+    return 0
+
+
+def _fingerprint(path: str, offset: int) -> str:
+    # The first and last bytes of the prefix already read; a rewrite almost surely changes them
+    with open(path, "rb") as f:
+        head = f.read(min(offset, FINGERPRINT_BYTES))
+        f.seek(max(offset - FINGERPRINT_BYTES, 0))
+        tail = f.read(min(offset, FINGERPRINT_BYTES))
+    return hashlib.sha256(head + tail).hexdigest()
+
+
+def csv_batches(path: str, offset: int = 0, end: int = None, block_size: int = 64 << 20):
+    # Streams the rows between two byte offsets (0 = from the header) out of a memory map.
+    # Categories get cohort_filter's canonical form, like dataset._normalise_batch.
+    end = _complete_size(path) if end is None else end
+    names = None
+    if offset:
+        with open(path, "r", newline="") as f:
+            names = next(csv.reader([f.readline()]))
+    with pa.memory_map(path) as source:
+        reader = pa_csv.open_csv(
+            pa.BufferReader(source.read_at(end - offset, offset)),
+            read_options=pa_csv.ReadOptions(block_size=block_size, column_names=names),
+            convert_options=pa_csv.ConvertOptions(
+                include_columns=list(SOURCE_COLUMNS), column_types={"service_date": pa.string()}
+            ),
+        )
+        for batch in reader:
+            if not batch.num_rows:
+                continue
+            arrays = [
+                pc.utf8_lower(pc.utf8_trim_whitespace(batch.column(name))).dictionary_encode()
+                if name in CATEGORY_COLUMNS else batch.column(name)
+                for name in SOURCE_COLUMNS
+            ]
+            yield pa.RecordBatch.from_arrays(arrays, names=list(SOURCE_COLUMNS)).to_pandas()
+
+
+def refresh_from_csv(store: KPIStore, path: str = DEFAULT_DATA_PATH) -> int:
+    # The CSV is treated as append-only: everything past the stored offset is new, whatever
+    # its service_date. A shrunk or rewritten file is rebuilt from scratch instead.
+    end = _complete_size(path)
+    target = store
+    if store.offset and (end < store.offset or _fingerprint(path, store.offset) != store.fingerprint):
+        target = KPIStore(compression=store.compression)
+    if end == target.offset:
+        return 0
+    added = 0
+    for frame in csv_batches(path, target.offset, end):
+        added += target.apply(aggregate_frame(frame, target.compression), watermark=frame["service_date"].max())
+    target.mark_read(end, _fingerprint(path, end))
+    if target is not store:
+        store.replace(target)
+    return added
+
+
+def refresh_from_bigquery(store: KPIStore, backend, lookback_days: int = LOOKBACK_DAYS) -> int:
+    # Re-reads from the previous open window on: dates now past the lookback are folded in
+    # for good, the rest replace the open cells, late rows for them included
+    rows = list(backend.incremental_cells(store.horizon, WAREHOUSE_POINTS, lookback_days))
+    closed = [row for row in rows if row["open_date"] is None]
+    by_date = {}
+    for row in rows:
+        if row["open_date"] is not None:
+            by_date.setdefault(str(row["open_date"]), []).append(row)
+    horizon = str(rows[0]["horizon"]) if rows else store.horizon
+    watermark = max((str(row["max_service_date"]) for row in rows), default=None)
+    open_window = (horizon, {date: aggregate_rows(group, store.compression) for date, group in by_date.items()})
+    return store.apply(aggregate_rows(closed, store.compression), watermark=watermark, open_window=open_window)
+
+
+class MaterializedBackend(DataBackend):
+    # Cohort KPIs from a KPIStore. Whenever the source's data version moves, only what the
+    # store has not read yet is aggregated and folded in.
+    name = "materialized"
+
+    def __init__(self, source: str = DEFAULT_DATA_PATH, store_path: str = None):
+        self.source = source
+        self.store_path = store_path
+        self._source_backend = None
+        self._source_version = None
+        self._lock = threading.Lock()
+        self.store = KPIStore.load(store_path) if store_path and os.path.exists(store_path) else KPIStore()
+        self.refresh()
+
+    def _warehouse(self):
+        if self._source_backend is None:
+            from agents.cost_estimator.bigquery_backend import BigQueryBackend
+            self._source_backend = BigQueryBackend()
+        return self._source_backend
+
+    def _current_source_version(self):
+        if self.source == "bigquery":
+            return self._warehouse().data_version()
+        stat = os.stat(self.source)
+        return (self.source, stat.st_mtime_ns, stat.st_size)
+
+    def refresh(self) -> int:
+        with self._lock:
+            # Taken first: a change landing mid-refresh triggers the next one
+            source_version = self._current_source_version()
+            version = self.store.version()
+            if self.source == "bigquery":
+                added = refresh_from_bigquery(self.store, self._warehouse())
+            else:
+                added = refresh_from_csv(self.store, self.source)
+            self._source_version = source_version
+            if self.store.version() != version and self.store_path:
+                self.store.save(self.store_path)
+            current_span().set(materialized_rows=added, watermark=self.store.watermark)
+            return added
+
+    def data_version(self):
+        # Polled by CachedBackend; a moved source triggers the incremental refresh here
+        if self._current_source_version() != self._source_version:
+            self.refresh()
+        return self.store.version()
+
+    def reload(self):
+        self.refresh()
+
+    def cost_stats(self, cohort):
+        return self.store.cost_stats(cohort)
+
+    def cost_percentiles(self, cohort, quantiles=DEFAULT_QUANTILES):
+        return self.store.cost_percentiles(cohort, quantiles)
+
+
+def main(argv=None):
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Incrementally refresh the materialized KPI store.")
+    parser.add_argument("store_path")
+    parser.add_argument("--source", default=DEFAULT_DATA_PATH, help="cost CSV path, or 'bigquery'")
+    args = parser.parse_args(argv)
+    backend = MaterializedBackend(args.source, args.store_path)
+    print(f"✅ {backend.store.rows:,} rows materialized through {backend.store.watermark}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,185 @@
+import functools
+
+from google.cloud import bigquery
+
+from agents.cost_estimator.cohorts import SKETCH_COLUMNS
+
+TABLE = "datasage-adk-v2.datasage_health.healthcare_costs"
+# APPROX_QUANTILES resolution used for percentile lookups (permille)
+QUANTILE_BUCKETS = 1000
+
+# Every filter value is a typed query parameter, so the query text is identical for
+# all cohorts and BigQuery's result cache can hit whenever the parameters repeat.
+COHORT_PREDICATE = """
+    age BETWEEN @age_min AND @age_max
+    AND LOWER(gender) = @gender
+    AND LOWER(region) = @region
+    AND LOWER(visit_type) = @visit_type
+"""
+
+
+@functools.lru_cache(maxsize=None)
+def cost_stats_query(table: str = TABLE) -> str:
+    return f"""
+        WITH cost_stats AS (
+            SELECT
+                AVG(cost) AS avg_cost,
+                APPROX_QUANTILES(cost, 2)[OFFSET(1)] AS median_cost,
+                MIN(cost) AS min_cost,
+                MAX(cost) AS max_cost,
+                STDDEV(cost) AS std_dev,
+                COUNT(*) as sample_size,
+                AVG(insurance_paid) as avg_insurance_paid,
+                AVG(member_paid) as avg_member_paid
+            FROM `{table}`
+            WHERE {COHORT_PREDICATE}
+        )
+        SELECT
+            *,
+            avg_insurance_paid / NULLIF(avg_cost, 0) as insurance_coverage_ratio,
+            avg_member_paid / NULLIF(avg_cost, 0) as member_burden_ratio
+        FROM cost_stats
+    """
+
+
+# One scan for many cohorts: the cohort specs are passed as an array of structs and
+# joined against the table, so each row is attributed to every cohort it matches.
+# GROUPING SETS cannot express per-cohort age ranges, the join can.
+@functools.lru_cache(maxsize=None)
+def batch_cost_stats_query(table: str = TABLE) -> str:
+    return f"""
+        WITH cohorts AS (
+            SELECT * FROM UNNEST(@cohorts)
+        ),
+        cost_stats AS (
+            SELECT
+                c.cohort_id,
+                AVG(t.cost) AS avg_cost,
+                APPROX_QUANTILES(t.cost, 2)[OFFSET(1)] AS median_cost,
+                MIN(t.cost) AS min_cost,
+                MAX(t.cost) AS max_cost,
+                STDDEV(t.cost) AS std_dev,
+                COUNT(*) as sample_size,
+                AVG(t.insurance_paid) as avg_insurance_paid,
+                AVG(t.member_paid) as avg_member_paid
+            FROM `{table}` t
+            JOIN cohorts c
+                ON t.age BETWEEN c.age_min AND c.age_max
+                AND LOWER(t.gender) = c.gender
+                AND LOWER(t.region) = c.region
+                AND LOWER(t.visit_type) = c.visit_type
+            GROUP BY c.cohort_id
+        )
+        SELECT
+            *,
+            avg_insurance_paid / NULLIF(avg_cost, 0) as insurance_coverage_ratio,
+            avg_member_paid / NULLIF(avg_cost, 0) as member_burden_ratio
+        FROM cost_stats
+    """
+
+
+@functools.lru_cache(maxsize=None)
+def percentiles_query(table: str = TABLE) -> str:
+    columns = ",\n".join(
+        f"APPROX_QUANTILES({column}, {QUANTILE_BUCKETS}) AS {column}" for column in SKETCH_COLUMNS
+    )
+    return f"""
+        SELECT
+            COUNT(*) AS sample_size,
+            {columns}
+        FROM `{table}`
+        WHERE {COHORT_PREDICATE}
+    """
+
+
+# Rows with a NULL category belong to no cell, as in the local backend's indexes
+CELL_PREDICATE = "age >= 0 AND gender IS NOT NULL AND region IS NOT NULL AND visit_type IS NOT NULL"
+
+
+def _cells_query(table: str, points: int, predicate: str, extra: str = "", joins: str = "",
+                 group: str = "") -> str:
+    return f"""
+        SELECT
+            LOWER(gender) AS gender,
+            LOWER(region) AS region,
+            LOWER(visit_type) AS visit_type,
+            age,
+            COUNT(*) AS count,
+            SUM(cost) AS cost_sum,
+            SUM(cost * cost) AS cost_sumsq,
+            MIN(cost) AS cost_min,
+            MAX(cost) AS cost_max,
+            SUM(insurance_paid) AS insurance_sum,
+            SUM(member_paid) AS member_sum,
+            APPROX_QUANTILES(cost, {points}) AS cost_points{extra}
+        FROM `{table}`{joins}
+        WHERE {predicate}
+        GROUP BY gender, region, visit_type, age{group}
+    """
+
+
+# Every gender x region x visit_type x age cell in one scan, for the dashboard's cohort
+# cube. The quantile points let the cube approximate medians of merged cells.
+@functools.lru_cache(maxsize=None)
+def cube_query(table: str = TABLE, points: int = 20) -> str:
+    return _cells_query(table, points, CELL_PREDICATE)
+
+
+# The same cells over the claims from @since on (NULL = all of them), for incremental
+# refreshes of the materialized KPI store. Service dates within @lookback days of the
+# newest are grouped apart (open_date), so the next refresh can replace them when late
+# claims for those dates arrive.
+@functools.lru_cache(maxsize=None)
+def incremental_cells_query(table: str = TABLE, points: int = 20) -> str:
+    return _cells_query(
+        table, points, f"{CELL_PREDICATE} AND (@since IS NULL OR service_date >= @since)",
+        extra=",\n            MAX(service_date) AS max_service_date"
+              ",\n            IF(service_date >= bounds.horizon, service_date, NULL) AS open_date"
+              ",\n            ANY_VALUE(bounds.horizon) AS horizon",
+        joins=f"\n        CROSS JOIN (SELECT DATE_SUB(MAX(service_date), INTERVAL @lookback DAY) AS horizon"
+              f" FROM `{table}`) AS bounds",
+        group=", open_date",
+    )
+
+
+def incremental_parameters(since, lookback_days: int) -> list:
+    return [
+        bigquery.ScalarQueryParameter("since", "DATE", since),
+        bigquery.ScalarQueryParameter("lookback", "INT64", lookback_days),
+    ]
+
+
+def cohort_parameters(cohort) -> list:
+    return [
+        bigquery.ScalarQueryParameter("age_min", "INT64", cohort.age_min),
+        bigquery.ScalarQueryParameter("age_max", "INT64", cohort.age_max),
+        bigquery.ScalarQueryParameter("gender", "STRING", cohort.gender),
+        bigquery.ScalarQueryParameter("region", "STRING", cohort.region),
+        bigquery.ScalarQueryParameter("visit_type", "STRING", cohort.visit_type),
+    ]
+
+
+def cohorts_parameter(cohorts) -> bigquery.ArrayQueryParameter:
+    structs = [
+        bigquery.StructQueryParameter(
+            None,
+            bigquery.ScalarQueryParameter("cohort_id", "INT64", cohort_id),
+            *cohort_parameters(cohort),
+        )
+        for cohort_id, cohort in enumerate(cohorts)
+    ]
+    return bigquery.ArrayQueryParameter("cohorts", "STRUCT", structs)
+
+
+def job_config(parameters: list) -> bigquery.QueryJobConfig:
+    return bigquery.QueryJobConfig(query_parameters=parameters, use_query_cache=True)
+
+
+def job_stats(job) -> dict:
+    return {
+        "job_id": job.job_id,
+        "cache_hit": bool(job.cache_hit),
+        "bytes_processed": job.total_bytes_processed or 0,
+        "bytes_billed": job.total_bytes_billed or 0,
+        "slot_millis": job.slot_millis or 0,
+    }
@@ -0,0 +1,189 @@
+import threading
+
+import numpy as np
+
+from agents.cost_estimator.age_index import valid_rows
+from agents.cost_estimator.cohorts import DEFAULT_QUANTILES, SKETCH_COLUMNS, quantile_label
+
+DEFAULT_COMPRESSION = 200
+
+
+def _scale(q, compression):
+    # t-digest k1 scale function: centroids shrink towards both tails
+    return compression / (2 * np.pi) * np.arcsin(2 * q - 1)
+
+
+class TDigest:
+    # Merging t-digest: a few hundred (mean, weight) centroids, mergeable across cells
+    __slots__ = ("means", "weights", "min", "max", "compression")
+
+    def __init__(self, means=None, weights=None, min_value=np.inf, max_value=-np.inf,
+                 compression: int = DEFAULT_COMPRESSION):
+        self.means = np.empty(0) if means is None else np.asarray(means, dtype=np.float64)
+        self.weights = np.empty(0) if weights is None else np.asarray(weights, dtype=np.float64)
+        self.min = float(min_value)
+        self.max = float(max_value)
+        self.compression = compression
+
+    @property
+    def count(self) -> float:
+        return float(self.weights.sum())
+
+    @classmethod
+    def from_values(cls, values, compression: int = DEFAULT_COMPRESSION, presorted: bool = False):
+        values = np.asarray(values, dtype=np.float64)
+        if not presorted:
+            values = np.sort(values)
+        if not values.size:
+            return cls(compression=compression)
+        if values.size <= compression // 4:
+            # Small cells stay exact; compression happens when cells are merged
+            return cls(values, np.ones(values.size), values[0], values[-1], compression)
+        means, weights = cls._compress(values, np.ones(values.size), compression)
+        return cls(means, weights, values[0], values[-1], compression)
+
+    @staticmethod
+    def _compress(means, weights, compression):
+        # Inputs are sorted by mean; each output centroid spans at most one unit of k
+        cumulative = np.cumsum(weights)
+        q_left = (cumulative - weights) / cumulative[-1]
+        bucket = np.floor(_scale(q_left, compression) - _scale(0.0, compression)).astype(np.int64)
+        _, bucket = np.unique(bucket, return_inverse=True)
+        merged_weights = np.bincount(bucket, weights=weights)
+        merged_means = np.bincount(bucket, weights=weights * means) / merged_weights
+        return merged_means, merged_weights
+
+    @classmethod
+    def merge_all(cls, digests, compression: int = DEFAULT_COMPRESSION):
+        digests = [d for d in digests if d.weights.size]
+        if not digests:
+            return cls(compression=compression)
+        if len(digests) == 1:
+            return digests[0]
+        means = np.concatenate([d.means for d in digests])
+        weights = np.concatenate([d.weights for d in digests])
+        order = np.argsort(means, kind="stable")
+        means, weights = means[order], weights[order]
+        # Like the t-digest buffer: only compress once there are more centroids than allowed
+        if means.size > compression:
+            means, weights = cls._compress(means, weights, compression)
+        return cls(
+            means,
+            weights,
+            min(d.min for d in digests),
+            max(d.max for d in digests),
+            compression,
+        )
+
+    def merge(self, other):
+        return TDigest.merge_all([self, other], self.compression)
+
+    def quantiles(self, qs) -> np.ndarray:
+        qs = np.asarray(qs, dtype=np.float64)
+        if not self.weights.size:
+            return np.full(qs.shape, np.nan)
+        total = self.weights.sum()
+        centers = np.cumsum(self.weights) - self.weights / 2
+        # Interpolate between centroid centres, anchored at the exact min and max
+        positions = np.concatenate(([0.0], centers, [total]))
+        values = np.concatenate(([self.min], self.means, [self.max]))
+        return np.interp(qs * total, positions, values)
+
+    def quantile(self, q: float) -> float:
+        return float(self.quantiles([q])[0])
+
+    def to_dict(self) -> dict:
+        return {
+            "means": self.means.tolist(),
+            "weights": self.weights.tolist(),
+            "min": self.min,
+            "max": self.max,
+            "compression": self.compression,
+        }
+
+    @classmethod
+    def from_dict(cls, data: dict):
+        return cls(data["means"], data["weights"], data["min"], data["max"], data["compression"])
+
+
+class CohortSketchIndex:
+    # One digest per column for every (gender, region, visit_type, age) cell
+    def __init__(self, cells: dict, compression: int = DEFAULT_COMPRESSION):
+        self.cells = cells
+        self.compression = compression
+
+    @classmethod
+    def build(cls, backend, columns=SKETCH_COLUMNS, compression: int = DEFAULT_COMPRESSION):
+        names = {
+            column: {code: value for value, code in backend.categories[column].items()}
+            for column in ("gender", "region", "visit_type")
+        }
+        rows = valid_rows(backend)
+        ages = backend.age[rows]
+        cell_ids = np.stack([
+            backend.codes["gender"][rows].astype(np.int64),
+            backend.codes["region"][rows].astype(np.int64),
+            backend.codes["visit_type"][rows].astype(np.int64),
+            ages,
+        ])
+
+        cells = {}
+        for column in columns:
+            values = getattr(backend, column)[rows]
+            if not values.size:
+                continue
+            # Sort once by (cell, value) so every cell is a contiguous, presorted slice
+            order = np.lexsort((values, ages, cell_ids[2], cell_ids[1], cell_ids[0]))
+            sorted_cells = cell_ids[:, order]
+            sorted_values = values[order]
+            boundaries = np.flatnonzero(np.any(np.diff(sorted_cells, axis=1) != 0, axis=0)) + 1
+            starts = np.concatenate(([0], boundaries))
+            ends = np.concatenate((boundaries, [order.size]))
+            for start, end in zip(starts, ends):
+                g, r, v, age = sorted_cells[:, start]
+                key = (names["gender"][g], names["region"][r], names["visit_type"][v], int(age))
+                cells.setdefault(key, {})[column] = TDigest.from_values(
+                    sorted_values[start:end], compression, presorted=True
+                )
+        return cls(cells, compression)
+
+    def merged(self, cohort) -> dict:
+        selected = [
+            digests for age in range(cohort.age_min, cohort.age_max + 1)
+            if (digests := self.cells.get((cohort.gender, cohort.region, cohort.visit_type, age)))
+        ]
+        columns = selected[0].keys() if selected else ()
+        return {
+            column: TDigest.merge_all([cell[column] for cell in selected], self.compression)
+            for column in columns
+        }
+
+    def percentiles(self, cohort, quantiles=DEFAULT_QUANTILES) -> dict:
+        result = {}
+        for column, digest in self.merged(cohort).items():
+            result["sample_size"] = int(digest.count)
+            values = digest.quantiles(quantiles)
+            result[column] = {quantile_label(q): float(value) for q, value in zip(quantiles, values)}
+        result.setdefault("sample_size", 0)
+        return result
+
+
+class LazySketchIndex:
+    # Builds each column's per-cell sketches on first use (a backend reload
+    # creates a fresh LazySketchIndex)
+    def __init__(self, compression: int = DEFAULT_COMPRESSION):
+        self.compression = compression
+        self._columns = {}
+        self._lock = threading.Lock()
+
+    def column(self, backend, column) -> CohortSketchIndex:
+        with self._lock:
+            if column not in self._columns:
+                self._columns[column] = CohortSketchIndex.build(backend, (column,), self.compression)
+            return self._columns[column]
+
+    def percentiles(self, backend, cohort, quantiles=DEFAULT_QUANTILES, columns=SKETCH_COLUMNS) -> dict:
+        result = {"sample_size": 0}
+        for column in columns:
+            result.update(self.column(backend, column).percentiles(cohort, quantiles))
+        return result
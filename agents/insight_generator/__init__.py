@@ -1,3 +1,3 @@
-from .agent import run_insight_generator
+from .agent import run_insight_generator, arun_insight_generator, astream_insight_generator
 
 
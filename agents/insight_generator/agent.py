@@ -1,19 +1,17 @@
-import os
-import openai
-from dotenv import load_dotenv
+from agents.common.llm_client import get_client
 
-load_dotenv()
-openai.api_key = os.getenv("OPENAI_API_KEY")
 
-def run_insight_generator(inputs):
-    avg = inputs.get("avg_cost", 0)
-    median = inputs.get("median_cost", 0)
-    min_cost = inputs.get("min_cost", 0)
-    max_cost = inputs.get("max_cost", 0)
+def _kpis(inputs):
+    return (
+        inputs.get("avg_cost", 0),
+        inputs.get("median_cost", 0),
+        inputs.get("min_cost", 0),
+        inputs.get("max_cost", 0),
+    )
 
-    if avg == 0:
-        return {"insights": "⚠️ Missing cost KPIs: unable to generate insights."}
 
+def build_messages(inputs):
+    avg, median, min_cost, max_cost = _kpis(inputs)
     prompt = f"""
     You are a business intelligence analyst. Based on these healthcare cost metrics, generate non-obvious insights, trends, or recommendations:
 
@@ -24,10 +22,49 @@ def run_insight_generator(inputs):
 
     Provide one insight that would help improve healthcare cost efficiency or identify unusual patterns.
     """
+    return [{"role": "user", "content": prompt}]
 
-    response = openai.ChatCompletion.create(
-        model="gpt-4",
-        messages=[{"role": "user", "content": prompt}]
-    )
 
-    return {"insights": response.choices[0].message["content"]}
+def _insufficient(inputs):
+    if inputs.get("avg_cost", 0) == 0:
+        return {"insights": "⚠️ Missing cost KPIs: unable to generate insights."}
+    return None
+
+
+def run_insight_generator(inputs):
+    fallback = _insufficient(inputs)
+    if fallback:
+        return fallback
+
+    return {"insights": get_client().chat(build_messages(inputs), model="gpt-4")}
+
+
+async def arun_insight_generator(inputs):
+    fallback = _insufficient(inputs)
+    if fallback:
+        return fallback
+
+    return {"insights": await get_client().achat(build_messages(inputs), model="gpt-4")}
+
+
+async def astream_insight_generator(inputs):
+    # Yields growing partial results; the last one equals run_insight_generator's output
+    fallback = _insufficient(inputs)
+    if fallback:
+        yield fallback
+        return
+
+    insights = ""
+    async for delta in get_client().astream(build_messages(inputs), model="gpt-4"):
+        insights += delta
+        yield {"insights": insights}
+    yield {"insights": insights}
+
+
+def run(estimate_cost=None, interpret_benefits=None, detect_anomalies=None, **inputs):
+    # task.yaml entry point: the prompt is built from the estimate_cost KPIs
+    from agents.narrative_fusion.agent import fused_enabled, fused_step
+
+    if fused_enabled():
+        return fused_step("generate_insights", estimate_cost or {})
+    return run_insight_generator(estimate_cost or {})
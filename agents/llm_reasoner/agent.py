@@ -1,19 +1,15 @@
-import os
-import openai
-from dotenv import load_dotenv
+from agents.common.llm_client import get_client
+
 
-load_dotenv()
-openai.api_key = os.getenv("OPENAI_API_KEY")
 class LLMReasonerAgent:
-    def __init__(self):
-        # Setup for OpenAI or other LLM client
-        import openai
-        import os
-        from dotenv import load_dotenv
-        load_dotenv()
-        openai.api_key = os.getenv("OPENAI_API_KEY")
+    def __init__(self, client=None):
+        # Shared LLM client unless one is injected (e.g. a stub backend in tests)
+        self.client = client
 
-    def reason(self, input_data: dict, results: dict) -> dict:
+    def _client(self):
+        return self.client or get_client()
+
+    def build_messages(self, input_data: dict, results: dict) -> list:
         # Construct context from previous agents
         context_parts = []
         if "estimate_cost" in results:
@@ -29,15 +25,25 @@ class LLMReasonerAgent:
 
         prompt = f"""You are a healthcare analyst. Based on the following data, generate a brief summary with 3 main points and one recommendation:\n\n{full_context}"""
 
-        response = openai.ChatCompletion.create(
+        return [
+            {"role": "system", "content": "You are a helpful data analyst."},
+            {"role": "user", "content": prompt}
+        ]
+
+    def reason(self, input_data: dict, results: dict) -> dict:
+        summary = self._client().chat(
+            self.build_messages(input_data, results),
             model="gpt-3.5-turbo",
-            messages=[
-                {"role": "system", "content": "You are a helpful data analyst."},
-                {"role": "user", "content": prompt}
-            ],
             temperature=0.7,
             max_tokens=300
         )
+        return {"summary": summary}
 
-        return {"summary": response['choices'][0]['message']['content']}
-
+    async def areason(self, input_data: dict, results: dict) -> dict:
+        summary = await self._client().achat(
+            self.build_messages(input_data, results),
+            model="gpt-3.5-turbo",
+            temperature=0.7,
+            max_tokens=300
+        )
+        return {"summary": summary}
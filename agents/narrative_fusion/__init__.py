@@ -0,0 +1 @@
+from .agent import run_fused_narratives
@@ -0,0 +1,148 @@
+import json
+import os
+import threading
+from concurrent.futures import Future
+
+import jsonschema
+
+from agents.anomaly_detector import agent as anomaly_detector
+from agents.benefits_interpreter import agent as benefits_interpreter
+from agents.common.llm_client import get_client
+from agents.common.lru import LRUCache
+from agents.insight_generator import agent as insight_generator
+from config.tracing import current_span, span
+
+NARRATIVE_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "benefit_summary": {"type": "string", "minLength": 1},
+        "explanation": {"type": "string", "minLength": 1},
+        "insights": {"type": "string", "minLength": 1},
+    },
+    "required": ["benefit_summary", "explanation", "insights"],
+    "additionalProperties": False,
+}
+
+STEPS = ("interpret_benefits", "detect_anomalies", "generate_insights")
+
+
+class NarrativeParseError(ValueError):
+    pass
+
+
+def fused_enabled() -> bool:
+    # DATASAGE_NARRATIVE_MODE=fused makes the task.yaml narrative steps share one LLM call
+    return os.getenv("DATASAGE_NARRATIVE_MODE", "separate").lower() == "fused"
+
+
+def build_messages(inputs):
+    # The three agents' instructions over a single copy of the KPIs
+    avg, median, min_cost, max_cost = benefits_interpreter._kpis(inputs)
+    prompt = f"""
+Healthcare cost KPIs for one member cohort:
+
+- Average Cost: {avg}
+- Median Cost: {median}
+- Minimum Cost: {min_cost}
+- Maximum Cost: {max_cost}
+
+Write three short analyses of these numbers:
+1. benefit_summary: as a healthcare benefits specialist, what they suggest about how members use their benefits, whether access looks equitable or skewed, and how this could guide benefit redesign or communication.
+2. explanation: a 2-sentence analysis of any data quality anomalies or red flags.
+3. insights: as a business intelligence analyst, one non-obvious insight that would help improve healthcare cost efficiency or identify unusual patterns.
+
+Respond with only a JSON object matching this JSON schema:
+{json.dumps(NARRATIVE_SCHEMA)}
+"""
+    return [
+        {"role": "system", "content": "You are a healthcare cost analyst. You always answer with valid JSON."},
+        {"role": "user", "content": prompt}
+    ]
+
+
+def parse_response(text: str) -> dict:
+    body = text.strip()
+    # Models sometimes wrap JSON in a ```json fence despite being asked not to
+    if body.startswith("```"):
+        body = body.split("\n", 1)[-1].rsplit("```", 1)[0]
+    try:
+        payload = json.loads(body)
+        jsonschema.validate(payload, NARRATIVE_SCHEMA)
+    except (ValueError, jsonschema.ValidationError) as exc:
+        raise NarrativeParseError(f"Fused narrative response does not match the schema: {exc}") from exc
+    return payload
+
+
+def split_response(inputs, payload: dict) -> dict:
+    # Same dicts the per-agent run_* functions return, keyed by task.yaml step id
+    return {
+        "interpret_benefits": benefits_interpreter._insufficient(inputs)
+        or {"benefit_summary": payload["benefit_summary"].strip()},
+        "detect_anomalies": {
+            "anomaly_flags": anomaly_detector.detect_flags(inputs),
+            "explanation": payload["explanation"],
+        },
+        "generate_insights": insight_generator._insufficient(inputs) or {"insights": payload["insights"]},
+    }
+
+
+def _separate(inputs) -> dict:
+    return {
+        "interpret_benefits": benefits_interpreter.run_benefits_interpreter(inputs),
+        "detect_anomalies": anomaly_detector.run_anomaly_detector(inputs),
+        "generate_insights": insight_generator.run_insight_generator(inputs),
+    }
+
+
+def _generate(inputs) -> dict:
+    with span("narrative_fusion") as call:
+        text = get_client().chat(build_messages(inputs), model="gpt-4")
+        try:
+            result = split_response(inputs, parse_response(text))
+            call.set(mode="fused")
+        except NarrativeParseError as exc:
+            # One bad response costs three ordinary calls, never a missing card
+            call.set(mode="fallback", error=str(exc)[:200])
+            result = _separate(inputs)
+        return result
+
+
+_recent = LRUCache(max_entries=256, ttl=600)
+_inflight = {}
+_inflight_lock = threading.Lock()
+
+
+def run_fused_narratives(inputs) -> dict:
+    # Single-flight: concurrent callers with the same KPIs (the parallel narrative steps)
+    # wait on one LLM call, and later steps reuse its result
+    key = json.dumps(benefits_interpreter._kpis(inputs), default=str)
+    with _inflight_lock:
+        result = _recent.get(key)
+        if result is None:
+            future = _inflight.get(key)
+            owner = future is None
+            if owner:
+                future = _inflight[key] = Future()
+    if result is not None:
+        current_span().set(narrative="shared")
+        return result
+    if not owner:
+        current_span().set(narrative="coalesced")
+        return future.result()
+
+    try:
+        result = _generate(inputs)
+        _recent.put(key, result)
+        future.set_result(result)
+        return result
+    except BaseException as exc:
+        future.set_exception(exc)
+        raise
+    finally:
+        with _inflight_lock:
+            _inflight.pop(key, None)
+
+
+def fused_step(step: str, inputs) -> dict:
+    # A copy, so one step's caller cannot mutate what the others receive
+    return dict(run_fused_narratives(inputs)[step])
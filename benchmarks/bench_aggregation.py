@@ -0,0 +1,45 @@
+import numpy as np
+import pandas as pd
+
+from agents.cost_estimator.cohorts import cohort_filter
+from agents.cost_estimator.local_backend import LocalBackend
+from benchmarks.harness import measure, timed_result
+
+DEFAULT_SIZES = (10_000, 1_000_000, 10_000_000)
+COHORT = cohort_filter({"age_min": 25, "age_max": 60, "gender": "female", "region": "west", "visit_type": "emergency"})
+
+
+def synthetic_frame(rows: int, seed: int = 0) -> pd.DataFrame:
+    rng = np.random.default_rng(seed)
+    cost = np.round(rng.lognormal(mean=7.0, sigma=0.9, size=rows), 2)
+    insurance_share = rng.uniform(0.6, 1.0, size=rows)
+    return pd.DataFrame({
+        "age": rng.integers(0, 101, size=rows),
+        "gender": pd.Categorical.from_codes(rng.integers(0, 3, size=rows), ["Female", "Male", "Other"]),
+        "region": pd.Categorical.from_codes(rng.integers(0, 4, size=rows), ["Midwest", "Northeast", "South", "West"]),
+        "visit_type": pd.Categorical.from_codes(
+            rng.integers(0, 4, size=rows), ["Emergency", "Inpatient", "Outpatient", "Primary Care"]
+        ),
+        "cost": cost,
+        "insurance_paid": np.round(cost * insurance_share, 2),
+        "member_paid": np.round(cost * (1 - insurance_share), 2),
+    })
+
+
+def run(sizes=DEFAULT_SIZES, repeat: int = 20) -> dict:
+    results = {}
+    for rows in sizes:
+        frame = synthetic_frame(rows)
+        backend, results[f"aggregation.load[{rows}]"] = timed_result(lambda: LocalBackend(frame=frame))
+        del frame
+
+        # First median lookup builds the cost sketches; measure that separately
+        _, results[f"aggregation.sketch_build[{rows}]"] = timed_result(lambda: backend.cost_stats(COHORT))
+
+        results[f"aggregation.scan[{rows}]"] = measure(lambda: backend.scan_cost_stats(COHORT), repeat=repeat)
+        results[f"aggregation.indexed[{rows}]"] = measure(lambda: backend.cost_stats(COHORT), repeat=repeat * 10)
+        results[f"aggregation.percentiles[{rows}]"] = measure(
+            lambda: backend.cost_percentiles(COHORT), repeat=repeat * 10
+        )
+        del backend
+    return results
@@ -0,0 +1,15 @@
+import os
+
+from benchmarks.harness import measure
+from config.agent_executor import AgentExecutor
+
+TASK_PATH = os.path.join(os.path.dirname(__file__), "stub_task.yaml")
+INPUTS = {"age_min": 25, "age_max": 60, "gender": "female", "region": "west", "visit_type": "emergency"}
+
+
+def run(repeat: int = 200) -> dict:
+    results = {}
+    for label, kwargs in (("sequential", {"parallel": False}), ("parallel", {"max_workers": 4})):
+        executor = AgentExecutor(TASK_PATH, **kwargs)
+        results[f"executor.run[{label}]"] = measure(lambda: executor.run(INPUTS), repeat=repeat)
+    return results
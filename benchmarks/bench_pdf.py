@@ -0,0 +1,30 @@
+import io
+
+from benchmarks.bench_prompts import RESULTS
+from benchmarks.harness import measure, timed_result
+from streamlit_app.pdf_export import ReportCache, export_reports, generate_pdf_report, render_report
+
+LONG_RESULTS = dict(RESULTS, generate_insights={"insights": "Emergency visits drive the upper tail. " * 200})
+EXPORT_REPORTS = 100
+
+
+def _cohort_reports(count):
+    return [
+        (f"cohort_{i}", dict(LONG_RESULTS, estimate_cost=dict(RESULTS["estimate_cost"], avg_cost=i)))
+        for i in range(count)
+    ]
+
+
+def run(repeat: int = 50) -> dict:
+    # render_report bypasses the content-hash cache that generate_pdf_report consults
+    results = {
+        "pdf.generate[short]": measure(lambda: render_report(RESULTS), repeat=repeat),
+        "pdf.generate[long]": measure(lambda: render_report(LONG_RESULTS), repeat=repeat),
+        "pdf.generate[cached]": measure(lambda: generate_pdf_report(LONG_RESULTS), repeat=repeat),
+    }
+    reports = _cohort_reports(EXPORT_REPORTS)
+    stats, export = timed_result(lambda: export_reports(reports, io.BytesIO(), cache=ReportCache()))
+    results[f"pdf.export[{EXPORT_REPORTS}]"] = dict(
+        export, seconds=stats["seconds"], pages_per_second=stats["pages_per_second"]
+    )
+    return results
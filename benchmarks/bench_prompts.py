@@ -0,0 +1,23 @@
+from agents.anomaly_detector.agent import build_messages as anomaly_messages
+from agents.benefits_interpreter.agent import build_messages as benefits_messages
+from agents.insight_generator.agent import build_messages as insight_messages
+from agents.llm_reasoner.agent import LLMReasonerAgent
+from benchmarks.harness import measure
+from benchmarks.stub_agents import KPIS
+
+RESULTS = {
+    "estimate_cost": KPIS,
+    "interpret_benefits": {"benefit_summary": "Coverage is broad with moderate member cost share."},
+    "detect_anomalies": {"anomaly_flags": [], "explanation": "No anomalies detected."},
+    "generate_insights": {"insights": "Emergency visits drive the upper tail."},
+}
+
+
+def run(repeat: int = 5000) -> dict:
+    reasoner = LLMReasonerAgent()
+    return {
+        "prompts.benefits": measure(lambda: benefits_messages(KPIS), repeat=repeat),
+        "prompts.anomalies": measure(lambda: anomaly_messages(KPIS), repeat=repeat),
+        "prompts.insights": measure(lambda: insight_messages(KPIS), repeat=repeat),
+        "prompts.reasoner": measure(lambda: reasoner.build_messages({}, RESULTS), repeat=repeat),
+    }
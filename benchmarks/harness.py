@@ -0,0 +1,62 @@
+import gc
+import resource
+import statistics
+import sys
+import time
+
+
+def peak_rss_mb() -> float:
+    # High-water mark of the whole process, not of one case: run.py gives every suite (and every
+    # aggregation size) its own process, and each case also reports how far it raised the mark.
+    # ru_maxrss is KiB on Linux and bytes on macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+def _percentile(samples, q):
+    ordered = sorted(samples)
+    index = min(len(ordered) - 1, max(0, int(round(q * (len(ordered) - 1)))))
+    return ordered[index]
+
+
+def measure(fn, repeat: int = 50, warmup: int = 3, items_per_call: int = 1) -> dict:
+    peak_before = peak_rss_mb()
+    for _ in range(warmup):
+        fn()
+
+    gc_was_enabled = gc.isenabled()
+    gc.disable()
+    try:
+        samples = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            fn()
+            samples.append(time.perf_counter() - start)
+    finally:
+        if gc_was_enabled:
+            gc.enable()
+
+    total = sum(samples)
+    return {
+        "repeat": repeat,
+        "p50_ms": _percentile(samples, 0.50) * 1000,
+        "p95_ms": _percentile(samples, 0.95) * 1000,
+        "mean_ms": statistics.fmean(samples) * 1000,
+        "throughput_per_s": repeat * items_per_call / total if total else float("inf"),
+        "peak_rss_mb": peak_rss_mb(),
+        "peak_rss_growth_mb": peak_rss_mb() - peak_before,
+    }
+
+
+def timed(fn):
+    start = time.perf_counter()
+    value = fn()
+    return value, time.perf_counter() - start
+
+
+def timed_result(fn):
+    # (value, result) for one-shot cases, with the same memory fields as measure()
+    peak_before = peak_rss_mb()
+    value, seconds = timed(fn)
+    peak = peak_rss_mb()
+    return value, {"seconds": seconds, "peak_rss_mb": peak, "peak_rss_growth_mb": peak - peak_before}
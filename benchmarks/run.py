@@ -0,0 +1,106 @@
+# Usage: python -m benchmarks.run [--quick] [--only executor,aggregation] [--baseline benchmarks/results/<commit>.json]
+# No cloud credentials are needed: agents are stubbed and aggregation runs on synthetic in-memory data.
+# benchmarks/results/ is git-ignored; pass --output to keep a baseline somewhere else.
+
+import argparse
+import json
+import multiprocessing
+import os
+import platform
+import subprocess
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from benchmarks import bench_aggregation, bench_executor, bench_pdf, bench_prompts
+
+SUITES = {
+    "executor": bench_executor.run,
+    "aggregation": bench_aggregation.run,
+    "prompts": bench_prompts.run,
+    "pdf": bench_pdf.run,
+}
+RESULTS_DIR = os.path.join(os.path.dirname(__file__), "results")
+
+
+def _git_commit() -> str:
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def _isolated(suite, **kwargs) -> dict:
+    # A fresh interpreter per job, so its peak RSS is not an earlier suite's (or a larger size's)
+    with ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context("spawn")) as pool:
+        return pool.submit(SUITES[suite], **kwargs).result()
+
+
+def compare(current: dict, baseline: dict, threshold: float) -> list:
+    # Returns (name, baseline p50, current p50, ratio) for every p50 that got slower than allowed
+    regressions = []
+    for name, result in current["results"].items():
+        before = baseline["results"].get(name, {}).get("p50_ms")
+        after = result.get("p50_ms")
+        if before and after and after / before > 1 + threshold:
+            regressions.append((name, before, after, after / before))
+    return regressions
+
+
+def _memory(result) -> str:
+    return f"process peak {result['peak_rss_mb']:8.1f} MB (+{result['peak_rss_growth_mb']:.1f} MB here)"
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Run the DataSage component benchmarks.")
+    parser.add_argument("--only", default=",".join(SUITES), help="comma-separated suites to run")
+    parser.add_argument("--sizes", default=",".join(str(s) for s in bench_aggregation.DEFAULT_SIZES),
+                        help="row counts for the aggregation suite")
+    parser.add_argument("--quick", action="store_true", help="10K rows and fewer repeats")
+    parser.add_argument("--output", help="where to write the JSON results")
+    parser.add_argument("--baseline", help="previous results JSON to compare against")
+    parser.add_argument("--threshold", type=float, default=0.2, help="allowed p50 slowdown (0.2 = 20%%)")
+    args = parser.parse_args(argv)
+
+    sizes = (10_000,) if args.quick else tuple(int(s) for s in args.sizes.split(","))
+    results = {}
+    for suite in args.only.split(","):
+        print(f"▶ {suite}", file=sys.stderr)
+        if suite == "aggregation":
+            for rows in sizes:
+                results.update(_isolated(suite, sizes=(rows,), repeat=5 if args.quick else 20))
+        else:
+            results.update(_isolated(suite))
+
+    report = {
+        "commit": _git_commit(),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "results": results,
+    }
+
+    output = args.output or os.path.join(RESULTS_DIR, f"{report['commit']}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, "w") as f:
+        json.dump(report, f, indent=2)
+
+    for name, result in results.items():
+        if "p50_ms" in result:
+            print(f"{name:45s} p50 {result['p50_ms']:10.4f} ms  p95 {result['p95_ms']:10.4f} ms  "
+                  f"{result['throughput_per_s']:12.1f}/s  {_memory(result)}")
+        else:
+            print(f"{name:45s} {result['seconds']:10.4f} s  {_memory(result)}")
+    print(f"\n✅ Results saved to {output}")
+
+    if args.baseline:
+        with open(args.baseline, "r") as f:
+            regressions = compare(report, json.load(f), args.threshold)
+        for name, before, after, ratio in regressions:
+            print(f"⚠️ {name}: p50 {before:.4f} ms -> {after:.4f} ms ({ratio:.2f}x)")
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
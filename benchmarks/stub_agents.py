@@ -0,0 +1,19 @@
+# Zero-latency stand-ins for the task.yaml agents, used to isolate executor overhead
+
+KPIS = {"avg_cost": 2489.0, "median_cost": 2432.0, "min_cost": 101.5, "max_cost": 4990.0}
+
+
+def estimate(**kwargs):
+    return dict(KPIS)
+
+
+def benefits(estimate_cost=None, **kwargs):
+    return {"benefit_summary": "stub"}
+
+
+def anomalies(estimate_cost=None, **kwargs):
+    return {"anomaly_flags": [], "explanation": "stub"}
+
+
+def insights(estimate_cost=None, interpret_benefits=None, detect_anomalies=None, **kwargs):
+    return {"insights": "stub"}
@@ -1,29 +1,456 @@
+import asyncio
+import contextvars
+import importlib
+import inspect
+import json
+import multiprocessing
+import threading
 import yaml
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, ThreadPoolExecutor, wait
+
+from agents.common.llm_scheduler import LANE
+from agents.common.lru import LRUCache
+from config.checkpoints import CheckpointRun, _digest, checkpoint_store_from_env, function_identity
+from config.tracing import current_span, span, tracing
+
+STEP_EXECUTORS = ("thread", "process", "async")
+_FROM_ENV = object()
+# Finished step results and payload outputs run_many keeps for sharing with later payloads;
+# work still in flight is always shared
+RUN_MANY_MEMO_ENTRIES = 1024
+
+
+def _freeze(value) -> str:
+    # Hashable, order-independent form of a JSON-like payload
+    return json.dumps(value, sort_keys=True, default=str)
+
+
+def _import_attr(path: str):
+    module_path, _, name = path.partition(":")
+    return getattr(importlib.import_module(module_path), name)
+
+
+class _Pools:
+    # Worker pools for run_many, created on first use: threads for blocking I/O, a process
+    # pool for CPU-bound steps, and an event loop thread for async steps
+    def __init__(self, max_workers: int):
+        self.max_workers = max_workers
+        self.threads = ThreadPoolExecutor(max_workers=max_workers)
+        self._processes = None
+        self._loop = None
+        self._loop_thread = None
+
+    def processes(self) -> ProcessPoolExecutor:
+        if self._processes is None:
+            # spawn, not fork: the parent already has live worker threads
+            self._processes = ProcessPoolExecutor(
+                max_workers=self.max_workers, mp_context=multiprocessing.get_context("spawn")
+            )
+        return self._processes
+
+    def loop(self) -> asyncio.AbstractEventLoop:
+        if self._loop is None:
+            self._loop = asyncio.new_event_loop()
+            self._loop_thread = threading.Thread(target=self._loop.run_forever, daemon=True)
+            self._loop_thread.start()
+        return self._loop
+
+    def close(self):
+        self.threads.shutdown(cancel_futures=True)
+        if self._processes is not None:
+            self._processes.shutdown(cancel_futures=True)
+        if self._loop is not None:
+            self._loop.call_soon_threadsafe(self._loop.stop)
+            self._loop_thread.join()
+            self._loop.close()
+
+
+class _Job:
+    # One unique payload moving through the step graph inside run_many
+    def __init__(self, key: str, inputs: dict, steps: list):
+        self.key = key
+        self.inputs = inputs
+        self.indices = []
+        self.pending = {step["id"]: set(step.get("uses", [])) for step in steps}
+        self.keys = {}
+        self.results = {}
+        self.remaining = len(steps)
+        self.output = None
+
 
 class AgentExecutor:
-    def __init__(self, task_config_path: str):
+    def __init__(self, task_config_path: str, max_workers: int = 4, parallel: bool = True,
+                 tracer=None, checkpoint_store=_FROM_ENV, invalidate_downstream: bool = False):
         with open(task_config_path, "r") as f:
             self.task_config = yaml.safe_load(f)
 
-    def run(self, inputs: dict) -> dict:
+        self.max_workers = max_workers
+        self.parallel = parallel
+        # Optional config.tracing.Tracer; spans are no-ops when none is active
+        self.tracer = tracer
+        self.steps = self.task_config["steps"]
+        self.order = self._build_graph(self.steps)
+        self.step_keys = self._resolve_keys(self.steps)
+        self.data_versions = self._resolve_options(self.steps, "data_version")
+        self.batch_stats = {}
+        # Optional config.checkpoints store: run() skips steps whose checkpoint key is stored.
+        # invalidate_downstream drops the checkpoints built on a step result that has changed.
+        self.checkpoint_store = checkpoint_store_from_env() if checkpoint_store is _FROM_ENV else checkpoint_store
+        self.invalidate_downstream = invalidate_downstream
+        self.checkpoint_stats = {}
+        self._identities = {}
+        # Resolve every step's callable once, so a bad task.yaml fails here and not mid-run
+        if tracer is None:
+            self.functions = self._resolve_steps(self.steps)
+        else:
+            with tracing(tracer), span("executor.resolve", steps=len(self.steps)):
+                self.functions = self._resolve_steps(self.steps)
+
+    @staticmethod
+    def _build_graph(steps: list) -> list:
+        # Validate the `uses` graph up front and return a topological order
+        ids = [step["id"] for step in steps]
+        duplicates = sorted({i for i in ids if ids.count(i) > 1})
+        if duplicates:
+            raise ValueError(f"Duplicate step ids in task config: {duplicates}")
+
+        known = set(ids)
+        for step in steps:
+            missing = [use for use in step.get("uses", []) if use not in known]
+            if missing:
+                raise ValueError(f"Step '{step['id']}' uses unknown steps: {missing}")
+
+        remaining = {step["id"]: set(step.get("uses", [])) for step in steps}
+        order = []
+        while remaining:
+            ready = [i for i in ids if i in remaining and not remaining[i]]
+            if not ready:
+                raise ValueError(f"Dependency cycle between steps: {sorted(remaining)}")
+            for i in ready:
+                del remaining[i]
+                for deps in remaining.values():
+                    deps.discard(i)
+            order.extend(ready)
+        return order
+
+    @staticmethod
+    def _load_function(step: dict):
+        # Load function dynamically
+        try:
+            module = importlib.import_module(step["module"])
+        except ImportError as exc:
+            raise ValueError(f"Step '{step['id']}' module '{step['module']}' cannot be imported: {exc}") from exc
+
+        func = getattr(module, step["function"], None)
+        if not callable(func):
+            available = sorted(
+                name for name, value in vars(module).items()
+                if callable(value) and name.startswith("run")
+            )
+            raise ValueError(
+                f"Step '{step['id']}' names function '{step['function']}', which "
+                f"{step['module']} does not define (run* functions available: {available})"
+            )
+        return func
+
+    @classmethod
+    def _resolve_steps(cls, steps: list) -> dict:
+        functions = {}
+        for step in steps:
+            with span("import", step=step["id"], module=step["module"]):
+                functions[step["id"]] = cls._load_function(step)
+        return functions
+
+    @staticmethod
+    def _resolve_options(steps: list, option: str) -> dict:
+        # Step options naming a `module:function`, resolved once like the steps themselves
+        resolved = {}
+        for step in steps:
+            if option in step:
+                try:
+                    resolved[step["id"]] = _import_attr(step[option])
+                except (ImportError, AttributeError) as exc:
+                    raise ValueError(
+                        f"Step '{step['id']}' {option} '{step[option]}' cannot be resolved: {exc}"
+                    ) from exc
+        return resolved
+
+    @classmethod
+    def _resolve_keys(cls, steps: list) -> dict:
+        # Optional `key: module:function` maps a payload to what the step actually depends on
+        # (e.g. cohort_filter for estimate_cost); `key_inputs: [...]` names those inputs directly
+        for step in steps:
+            executor = step.get("executor", "thread")
+            if executor not in STEP_EXECUTORS:
+                raise ValueError(f"Step '{step['id']}' executor '{executor}' is not one of {STEP_EXECUTORS}")
+        return cls._resolve_options(steps, "key")
+
+    def _own_key(self, step: dict, inputs: dict):
+        # What a step reads from the payload itself
+        if step["id"] in self.step_keys:
+            return self.step_keys[step["id"]](inputs)
+        if "key_inputs" in step:
+            return _freeze({name: inputs.get(name) for name in step["key_inputs"]})
+        return _freeze(inputs)
+
+    def _step_key(self, step: dict, inputs: dict, job_keys: dict):
+        # Two payloads share a step result when its own key and every upstream key match
+        return (step["id"], self._own_key(step, inputs), tuple(job_keys[use] for use in step.get("uses", [])))
+
+    def _checkpoints(self, inputs: dict, refresh=()) -> CheckpointRun:
+        steps = {step["id"]: step for step in self.steps}
+        uses = {name: list(step.get("uses", [])) for name, step in steps.items()}
+        lineages = {}
+        for name in self.order:
+            step = steps[name]
+            if name not in self._identities:
+                # Hashed once: the loaded code does not change while this executor lives
+                self._identities[name] = function_identity(step, self.functions[name])
+            identity = self._identities[name]
+            lineages[name] = _digest([name, identity, self._own_key(step, inputs), [lineages[use] for use in uses[name]]])
+        descendants = {}
+        for name in reversed(self.order):
+            below = set()
+            for other in self.order:
+                if name in uses[other]:
+                    below |= {other} | descendants[other]
+            descendants[name] = below
+        # Steps marked `checkpoint: false` always run, but still record their result
+        refresh = set(refresh) | {name for name, step in steps.items() if step.get("checkpoint", True) is False}
+        # `data_version: module:function` steps read a backend; its version is part of their key
+        versions = {name: version() for name, version in self.data_versions.items()}
+        return CheckpointRun(self.checkpoint_store, lineages, uses, descendants,
+                             self.invalidate_downstream, refresh, versions)
+
+    @staticmethod
+    def _prepare_kwargs(step: dict, inputs: dict, results: dict) -> dict:
+        kwargs = inputs.copy()
+        for use in step.get("uses", []):
+            kwargs[use] = results.get(use)
+        return kwargs
+
+    def _run_step(self, step: dict, inputs: dict, results: dict, checkpoints: CheckpointRun = None):
+        if checkpoints is None:
+            return self._call(step, self._prepare_kwargs(step, inputs, results))
+        key = checkpoints.key(step["id"], results)
+        record = checkpoints.load(step["id"], key)
+        if record is not None:
+            with span(f"step:{step['id']}", module=step["module"], function=step["function"], checkpoint="hit"):
+                return record["result"]
+        result = self._call(step, self._prepare_kwargs(step, inputs, results))
+        checkpoints.save(step["id"], key, result)
+        return result
+
+    def _call(self, step: dict, kwargs: dict):
+        func = self.functions[step["id"]]
+        with span(f"step:{step['id']}", module=step["module"], function=step["function"]):
+            result = func(**kwargs)
+            if inspect.isawaitable(result):
+                result = asyncio.run(result)
+            return result
+
+    async def _acall(self, step: dict, kwargs: dict):
+        func = self.functions[step["id"]]
+        with span(f"step:{step['id']}", module=step["module"], function=step["function"]):
+            result = func(**kwargs)
+            if inspect.isawaitable(result):
+                result = await result
+            return result
+
+    def _submit(self, pools: _Pools, step: dict, kwargs: dict):
+        executor = step.get("executor", "thread")
+        func = self.functions[step["id"]]
+        if executor == "process":
+            # Runs outside this interpreter: no tracing spans, and kwargs/results must pickle
+            return pools.processes().submit(func, **kwargs)
+        context = contextvars.copy_context()
+        if LANE.get() is None:
+            # Batch LLM calls queue behind interactive ones unless the caller picked a lane
+            context.run(LANE.set, "batch")
+        if executor == "async" or inspect.iscoroutinefunction(func):
+            return context.run(asyncio.run_coroutine_threadsafe, self._acall(step, kwargs), pools.loop())
+        return pools.threads.submit(context.run, self._call, step, kwargs)
+
+    def run(self, inputs: dict, on_step=None, refresh=()) -> dict:
+        # on_step(step_id, result) is called on the calling thread as each step completes.
+        # With a checkpoint store, steps already checkpointed for these inputs are skipped
+        # (a failed run resumes where it stopped); step ids in `refresh` are recomputed.
+        if self.tracer is None:
+            return self._run(inputs, on_step, refresh)
+        with tracing(self.tracer):
+            return self._run(inputs, on_step, refresh)
+
+    def payload_key(self, inputs: dict) -> tuple:
+        # Payloads with equal keys produce equal results: every step's _step_key matches
+        keys = {}
+        steps = {step["id"]: step for step in self.steps}
+        for name in self.order:
+            keys[name] = self._step_key(steps[name], inputs, keys)
+        return tuple(keys[name] for name in self.order)
+
+    def _run(self, inputs: dict, on_step=None, refresh=()) -> dict:
+        parallel = self.parallel and self.max_workers > 1
+        checkpoints = None
+        if self.checkpoint_store is not None:
+            checkpoints = self._checkpoints(inputs, refresh)
+            self.checkpoint_stats = checkpoints.stats
+        with span("executor.run", parallel=parallel, steps=len(self.steps)):
+            try:
+                if not parallel:
+                    return self._run_sequential(inputs, on_step, checkpoints)
+                return self._run_parallel(inputs, on_step, checkpoints)
+            finally:
+                if checkpoints is not None:
+                    current_span().set(**{f"checkpoint_{k}": v for k, v in checkpoints.stats.items()})
+
+    def _run_sequential(self, inputs: dict, on_step=None, checkpoints: CheckpointRun = None) -> dict:
+        steps = {step["id"]: step for step in self.steps}
         results = {}
-        for step in self.task_config["steps"]:
-            name = step["id"]
-            module_path = step["module"]
-            function_name = step["function"]
-            uses = step.get("uses", [])
-
-            # Load function dynamically
-            parts = module_path.split(".")
-            module = __import__(".".join(parts[:-1]), fromlist=[parts[-1]])
-            agent_module = getattr(module, parts[-1])
-            func = getattr(agent_module, function_name)
-
-            # Prepare input
-            kwargs = inputs.copy()
-            for use in uses:
-                kwargs[use] = results.get(use)
-
-            results[name] = func(**kwargs)
-
-        return results
+        for name in self.order:
+            results[name] = self._run_step(steps[name], inputs, results, checkpoints)
+            if on_step is not None:
+                on_step(name, results[name])
+        return self._ordered(results)
+
+    def _run_parallel(self, inputs: dict, on_step=None, checkpoints: CheckpointRun = None) -> dict:
+        pending = {step["id"]: set(step.get("uses", [])) for step in self.steps}
+        steps = {step["id"]: step for step in self.steps}
+        results = {}
+        running = {}
+
+        with ThreadPoolExecutor(max_workers=self.max_workers) as pool:
+            while pending or running:
+                # Submit every step whose dependencies have all completed
+                for name in [i for i in self.order if i in pending and not pending[i]]:
+                    del pending[name]
+                    # Copy the context so worker threads inherit the active tracer and span
+                    context = contextvars.copy_context()
+                    future = pool.submit(context.run, self._run_step, steps[name], inputs, dict(results),
+                                         checkpoints)
+                    running[future] = name
+
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    name = running.pop(future)
+                    try:
+                        results[name] = future.result()
+                    except Exception:
+                        for other in running:
+                            other.cancel()
+                        raise
+                    if on_step is not None:
+                        on_step(name, results[name])
+                    for deps in pending.values():
+                        deps.discard(name)
+
+        return self._ordered(results)
+
+    def run_many(self, inputs_iter, key=None, max_pending: int = None, return_exceptions: bool = False,
+                 memo_entries: int = RUN_MANY_MEMO_ENTRIES):
+        # Streams (index, inputs, results) in completion order. Identical payloads run once and
+        # steps with equal keys (see _step_key) are shared across payloads; once finished, only
+        # the memo_entries most recent of each are kept, so memory does not grow with the batch.
+        # With return_exceptions, a failed payload yields its exception instead of aborting.
+        if self.tracer is None:
+            yield from self._run_many(inputs_iter, key, max_pending, return_exceptions, memo_entries)
+            return
+        with tracing(self.tracer):
+            yield from self._run_many(inputs_iter, key, max_pending, return_exceptions, memo_entries)
+
+    def _run_many(self, inputs_iter, key, max_pending, return_exceptions, memo_entries):
+        payload_key = key or _freeze
+        # Bound how many unique payloads are in flight so results start streaming immediately
+        max_pending = max_pending or self.max_workers * 4
+        steps = {step["id"]: step for step in self.steps}
+        stats = self.batch_stats = {"payloads": 0, "unique_payloads": 0, "step_calls": 0, "shared_steps": 0}
+        source = enumerate(inputs_iter)
+        exhausted = False
+        # In flight: payload key -> job and step key -> future. Finished: bounded LRUs
+        jobs = {}
+        running = {}
+        outputs = LRUCache(max_entries=memo_entries)
+        memo = LRUCache(max_entries=memo_entries)
+        active = 0
+        waiting = {}
+
+        def advance(job):
+            for name in [i for i in self.order if i in job.pending and not job.pending[i]]:
+                del job.pending[name]
+                step_key = self._step_key(steps[name], job.inputs, job.keys)
+                job.keys[name] = step_key
+                future = running.get(step_key) or memo.get(step_key)
+                if future is None:
+                    kwargs = self._prepare_kwargs(steps[name], job.inputs, job.results)
+                    future = running[step_key] = self._submit(pools, steps[name], kwargs)
+                    stats["step_calls"] += 1
+                else:
+                    stats["shared_steps"] += 1
+                waiting.setdefault(future, []).append((job, name))
+
+        pools = _Pools(self.max_workers)
+        with span("executor.run_many", steps=len(self.steps)) as batch_span:
+            try:
+                while True:
+                    while not exhausted and active < max_pending:
+                        try:
+                            index, inputs = next(source)
+                        except StopIteration:
+                            exhausted = True
+                            break
+                        stats["payloads"] += 1
+                        job_key = payload_key(inputs)
+                        output = outputs.get(job_key)
+                        if output is not None:
+                            yield index, inputs, output
+                            continue
+                        job = jobs.get(job_key)
+                        if job is None:
+                            job = jobs[job_key] = _Job(job_key, inputs, self.steps)
+                            stats["unique_payloads"] += 1
+                            active += 1
+                            advance(job)
+                        job.indices.append((index, inputs))
+
+                    if not waiting:
+                        break
+                    done, _ = wait(waiting, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        entries = waiting.pop(future)
+                        first, name = entries[0]
+                        step_key = first.keys[name]
+                        if running.get(step_key) is future:
+                            del running[step_key]
+                            memo.put(step_key, future)
+                        for job, name in entries:
+                            if not job.remaining:
+                                continue
+                            error = future.exception()
+                            if error is not None:
+                                if not return_exceptions:
+                                    raise error
+                                job.remaining = 0
+                                job.output = error
+                            else:
+                                job.results[name] = future.result()
+                                job.remaining -= 1
+                                for deps in job.pending.values():
+                                    deps.discard(name)
+                                if job.remaining:
+                                    advance(job)
+                                    continue
+                                job.output = self._ordered(job.results)
+                            active -= 1
+                            del jobs[job.key]
+                            outputs.put(job.key, job.output)
+                            for index, inputs in job.indices:
+                                yield index, inputs, job.output
+                            job.indices = []
+            finally:
+                for future in waiting:
+                    future.cancel()
+                pools.close()
+                batch_span.set(**stats)
+
+    def _ordered(self, results: dict) -> dict:
+        # Keep the result dict in task.yaml order regardless of completion order
+        return {step["id"]: results[step["id"]] for step in self.steps}
@@ -0,0 +1,258 @@
+import hashlib
+import inspect
+import json
+import os
+import threading
+import time
+
+# Checkpoints older than this are treated as missing and removed by prune()
+DEFAULT_MAX_AGE = float(os.getenv("DATASAGE_CHECKPOINT_MAX_AGE", str(7 * 24 * 3600)))
+
+
+def _jsonable(value):
+    # numpy scalars and arrays (the anomaly engine returns them) become plain JSON values
+    if hasattr(value, "tolist"):
+        return value.tolist()
+    return str(value)
+
+
+def _digest(value) -> str:
+    payload = json.dumps(value, sort_keys=True, separators=(",", ":"), default=_jsonable)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def result_hash(result) -> str:
+    return _digest(result)
+
+
+def _source_files(func) -> list:
+    # Every module and agent.yaml in the package defining func (its run_* functions, prompt
+    # builders and engines live beside it); just the file for a module outside a package
+    path = getattr(inspect.getmodule(func), "__file__", None)
+    if not path:
+        return []
+    directory = os.path.dirname(path)
+    if not os.path.exists(os.path.join(directory, "__init__.py")):
+        return [path]
+    return sorted(
+        os.path.join(directory, name) for name in os.listdir(directory) if name.endswith((".py", ".yaml"))
+    )
+
+
+def function_identity(step: dict, func) -> str:
+    # module:function plus a hash of the code behind it and the step's optional `version:`
+    # (for changes outside the package, e.g. a model switched in shared config), so a
+    # resumed run never reuses results computed by other code
+    digest = hashlib.sha256(str(step.get("version", "")).encode("utf-8"))
+    files = _source_files(func)
+    for path in files:
+        with open(path, "rb") as f:
+            digest.update(os.path.basename(path).encode("utf-8") + b"\0" + f.read())
+    if not files:
+        try:
+            digest.update(inspect.getsource(func).encode("utf-8"))
+        except (OSError, TypeError):
+            digest.update(getattr(func, "__qualname__", "").encode("utf-8"))
+    return f"{step['module']}:{step['function']}@{digest.hexdigest()[:16]}"
+
+
+class CheckpointStore:
+    # Maps checkpoint keys to records ({"step", "result", "created_at"}); get returns None when absent
+    def get(self, key: str):
+        raise NotImplementedError
+
+    def prune(self, max_age: float) -> int:
+        # Removes checkpoints older than max_age seconds and returns how many went
+        raise NotImplementedError
+
+    def put(self, key: str, record: dict):
+        raise NotImplementedError
+
+    def delete(self, key: str):
+        raise NotImplementedError
+
+    def clear(self):
+        raise NotImplementedError
+
+
+class MemoryCheckpointStore(CheckpointStore):
+    def __init__(self):
+        self._records = {}
+        self._lock = threading.Lock()
+
+    def get(self, key: str):
+        with self._lock:
+            return self._records.get(key)
+
+    def put(self, key: str, record: dict):
+        with self._lock:
+            self._records[key] = record
+
+    def delete(self, key: str):
+        with self._lock:
+            self._records.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._records.clear()
+
+    def prune(self, max_age: float) -> int:
+        cutoff = time.time() - max_age
+        with self._lock:
+            stale = [key for key, record in self._records.items() if record["created_at"] < cutoff]
+            for key in stale:
+                del self._records[key]
+        return len(stale)
+
+    def __len__(self):
+        return len(self._records)
+
+
+class LocalCheckpointStore(CheckpointStore):
+    # One JSON file per key; written beside the target and renamed, so a crash mid-write
+    # never leaves a truncated checkpoint behind. Checkpoints past max_age seconds are
+    # misses, and prune() deletes them.
+    def __init__(self, directory: str, max_age: float = None):
+        self.directory = directory
+        self.max_age = max_age
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, f"{key}.json")
+
+    def get(self, key: str):
+        try:
+            with open(self._path(key), "r") as f:
+                record = json.load(f)
+        except FileNotFoundError:
+            return None
+        if self.max_age and time.time() - record.get("created_at", 0) > self.max_age:
+            self.delete(key)
+            return None
+        return record
+
+    def put(self, key: str, record: dict):
+        path = self._path(key)
+        tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp, "w") as f:
+            json.dump(record, f, default=_jsonable)
+        os.replace(tmp, path)
+
+    def delete(self, key: str):
+        try:
+            os.remove(self._path(key))
+        except FileNotFoundError:
+            pass
+
+    def clear(self):
+        for name in os.listdir(self.directory):
+            if name.endswith(".json"):
+                os.remove(os.path.join(self.directory, name))
+
+    def prune(self, max_age: float = None) -> int:
+        # File times, so pruning a large directory never parses a checkpoint
+        max_age = self.max_age if max_age is None else max_age
+        if max_age is None:
+            raise ValueError("prune() needs a max_age when the store has none")
+        cutoff = time.time() - max_age
+        removed = 0
+        with os.scandir(self.directory) as entries:
+            for entry in entries:
+                if entry.name.endswith((".json", ".tmp")) and entry.stat().st_mtime < cutoff:
+                    try:
+                        os.remove(entry.path)
+                        removed += 1
+                    except FileNotFoundError:
+                        pass
+        return removed
+
+
+def checkpoint_store_from_env():
+    # DATASAGE_CHECKPOINT_DIR turns on step checkpoints for AgentExecutor
+    directory = os.getenv("DATASAGE_CHECKPOINT_DIR")
+    return LocalCheckpointStore(directory, max_age=DEFAULT_MAX_AGE or None) if directory else None
+
+
+class CheckpointRun:
+    # Checkpoint bookkeeping for one AgentExecutor.run payload.
+    #
+    # A step's lineage hash covers its id, function identity, own inputs and its upstream
+    # lineages; it is known before anything runs. Its checkpoint key adds the upstream
+    # result hashes. The store also keeps a head record per lineage pointing at the latest
+    # key and result hash, which is how a changed result finds the downstream checkpoints
+    # that were built on the old one.
+    def __init__(self, store: CheckpointStore, lineages: dict, uses: dict, descendants: dict,
+                 invalidate_downstream: bool = False, refresh=(), versions: dict = None):
+        self.store = store
+        self.lineages = lineages
+        # Data versions of the steps that read a backend; a new one misses under the same
+        # lineage, so the changed result still invalidates what was built on the old one
+        self.versions = versions or {}
+        self.uses = uses
+        self.descendants = descendants
+        self.invalidate_downstream = invalidate_downstream
+        self.refresh = set(refresh)
+        self.stats = {"hits": 0, "misses": 0, "invalidated": 0}
+        self._hashes = {}
+        self._lock = threading.Lock()
+
+    def _result_hash(self, name: str, results: dict) -> str:
+        with self._lock:
+            digest = self._hashes.get(name)
+        if digest is None:
+            digest = result_hash(results[name])
+            with self._lock:
+                self._hashes[name] = digest
+        return digest
+
+    def key(self, name: str, results: dict) -> str:
+        return _digest([
+            self.lineages[name], self.versions.get(name), [self._result_hash(use, results) for use in self.uses[name]],
+        ])
+
+    def load(self, name: str, key: str):
+        if name in self.refresh:
+            return None
+        record = self.store.get(key)
+        with self._lock:
+            self.stats["hits" if record is not None else "misses"] += 1
+        return record
+
+    def save(self, name: str, key: str, result):
+        digest = result_hash(result)
+        with self._lock:
+            self._hashes[name] = digest
+        self.store.put(key, {"step": name, "result": result, "created_at": time.time()})
+
+        head_key = f"head-{self.lineages[name]}"
+        head = self.store.get(head_key)
+        self.store.put(head_key, {"key": key, "result_hash": digest, "created_at": time.time()})
+        if not self.invalidate_downstream or head is None or head["result_hash"] == digest:
+            return
+        # The result moved: checkpoints computed from the old one are stale
+        if head["key"] != key:
+            self.store.delete(head["key"])
+        for downstream in self.descendants[name]:
+            stale = self.store.get(f"head-{self.lineages[downstream]}")
+            if stale is not None:
+                self.store.delete(stale["key"])
+                self.store.delete(f"head-{self.lineages[downstream]}")
+                with self._lock:
+                    self.stats["invalidated"] += 1
+
+
+def main(argv=None):
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Remove expired AgentExecutor step checkpoints.")
+    parser.add_argument("directory", nargs="?", default=os.getenv("DATASAGE_CHECKPOINT_DIR"))
+    parser.add_argument("--max-age", type=float, default=DEFAULT_MAX_AGE, help="seconds")
+    args = parser.parse_args(argv)
+    if not args.directory:
+        parser.error("pass a checkpoint directory or set DATASAGE_CHECKPOINT_DIR")
+    removed = LocalCheckpointStore(args.directory).prune(args.max_age)
+    print(f"✅ Removed {removed} checkpoints older than {args.max_age:g}s from {args.directory}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,161 @@
+import contextlib
+import contextvars
+import itertools
+import json
+import os
+import threading
+import time
+import uuid
+
+_active_tracer = contextvars.ContextVar("datasage_tracer", default=None)
+_current_span = contextvars.ContextVar("datasage_span", default=None)
+_span_ids = itertools.count(1)
+
+
+class Span:
+    __slots__ = ("name", "span_id", "parent_id", "trace_id", "start_us", "wall_ms", "cpu_ms",
+                 "thread_id", "attributes", "_wall_start", "_cpu_start")
+
+    def __init__(self, name: str, trace_id: str, parent_id: int = None, attributes: dict = None):
+        self.name = name
+        self.span_id = next(_span_ids)
+        self.parent_id = parent_id
+        self.trace_id = trace_id
+        self.attributes = attributes or {}
+        self.thread_id = threading.get_ident()
+        self.start_us = time.time_ns() // 1000
+        self.wall_ms = None
+        self.cpu_ms = None
+        self._wall_start = time.perf_counter()
+        self._cpu_start = time.thread_time()
+
+    def set(self, **attributes):
+        self.attributes.update(attributes)
+
+    def incr(self, key: str, amount: int = 1):
+        self.attributes[key] = self.attributes.get(key, 0) + amount
+
+    def finish(self):
+        self.wall_ms = (time.perf_counter() - self._wall_start) * 1000
+        self.cpu_ms = (time.thread_time() - self._cpu_start) * 1000
+
+    def to_dict(self) -> dict:
+        return {
+            "name": self.name,
+            "trace_id": self.trace_id,
+            "span_id": self.span_id,
+            "parent_id": self.parent_id,
+            "start_us": self.start_us,
+            "wall_ms": self.wall_ms,
+            "cpu_ms": self.cpu_ms,
+            "thread_id": self.thread_id,
+            "attributes": self.attributes,
+        }
+
+
+class _NullSpan:
+    # Returned when tracing is off so instrumented code never has to check
+    def set(self, **attributes):
+        pass
+
+    def incr(self, key: str, amount: int = 1):
+        pass
+
+
+NULL_SPAN = _NullSpan()
+_NULL_CONTEXT = contextlib.nullcontext(NULL_SPAN)
+
+
+class MemorySink:
+    def __init__(self):
+        self.spans = []
+        self._lock = threading.Lock()
+
+    def emit(self, span: Span):
+        with self._lock:
+            self.spans.append(span)
+
+
+class JsonLinesSink:
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+
+    def emit(self, span: Span):
+        line = json.dumps(span.to_dict(), default=str)
+        with self._lock, open(self.path, "a") as f:
+            f.write(line + "\n")
+
+
+def to_chrome_trace(spans) -> dict:
+    # Complete ("X") events, loadable in chrome://tracing or Perfetto
+    pid = os.getpid()
+    return {
+        "traceEvents": [
+            {
+                "name": span.name,
+                "cat": span.name.split(":")[0],
+                "ph": "X",
+                "ts": span.start_us,
+                "dur": int(span.wall_ms * 1000),
+                "pid": pid,
+                "tid": span.thread_id,
+                "args": dict(span.attributes, cpu_ms=span.cpu_ms, span_id=span.span_id,
+                             parent_id=span.parent_id),
+            }
+            for span in spans
+            if span.wall_ms is not None
+        ],
+        "displayTimeUnit": "ms",
+    }
+
+
+def write_chrome_trace(spans, path: str):
+    with open(path, "w") as f:
+        json.dump(to_chrome_trace(spans), f, default=str)
+
+
+class Tracer:
+    def __init__(self, sink=None):
+        self.sink = sink if sink is not None else MemorySink()
+        self.trace_id = uuid.uuid4().hex
+
+    @property
+    def spans(self) -> list:
+        return getattr(self.sink, "spans", [])
+
+    @contextlib.contextmanager
+    def span(self, name: str, **attributes):
+        parent = _current_span.get()
+        span = Span(name, self.trace_id, parent.span_id if parent else None, attributes)
+        token = _current_span.set(span)
+        try:
+            yield span
+        except BaseException as exc:
+            span.set(error=repr(exc))
+            raise
+        finally:
+            span.finish()
+            _current_span.reset(token)
+            self.sink.emit(span)
+
+
+def span(name: str, **attributes):
+    # A single ContextVar lookup when no tracer is active
+    tracer = _active_tracer.get()
+    if tracer is None:
+        return _NULL_CONTEXT
+    return tracer.span(name, **attributes)
+
+
+def current_span():
+    return _current_span.get() or NULL_SPAN
+
+
+@contextlib.contextmanager
+def tracing(tracer: Tracer):
+    token = _active_tracer.set(tracer)
+    try:
+        yield tracer
+    finally:
+        _active_tracer.reset(token)
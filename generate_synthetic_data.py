@@ -1,35 +1,196 @@
-import pandas as pd
+import argparse
+import os
+import sys
+import time
+
 import numpy as np
-import uuid
-import random
+import pandas as pd
 
-# Define all categories
+# Define all categories (with rough claim-mix weights)
 genders = ['Male', 'Female', 'Other']
+gender_weights = [0.48, 0.50, 0.02]
 regions = ['Northeast', 'Midwest', 'South', 'West']
+region_weights = [0.17, 0.21, 0.38, 0.24]
 visit_types = ['Emergency', 'Primary Care', 'Inpatient', 'Outpatient']
+visit_type_weights = [0.12, 0.50, 0.08, 0.30]
 ages = list(range(0, 101))  # Full age range 0 to 100
 
-# Generate robust combinations
-records = []
-for gender in genders:
-    for region in regions:
-        for visit_type in visit_types:
-            for age in ages:
-                cost = round(random.uniform(100, 5000), 2)
-                records.append({
-                    "member_id": str(uuid.uuid4()),
-                    "age": age,
-                    "gender": gender,
-                    "region": region,
-                    "visit_type": visit_type,
-                    "service_date": "2024-05-01",
-                    "cost": cost,
-                    "diagnosis_code": "E11.9",
-                    "insurance_paid": round(cost * random.uniform(0.6, 1.0), 2),
-                    "member_paid": round(cost * random.uniform(0.0, 0.4), 2)
-                })
-
-# Create DataFrame and save
-df = pd.DataFrame(records)
-df.to_csv("robust_healthcare_costs.csv", index=False)
-print("✅ Synthetic data saved to robust_healthcare_costs.csv")
+# Median cost and log-normal spread per visit type: long right tails, inpatient dominates
+visit_type_costs = {
+    'Emergency': (1400.0, 0.8),
+    'Primary Care': (180.0, 0.5),
+    'Inpatient': (9000.0, 0.9),
+    'Outpatient': (650.0, 0.7),
+}
+
+# ICD-10 codes with per-visit-type mix
+diagnosis_codes = ['E11.9', 'I10', 'J06.9', 'M54.5', 'R07.9', 'S52.501A', 'N39.0', 'Z00.00',
+                   'F41.1', 'J18.9', 'I21.9', 'O80']
+diagnosis_mix = {
+    'Emergency':    [0.03, 0.03, 0.10, 0.08, 0.22, 0.14, 0.10, 0.00, 0.05, 0.12, 0.10, 0.03],
+    'Primary Care': [0.16, 0.18, 0.16, 0.10, 0.02, 0.00, 0.06, 0.24, 0.08, 0.00, 0.00, 0.00],
+    'Inpatient':    [0.06, 0.04, 0.00, 0.03, 0.06, 0.10, 0.04, 0.00, 0.02, 0.22, 0.23, 0.20],
+    'Outpatient':   [0.14, 0.10, 0.04, 0.22, 0.06, 0.12, 0.08, 0.08, 0.12, 0.02, 0.02, 0.00],
+}
+
+# The first GRID_ROWS rows enumerate every gender x region x visit_type x age cell,
+# like the original generator, so every cohort has data even in small files
+GRID_SHAPE = (len(genders), len(regions), len(visit_types), len(ages))
+GRID_ROWS = int(np.prod(GRID_SHAPE))
+
+COLUMNS = ["member_id", "age", "gender", "region", "visit_type", "service_date",
+           "cost", "diagnosis_code", "insurance_paid", "member_paid"]
+
+
+def _uuid4_strings(rng, size):
+    # Random version-4 UUIDs formatted without a Python-level loop
+    raw = rng.integers(0, 256, size=(size, 16), dtype=np.uint8)
+    raw[:, 6] = (raw[:, 6] & 0x0F) | 0x40
+    raw[:, 8] = (raw[:, 8] & 0x3F) | 0x80
+    hexed = np.frombuffer(raw.tobytes().hex().encode("ascii"), dtype=np.uint8).reshape(size, 32)
+    out = np.full((size, 36), ord("-"), dtype=np.uint8)
+    for (src_start, src_end), dst_start in zip(((0, 8), (8, 12), (12, 16), (16, 20), (20, 32)),
+                                               (0, 9, 14, 19, 24)):
+        out[:, dst_start:dst_start + src_end - src_start] = hexed[:, src_start:src_end]
+    return out.view("S36").ravel().astype(str)
+
+
+def _sample_ages(rng, size):
+    # Adult-heavy age mix with a pediatric bump
+    adult = np.clip(np.rint(rng.normal(48, 19, size)), 18, 100)
+    child = rng.integers(0, 18, size)
+    return np.where(rng.random(size) < 0.18, child, adult).astype(np.int64)
+
+
+def generate_chunk(rng, start, size, start_date, end_date, grid=True):
+    index = np.arange(start, start + size)
+    gender = rng.choice(len(genders), size, p=gender_weights)
+    region = rng.choice(len(regions), size, p=region_weights)
+    visit_type = rng.choice(len(visit_types), size, p=visit_type_weights)
+    age = _sample_ages(rng, size)
+
+    if grid:
+        in_grid = index < GRID_ROWS
+        if in_grid.any():
+            g, r, v, a = np.unravel_index(index[in_grid], GRID_SHAPE)
+            gender[in_grid], region[in_grid], visit_type[in_grid], age[in_grid] = g, r, v, a
+
+    # Log-normal cost per visit type, scaled up with age
+    medians = np.array([visit_type_costs[v][0] for v in visit_types])[visit_type]
+    sigmas = np.array([visit_type_costs[v][1] for v in visit_types])[visit_type]
+    cost = medians * np.exp(sigmas * rng.standard_normal(size)) * (0.7 + 0.6 * (age / 100.0) ** 1.5)
+    cost = np.round(np.clip(cost, 25.0, None), 2)
+
+    insurance_share = np.clip(rng.beta(8, 2, size), 0.5, 1.0)
+    insurance_paid = np.round(cost * insurance_share, 2)
+    member_paid = np.round(cost - insurance_paid, 2)
+
+    diagnosis = np.empty(size, dtype=np.int64)
+    for code, name in enumerate(visit_types):
+        rows = visit_type == code
+        diagnosis[rows] = rng.choice(len(diagnosis_codes), int(rows.sum()), p=diagnosis_mix[name])
+
+    # Categorical columns keep chunk construction cheap; CSV writes them as plain text
+    dates = np.datetime_as_string(np.arange(start_date, end_date + 1, dtype="datetime64[D]"), unit="D")
+    service_date = rng.integers(0, len(dates), size)
+
+    return pd.DataFrame({
+        "member_id": _uuid4_strings(rng, size),
+        "age": age,
+        "gender": pd.Categorical.from_codes(gender, genders),
+        "region": pd.Categorical.from_codes(region, regions),
+        "visit_type": pd.Categorical.from_codes(visit_type, visit_types),
+        "service_date": pd.Categorical.from_codes(service_date, dates),
+        "cost": cost,
+        "diagnosis_code": pd.Categorical.from_codes(diagnosis, diagnosis_codes),
+        "insurance_paid": insurance_paid,
+        "member_paid": member_paid,
+    }, columns=COLUMNS)
+
+
+def generate_chunks(rows, seed=42, chunk_size=1_000_000, start_date="2024-01-01",
+                    end_date="2024-12-31", grid=True):
+    rng = np.random.default_rng(seed)
+    start, end = np.datetime64(start_date, "D"), np.datetime64(end_date, "D")
+    for offset in range(0, rows, chunk_size):
+        yield generate_chunk(rng, offset, min(chunk_size, rows - offset), start, end, grid)
+
+
+def _arrow_table(chunk):
+    import pyarrow as pa
+
+    return pa.Table.from_pandas(chunk, preserve_index=False)
+
+
+class CsvSink:
+    def __init__(self, path):
+        self.file = open(path, "wb")
+        self.file.write((",".join(COLUMNS) + "\n").encode())
+
+    def write(self, chunk):
+        import pyarrow as pa
+        import pyarrow.csv as pa_csv
+
+        # Arrow's CSV writer is several times faster than DataFrame.to_csv; nothing we emit needs quoting
+        table = _arrow_table(chunk)
+        table = table.cast(pa.schema([
+            pa.field(f.name, pa.string() if pa.types.is_dictionary(f.type) else f.type) for f in table.schema
+        ]))
+        pa_csv.write_csv(table, self.file, pa_csv.WriteOptions(include_header=False, quoting_style="none"))
+
+    def close(self):
+        self.file.close()
+
+
+class ParquetSink:
+    def __init__(self, path):
+        self.path = path
+        self.writer = None
+
+    def write(self, chunk):
+        import pyarrow.parquet as pq
+
+        table = _arrow_table(chunk)
+        if self.writer is None:
+            self.writer = pq.ParquetWriter(self.path, table.schema)
+        self.writer.write_table(table)
+
+    def close(self):
+        if self.writer is not None:
+            self.writer.close()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Generate synthetic healthcare cost claims.")
+    parser.add_argument("--rows", type=int, default=GRID_ROWS, help="number of rows to generate")
+    parser.add_argument("--seed", type=int, default=42, help="random seed (same seed, same file)")
+    parser.add_argument("--chunk-size", type=int, default=1_000_000, help="rows generated and written per chunk")
+    parser.add_argument("--output", default="robust_healthcare_costs.csv", help=".csv or .parquet path")
+    parser.add_argument("--format", choices=["csv", "parquet"], help="defaults to the output extension")
+    parser.add_argument("--start-date", default="2024-01-01")
+    parser.add_argument("--end-date", default="2024-12-31")
+    parser.add_argument("--no-grid", action="store_true",
+                        help="do not reserve the first rows for one row per cohort cell")
+    args = parser.parse_args(argv)
+
+    fmt = args.format or ("parquet" if args.output.endswith(".parquet") else "csv")
+    sink = ParquetSink(args.output) if fmt == "parquet" else CsvSink(args.output)
+
+    started = time.perf_counter()
+    written = 0
+    try:
+        for chunk in generate_chunks(args.rows, args.seed, args.chunk_size, args.start_date,
+                                     args.end_date, grid=not args.no_grid):
+            sink.write(chunk)
+            written += len(chunk)
+            print(f"  {written:,}/{args.rows:,} rows", file=sys.stderr)
+    finally:
+        sink.close()
+
+    elapsed = time.perf_counter() - started
+    size_mb = os.path.getsize(args.output) / 1e6
+    print(f"✅ Synthetic data saved to {args.output} ({written:,} rows, {size_mb:,.1f} MB, {elapsed:,.1f}s)")
+
+
+if __name__ == "__main__":
+    main()
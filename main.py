@@ -1,5 +1,6 @@
 from config.agent_executor import AgentExecutor
 import json
+import sys
 
 if __name__ == "__main__":
     # Example input payload
@@ -15,6 +16,16 @@ if __name__ == "__main__":
 
 
     executor = AgentExecutor("task.yaml")
+
+    if len(sys.argv) > 1:
+        # Batch mode: one JSON payload per line in, one JSON result per line out as each completes
+        with open(sys.argv[1]) as f:
+            payloads = (json.loads(line) for line in f if line.strip())
+            for index, payload, results in executor.run_many(payloads):
+                print(json.dumps({"index": index, "input": payload, "results": results}))
+        print(json.dumps({"batch_stats": executor.batch_stats}), file=sys.stderr)
+        sys.exit(0)
+
     results = executor.run(input_data)
 
     # Print results
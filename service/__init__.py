@@ -0,0 +1 @@
+from .server import AnalysisService, create_app
@@ -0,0 +1,176 @@
+import asyncio
+import json
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from aiohttp import web
+
+from agents.common.llm_client import get_client
+from config.agent_executor import AgentExecutor
+
+# Executions running at once, and how many more may wait for a worker before new
+# requests are turned away with 503 (identical requests join a running one for free)
+MAX_CONCURRENT = int(os.getenv("DATASAGE_SERVICE_MAX_CONCURRENT", "8"))
+MAX_QUEUED = int(os.getenv("DATASAGE_SERVICE_MAX_QUEUED", "32"))
+RETRY_AFTER_SECONDS = 1
+SERVICE = web.AppKey("service")
+
+
+def _line(payload: dict) -> bytes:
+    return (json.dumps(payload, default=str) + "\n").encode()
+
+
+class _Execution:
+    # One executor run shared by every request with the same payload key. Steps are kept
+    # as they complete, so a request that joins late replays them before waiting for more.
+    def __init__(self):
+        self.events = []
+        self.done = False
+        self.error = None
+        self._changed = asyncio.Event()
+
+    def publish(self, event: dict):
+        self.events.append(event)
+        self._changed.set()
+
+    def finish(self, error: BaseException = None):
+        self.done = True
+        self.error = error
+        self._changed.set()
+
+    async def follow(self):
+        sent = 0
+        while True:
+            while sent < len(self.events):
+                yield self.events[sent]
+                sent += 1
+            if self.done:
+                return
+            self._changed.clear()
+            await self._changed.wait()
+
+
+class AnalysisService:
+    def __init__(self, executor: AgentExecutor, max_concurrent: int = MAX_CONCURRENT,
+                 max_queued: int = MAX_QUEUED):
+        self.executor = executor
+        self.max_concurrent = max_concurrent
+        self.max_queued = max_queued
+        # AgentExecutor.run blocks, so each execution gets a worker thread
+        self.pool = ThreadPoolExecutor(max_workers=max_concurrent, thread_name_prefix="analysis")
+        self.inflight = {}
+        self.counters = {
+            "requests": 0, "executions": 0, "coalesced": 0, "rejected": 0,
+            "bad_requests": 0, "completed": 0, "failed": 0, "cancelled": 0,
+        }
+
+    def _start(self, key, inputs: dict) -> _Execution:
+        loop = asyncio.get_running_loop()
+        execution = self.inflight[key] = _Execution()
+        self.counters["executions"] += 1
+
+        def on_step(name, result):
+            loop.call_soon_threadsafe(execution.publish, {"step": name, "result": result})
+
+        def finished(future):
+            self.inflight.pop(key, None)
+            # Executions still queued are cancelled when the service shuts down; their
+            # followers get an error line instead of waiting forever
+            if future.cancelled():
+                self.counters["cancelled"] += 1
+                execution.finish(asyncio.CancelledError("the service is shutting down"))
+                return
+            error = future.exception()
+            self.counters["failed" if error else "completed"] += 1
+            execution.finish(error)
+
+        future = loop.run_in_executor(self.pool, lambda: self.executor.run(inputs, on_step=on_step))
+        future.add_done_callback(finished)
+        return execution
+
+    async def analyze(self, request: web.Request) -> web.StreamResponse:
+        self.counters["requests"] += 1
+        try:
+            inputs = await request.json()
+            if not isinstance(inputs, dict):
+                raise ValueError("the body must be a JSON object")
+            key = self.executor.payload_key(inputs)
+        except (TypeError, ValueError) as exc:
+            self.counters["bad_requests"] += 1
+            return web.json_response({"error": f"Invalid analysis request: {exc}"}, status=400)
+
+        execution = self.inflight.get(key)
+        coalesced = execution is not None
+        if coalesced:
+            self.counters["coalesced"] += 1
+        elif len(self.inflight) >= self.max_concurrent + self.max_queued:
+            # Shed load early; a load balancer can retry the request on another replica
+            self.counters["rejected"] += 1
+            return web.json_response(
+                {"error": "Analysis service is at capacity"}, status=503,
+                headers={"Retry-After": str(RETRY_AFTER_SECONDS)},
+            )
+        else:
+            execution = self._start(key, inputs)
+
+        started = time.perf_counter()
+        response = web.StreamResponse(headers={"Content-Type": "application/x-ndjson"})
+        await response.prepare(request)
+        # One JSON line per step as it completes, then a closing status line
+        async for event in execution.follow():
+            await response.write(_line(event))
+        if execution.error is not None:
+            await response.write(_line({"error": f"{type(execution.error).__name__}: {execution.error}"}))
+        else:
+            await response.write(_line({
+                "done": True, "coalesced": coalesced, "seconds": round(time.perf_counter() - started, 3),
+            }))
+        await response.write_eof()
+        return response
+
+    async def healthz(self, request: web.Request) -> web.Response:
+        return web.json_response({"status": "ok"})
+
+    def metrics(self) -> dict:
+        stats = dict(self.counters, inflight=len(self.inflight),
+                     max_concurrent=self.max_concurrent, max_queued=self.max_queued)
+        scheduler = get_client().scheduler
+        if scheduler is not None:
+            stats["llm"] = scheduler.stats()
+        return stats
+
+    async def metrics_handler(self, request: web.Request) -> web.Response:
+        return web.json_response(self.metrics())
+
+    async def close(self, app=None):
+        self.pool.shutdown(wait=False, cancel_futures=True)
+
+
+def create_app(executor: AgentExecutor = None, task_path: str = "task.yaml", **service_options) -> web.Application:
+    service = AnalysisService(executor or AgentExecutor(task_path), **service_options)
+    app = web.Application()
+    app[SERVICE] = service
+    app.router.add_post("/analyze", service.analyze)
+    app.router.add_get("/healthz", service.healthz)
+    app.router.add_get("/metrics", service.metrics_handler)
+    app.on_cleanup.append(service.close)
+    return app
+
+
+def main(argv=None):
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Serve the agent workflow over HTTP.")
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=int(os.getenv("PORT", "8080")))
+    parser.add_argument("--task", default="task.yaml")
+    parser.add_argument("--max-concurrent", type=int, default=MAX_CONCURRENT)
+    parser.add_argument("--max-queued", type=int, default=MAX_QUEUED)
+    args = parser.parse_args(argv)
+    app = create_app(task_path=args.task, max_concurrent=args.max_concurrent, max_queued=args.max_queued)
+    web.run_app(app, host=args.host, port=args.port)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,16 +1,88 @@
 import streamlit as st
+import asyncio
 import os
 import json
 from agents.cost_estimator.agent import run_cost_estimator
-from agents.benefits_interpreter.agent import run_benefits_interpreter
-from agents.anomaly_detector.agent import run_anomaly_detector
-from agents.insight_generator.agent import run_insight_generator
-import plotly.graph_objects as go
-import plotly.express as px
-import pandas as pd
+from agents.cost_estimator.backends import get_backend
+from agents.cost_estimator.cube import CubeUnavailableError, Prefetcher, load_cube, neighbor_inputs
+from agents.benefits_interpreter.agent import astream_benefits_interpreter
+from agents.anomaly_detector.agent import astream_anomaly_detector
+from agents.insight_generator.agent import astream_insight_generator
 
 st.set_page_config(page_title="DataSage ADK", layout="wide")
 
+DEFAULT_CATEGORIES = {
+    "gender": ["male", "female", "other"],
+    "region": ["northeast", "southeast", "southwest", "northwest"],
+    "visit_type": ["emergency", "routine", "urgent", "preventive"],
+}
+
+
+@st.cache_resource(max_entries=1)
+def _cohort_cube(data_version: str):
+    # One aggregation per data version; every filter change after that is served from memory.
+    # DATASAGE_CUBE_PATH keeps the cube on disk across restarts.
+    try:
+        return load_cube(get_backend(), os.getenv("DATASAGE_CUBE_PATH") or None)
+    except (FileNotFoundError, CubeUnavailableError):
+        # No data file or credentials, or a backend without a cube: per-request queries
+        return None
+
+
+def cohort_cube():
+    # The backend's data version is the cache key, so new data rebuilds the cube
+    try:
+        version = get_backend().data_version()
+    except FileNotFoundError:
+        return None
+    return _cohort_cube(json.dumps(version, default=str))
+
+
+@st.cache_resource
+def cohort_prefetcher():
+    return Prefetcher(run_cost_estimator)
+
+
+def prefetch_neighbors(inputs, categories):
+    # Only without a cube (which answers from memory anyway), and never against BigQuery,
+    # where every neighbour would be a billed job. Once per filter change, not per rerun.
+    try:
+        backend = get_backend()
+    except FileNotFoundError:
+        return
+    if backend.name == "bigquery" or st.session_state.get("prefetched_inputs") == inputs:
+        return
+    st.session_state["prefetched_inputs"] = inputs
+    cohort_prefetcher().submit(neighbor_inputs(inputs, categories))
+
+
+def estimate_cost(inputs):
+    cube = cohort_cube()
+    return cube.estimate(inputs) if cube is not None else run_cost_estimator(inputs)
+
+
+def insight_card(title, color, text):
+    return """
+        <div class='insight-card'>
+            <h4>{}</h4>
+            <p style='color: {};'>{}</p>
+        </div>
+    """.format(title, color, text)
+
+
+async def stream_card(placeholder, title, color, stream, key, pending, estimate):
+    placeholder.markdown(insight_card(title, color, pending), unsafe_allow_html=True)
+    result = {}
+    async for result in stream(estimate):
+        placeholder.markdown(insight_card(title, color, result.get(key) or pending), unsafe_allow_html=True)
+    return result
+
+
+async def stream_insight_cards(estimate, cards):
+    # The LLM calls run on the shared client's loop, so its pooled session outlives this rerun
+    return await asyncio.gather(*(stream_card(*card, estimate) for card in cards))
+
+
 # Enhanced UI with modern styling
 st.markdown("""
     <style>
@@ -52,6 +124,9 @@ st.markdown("""
     </div>
 """, unsafe_allow_html=True)
 
+cube = cohort_cube()
+categories = cube.categories if cube is not None else DEFAULT_CATEGORIES
+
 # Enhanced sidebar with agent status
 with st.sidebar:
     st.header("🎛️ Analysis Configuration")
@@ -60,11 +135,11 @@ with st.sidebar:
     with st.expander("👥 Patient Demographics", expanded=True):
         age_min = st.slider("Minimum Age", 0, 100, 25)
         age_max = st.slider("Maximum Age", 0, 100, 60)
-        gender = st.selectbox("Gender", ["male", "female", "other"])
+        gender = st.selectbox("Gender", categories["gender"])
     
     with st.expander("📍 Location & Service", expanded=True):
-        region = st.selectbox("Region", ["northeast", "southeast", "southwest", "northwest"])
-        visit_type = st.selectbox("Visit Type", ["emergency", "routine", "urgent", "preventive"])
+        region = st.selectbox("Region", categories["region"])
+        visit_type = st.selectbox("Visit Type", categories["visit_type"])
     
     st.markdown("---")
     st.subheader("🤖 Active Agents")
@@ -90,6 +165,17 @@ inputs = {
     "visit_type": visit_type
 }
 
+if cube is None:
+    # Warm the filter combinations one click away while the user looks at this one
+    prefetch_neighbors(inputs, categories)
+else:
+    with st.sidebar:
+        preview = cube.estimate(inputs)
+        st.markdown("---")
+        st.subheader("⚡ Cohort Preview")
+        st.metric("Members in Cohort", f"{preview.get('sample_size', 0):,}")
+        st.metric("Average Cost", f"${preview['avg_cost']:,.2f}")
+
 col1, col2 = st.columns([2, 1])
 with col1:
     run_button = st.button("🔄 Execute Agent Workflow", use_container_width=True)
@@ -98,8 +184,11 @@ with col2:
 
 if run_button or (auto_refresh and 'last_refresh' not in st.session_state):
     with st.spinner("🤖 Multi-Agent System Processing..."):
+        # Deferred until a workflow actually runs; plotly is slow to import
+        import plotly.graph_objects as go
+
         # Cost estimation agent
-        estimate = run_cost_estimator(inputs)
+        estimate = estimate_cost(inputs)
         
         if all(v == 0 for v in [estimate.get("avg_cost", 0), estimate.get("median_cost", 0)]):
             st.warning("⚠️ Insufficient data for selected criteria. Please adjust filters.")
@@ -165,37 +254,18 @@ if run_button or (auto_refresh and 'last_refresh' not in st.session_state):
                 st.plotly_chart(fig_breakdown, use_container_width=True)
 
         with tab2:
-            # Run analysis agents
-            benefits = run_benefits_interpreter(estimate)
-            anomalies = run_anomaly_detector(estimate)
-            insights = run_insight_generator(estimate)
-
             st.subheader("🎯 Multi-Agent Analysis")
             cols = st.columns(3)
-            
-            with cols[0]:
-                st.markdown("""
-                    <div class='insight-card'>
-                        <h4>💡 Benefits Analysis</h4>
-                        <p style='color: #1976D2;'>{}</p>
-                    </div>
-                """.format(benefits.get("benefit_summary", "Analysis pending...")), unsafe_allow_html=True)
-            
-            with cols[1]:
-                st.markdown("""
-                    <div class='insight-card'>
-                        <h4>🚨 Risk Analysis</h4>
-                        <p style='color: #D32F2F;'>{}</p>
-                    </div>
-                """.format(anomalies.get("explanation", "No anomalies detected.")), unsafe_allow_html=True)
-            
-            with cols[2]:
-                st.markdown("""
-                    <div class='insight-card'>
-                        <h4>📈 Cost Insights</h4>
-                        <p style='color: #388E3C;'>{}</p>
-                    </div>
-                """.format(insights.get("insights", "Processing insights...")), unsafe_allow_html=True)
+            cards = [
+                (cols[0].empty(), "💡 Benefits Analysis", "#1976D2", astream_benefits_interpreter,
+                 "benefit_summary", "Analysis pending..."),
+                (cols[1].empty(), "🚨 Risk Analysis", "#D32F2F", astream_anomaly_detector,
+                 "explanation", "No anomalies detected."),
+                (cols[2].empty(), "📈 Cost Insights", "#388E3C", astream_insight_generator,
+                 "insights", "Processing insights..."),
+            ]
+            # Run analysis agents concurrently, filling each card as tokens arrive
+            asyncio.run(stream_insight_cards(estimate, cards))
 
         with tab3:
             st.subheader("📊 Statistical Analysis")
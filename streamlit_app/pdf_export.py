@@ -1,7 +1,32 @@
 # streamlit_app/pdf_export.py
 
+import hashlib
+import json
+import multiprocessing
+import os
+import time
+import zipfile
+from concurrent.futures import FIRST_COMPLETED, Future, ProcessPoolExecutor, wait
+
 from fpdf import FPDF
 
+from agents.common.lru import LRUCache
+
+# Bump when the layout changes so cached PDFs are not reused across versions
+RENDER_VERSION = 2
+
+# Common non-latin-1 characters in LLM output, mapped to readable stand-ins instead of "?"
+_LATIN1_REPLACEMENTS = str.maketrans({
+    "\u2014": "-", "\u2013": "-", "\u2018": "'", "\u2019": "'", "\u201c": '"', "\u201d": '"',
+    "\u2026": "...", "\u2022": "-", "\u26a0": "!", "\ufe0f": "",
+})
+
+
+def to_latin1(value) -> str:
+    # The core fonts only cover latin-1; encode once per string, not per rendered line
+    return str(value).translate(_LATIN1_REPLACEMENTS).encode("latin-1", "replace").decode("latin-1")
+
+
 class PDF(FPDF):
     def header(self):
         self.set_font("Arial", "B", 14)
@@ -10,22 +35,17 @@ class PDF(FPDF):
     def chapter_title(self, title):
         self.set_font("Arial", "B", 12)
         self.set_fill_color(240, 240, 240)
-        clean_title = str(title).encode("latin-1", "replace").decode("latin-1")
-        self.cell(0, 10, clean_title, ln=True, fill=True)
+        self.cell(0, 10, to_latin1(title), ln=True, fill=True)
 
     def chapter_body(self, content_dict):
         self.set_font("Arial", "", 11)
         for key, value in content_dict.items():
-            try:
-                key_str = str(key).encode("latin-1", "replace").decode("latin-1")
-                value_str = str(value).encode("latin-1", "replace").decode("latin-1")
-                self.multi_cell(0, 8, f"{key_str}: {value_str}")
-            except Exception as e:
-                self.multi_cell(0, 8, f"{key}: [Encoding Error]")
+            self.multi_cell(0, 8, to_latin1(f"{key}: {value}"))
         self.ln()
 
 
-def generate_pdf_report(results: dict) -> bytes:
+def render_report(results: dict):
+    # Returns (pdf bytes, page count)
     pdf = PDF()
     pdf.set_auto_page_break(auto=True, margin=15)
     pdf.add_page()
@@ -36,18 +56,184 @@ def generate_pdf_report(results: dict) -> bytes:
         if isinstance(content, dict):
             pdf.chapter_body(content)
         else:
-            value_str = str(content).encode("latin-1", "replace").decode("latin-1")
             pdf.set_font("Arial", "", 11)
-            pdf.multi_cell(0, 8, value_str)
+            pdf.multi_cell(0, 8, to_latin1(content))
             pdf.ln()
 
-    return pdf.output(dest="S").encode("latin-1")
-
+    return pdf.output(dest="S").encode("latin-1"), pdf.page_no()
 
 
+def report_key(results: dict) -> str:
+    # Content hash: identical result sets render identical PDFs. Sections and fields render in
+    # insertion order, so the order is part of the content and keys are not sorted.
+    payload = json.dumps([RENDER_VERSION, results], default=str)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
 
 
+class ReportCache:
+    # Rendered PDFs by content hash: an in-memory LRU, optionally backed by a directory
+    def __init__(self, max_entries: int = 256, directory: str = None):
+        self.entries = LRUCache(max_entries=max_entries)
+        self.directory = directory
+        if directory:
+            os.makedirs(directory, exist_ok=True)
 
+    def _path(self, key):
+        return os.path.join(self.directory, f"{key}.pdf")
 
+    def get(self, key):
+        hit = self.entries.get(key)
+        if hit is None and self.directory:
+            try:
+                with open(self._path(key), "rb") as f:
+                    data = f.read()
+                with open(self._path(key) + ".pages") as f:
+                    hit = (data, int(f.read()))
+            except (FileNotFoundError, ValueError):
+                # No PDF, or one without its page count (e.g. a partial copy): a miss
+                return None
+            self.entries.put(key, hit)
+        return hit
+
+    def put(self, key, rendered):
+        self.entries.put(key, rendered)
+        if self.directory:
+            data, pages = rendered
+            # Page count first: a reader that finds the .pdf can rely on it being there
+            with open(self._path(key) + ".pages", "w") as f:
+                f.write(str(pages))
+            tmp = self._path(key) + ".tmp"
+            with open(tmp, "wb") as f:
+                f.write(data)
+            os.replace(tmp, self._path(key))
+
+
+_cache = ReportCache(directory=os.getenv("DATASAGE_PDF_CACHE_DIR") or None)
 
 
+def generate_pdf_report(results: dict) -> bytes:
+    key = report_key(results)
+    rendered = _cache.get(key)
+    if rendered is None:
+        rendered = render_report(results)
+        _cache.put(key, rendered)
+    return rendered[0]
+
+
+class _FileSink:
+    def __init__(self, directory):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+
+    def write(self, name, data):
+        with open(os.path.join(self.directory, name), "wb") as f:
+            f.write(data)
+
+    def close(self):
+        pass
+
+
+class _ZipSink:
+    # Accepts a path or any writable binary stream (e.g. an HTTP response); PDFs are already
+    # compressed, so entries are stored rather than deflated
+    def __init__(self, target):
+        self.zip = zipfile.ZipFile(target, "w", compression=zipfile.ZIP_STORED)
+
+    def write(self, name, data):
+        self.zip.writestr(name, data)
+
+    def close(self):
+        self.zip.close()
+
+
+def _file_name(name) -> str:
+    name = str(name).replace(os.sep, "_").replace("/", "_")
+    return name if name.endswith(".pdf") else f"{name}.pdf"
+
+
+def export_reports(reports, output, workers: int = None, cache: ReportCache = None,
+                   max_pending: int = None) -> dict:
+    # reports: iterable of (name, results). output: a directory, a *.zip path, or a binary
+    # stream to zip into. Each PDF is written as soon as it is rendered, so memory stays
+    # bounded by max_pending no matter how many reports there are.
+    cache = cache if cache is not None else _cache
+    workers = workers or os.cpu_count() or 1
+    max_pending = max_pending or workers * 4
+    if isinstance(output, (str, os.PathLike)) and not str(output).endswith(".zip"):
+        sink = _FileSink(output)
+    else:
+        sink = _ZipSink(output)
+
+    # deduplicated: reports that shared a render still in flight rather than a cached one
+    stats = {"reports": 0, "rendered": 0, "cache_hits": 0, "deduplicated": 0, "pages": 0, "bytes": 0}
+    started = time.perf_counter()
+    # future -> (key, file names); in_flight maps key -> future so duplicates attach to it
+    running = {}
+    in_flight = {}
+
+    def finish(names, rendered):
+        data, pages = rendered
+        for name in names:
+            sink.write(name, data)
+            stats["pages"] += pages
+            stats["bytes"] += len(data)
+
+    def drain(block):
+        if block:
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+        else:
+            done = [future for future in running if future.done()]
+        for future in done:
+            key, names = running.pop(future)
+            del in_flight[key]
+            rendered = future.result()
+            cache.put(key, rendered)
+            finish(names, rendered)
+
+    # With a single worker a pool only adds process start-up and pickling, so render inline
+    pool = None
+    if workers > 1:
+        pool = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn"))
+
+    def submit(results):
+        if pool is not None:
+            return pool.submit(render_report, results)
+        future = Future()
+        try:
+            future.set_result(render_report(results))
+        except Exception as exc:
+            future.set_exception(exc)
+        return future
+
+    try:
+        for name, results in reports:
+            stats["reports"] += 1
+            key = report_key(results)
+            rendered = cache.get(key)
+            if rendered is not None:
+                stats["cache_hits"] += 1
+                finish([_file_name(name)], rendered)
+                continue
+            if key in in_flight:
+                stats["deduplicated"] += 1
+                running[in_flight[key]][1].append(_file_name(name))
+                continue
+            while len(running) >= max_pending:
+                drain(block=True)
+            future = submit(results)
+            in_flight[key] = future
+            running[future] = (key, [_file_name(name)])
+            stats["rendered"] += 1
+            drain(block=False)
+        while running:
+            drain(block=True)
+    finally:
+        for future in running:
+            future.cancel()
+        if pool is not None:
+            pool.shutdown()
+        sink.close()
+
+    stats["seconds"] = time.perf_counter() - started
+    stats["pages_per_second"] = stats["pages"] / stats["seconds"] if stats["seconds"] else 0.0
+    return stats
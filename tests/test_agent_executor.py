@@ -0,0 +1,264 @@
+import os
+import textwrap
+import time
+
+import pytest
+
+from config.agent_executor import AgentExecutor
+
+STUB_AGENTS = '''
+import asyncio
+import os
+import time
+
+CALLS = []
+
+def estimate(**kwargs):
+    time.sleep(0.05)
+    return {"avg_cost": 100, "gender": kwargs["gender"]}
+
+def benefits(estimate_cost=None, **kwargs):
+    time.sleep(0.2)
+    return {"summary": f"benefits for {estimate_cost['avg_cost']}"}
+
+def anomalies(estimate_cost=None, **kwargs):
+    time.sleep(0.2)
+    return {"flags": []}
+
+def insights(estimate_cost=None, interpret_benefits=None, detect_anomalies=None, **kwargs):
+    return {"insight": interpret_benefits["summary"], "flags": detect_anomalies["flags"]}
+
+def broken(**kwargs):
+    raise RuntimeError("agent failed")
+
+def counted_estimate(**kwargs):
+    gender = gender_key(kwargs)
+    CALLS.append(gender)
+    time.sleep(0.01)
+    if gender == "bad":
+        raise RuntimeError("bad cohort")
+    return {"avg_cost": len(gender)}
+
+def gender_key(inputs):
+    return inputs["gender"].strip().lower()
+
+async def async_benefits(estimate_cost=None, **kwargs):
+    await asyncio.sleep(0.01)
+    return {"summary": f"benefits for {estimate_cost['avg_cost']}"}
+
+def square_in_process(estimate_cost=None, **kwargs):
+    return {"square": estimate_cost["avg_cost"] ** 2, "pid": os.getpid()}
+'''
+
+PIPELINE = """
+steps:
+  - id: estimate_cost
+    module: stub_executor_agents.steps
+    function: estimate
+  - id: interpret_benefits
+    module: stub_executor_agents.steps
+    function: benefits
+    uses: [estimate_cost]
+  - id: detect_anomalies
+    module: stub_executor_agents.steps
+    function: anomalies
+    uses: [estimate_cost]
+  - id: generate_insights
+    module: stub_executor_agents.steps
+    function: insights
+    uses: [estimate_cost, interpret_benefits, detect_anomalies]
+"""
+
+
+@pytest.fixture
+def write_task(tmp_path, monkeypatch):
+    package = tmp_path / "stub_executor_agents"
+    package.mkdir()
+    (package / "__init__.py").write_text("")
+    (package / "steps.py").write_text(STUB_AGENTS)
+    monkeypatch.syspath_prepend(str(tmp_path))
+
+    def _write(body):
+        path = tmp_path / "task.yaml"
+        path.write_text(textwrap.dedent(body))
+        return str(path)
+
+    return _write
+
+
+def test_parallel_matches_sequential(write_task):
+    path = write_task(PIPELINE)
+    inputs = {"gender": "female"}
+
+    sequential = AgentExecutor(path, parallel=False).run(inputs)
+    parallel = AgentExecutor(path, max_workers=4).run(inputs)
+
+    assert parallel == sequential
+    assert list(parallel) == ["estimate_cost", "interpret_benefits", "detect_anomalies", "generate_insights"]
+    assert parallel["generate_insights"] == {"insight": "benefits for 100", "flags": []}
+
+
+def test_independent_steps_run_concurrently(write_task):
+    executor = AgentExecutor(write_task(PIPELINE), max_workers=4)
+
+    start = time.perf_counter()
+    executor.run({"gender": "male"})
+    elapsed = time.perf_counter() - start
+
+    # estimate (0.05s) + the two 0.2s siblings side by side, not back to back
+    assert elapsed < 0.4
+
+
+def test_missing_dependency_is_rejected(write_task):
+    path = write_task("""
+        steps:
+          - id: interpret_benefits
+            module: stub_executor_agents.steps
+            function: benefits
+            uses: [estimate_cost]
+    """)
+    with pytest.raises(ValueError, match="unknown steps"):
+        AgentExecutor(path)
+
+
+def test_cycle_is_rejected(write_task):
+    path = write_task("""
+        steps:
+          - id: a
+            module: stub_executor_agents.steps
+            function: estimate
+            uses: [b]
+          - id: b
+            module: stub_executor_agents.steps
+            function: estimate
+            uses: [a]
+    """)
+    with pytest.raises(ValueError, match="cycle"):
+        AgentExecutor(path)
+
+
+def test_step_failure_propagates(write_task):
+    path = write_task("""
+        steps:
+          - id: estimate_cost
+            module: stub_executor_agents.steps
+            function: broken
+          - id: interpret_benefits
+            module: stub_executor_agents.steps
+            function: benefits
+            uses: [estimate_cost]
+    """)
+    with pytest.raises(RuntimeError, match="agent failed"):
+        AgentExecutor(path).run({"gender": "male"})
+
+
+def test_unknown_function_is_rejected_at_construction(write_task):
+    path = write_task("""
+        steps:
+          - id: estimate_cost
+            module: stub_executor_agents.steps
+            function: run
+    """)
+    with pytest.raises(ValueError, match="does not define"):
+        AgentExecutor(path)
+
+
+def test_repo_task_config_resolves():
+    executor = AgentExecutor(os.path.join(os.path.dirname(__file__), "..", "task.yaml"))
+    assert set(executor.functions) == {"estimate_cost", "interpret_benefits", "detect_anomalies", "generate_insights"}
+
+
+BATCH_PIPELINE = """
+steps:
+  - id: estimate_cost
+    module: stub_executor_agents.steps
+    function: counted_estimate
+    key: stub_executor_agents.steps:gender_key
+  - id: interpret_benefits
+    module: stub_executor_agents.steps
+    function: async_benefits
+    uses: [estimate_cost]
+    key_inputs: []
+  - id: detect_anomalies
+    module: stub_executor_agents.steps
+    function: anomalies
+    uses: [estimate_cost]
+"""
+
+
+def test_run_many_dedupes_and_shares_upstream_steps(write_task):
+    import stub_executor_agents.steps as stub_steps
+
+    stub_steps.CALLS.clear()
+    executor = AgentExecutor(write_task(BATCH_PIPELINE))
+    payloads = [
+        {"gender": "female"},
+        {"gender": "Female "},
+        {"gender": "male"},
+        {"gender": "female"},
+    ]
+
+    results = sorted(executor.run_many(payloads), key=lambda item: item[0])
+
+    assert [index for index, _, _ in results] == [0, 1, 2, 3]
+    assert [inputs for _, inputs, _ in results] == payloads
+    for index, inputs, output in results:
+        assert output == executor.run(inputs)
+    # "female" and "Female " normalise to one cohort; the exact duplicate never reaches a step
+    assert sorted(stub_steps.CALLS[:2]) == ["female", "male"]
+    assert executor.batch_stats["unique_payloads"] == 3
+    # interpret_benefits is keyed on estimate_cost only; detect_anomalies on the full payload
+    assert executor.batch_stats["step_calls"] == 2 + 2 + 3
+    assert executor.batch_stats["shared_steps"] == 2
+
+
+def test_run_many_failures(write_task):
+    executor = AgentExecutor(write_task(BATCH_PIPELINE))
+    payloads = [{"gender": "male"}, {"gender": "bad"}]
+
+    results = dict((index, output) for index, _, output in executor.run_many(payloads, return_exceptions=True))
+    assert isinstance(results[1], RuntimeError)
+    assert results[0]["interpret_benefits"] == {"summary": "benefits for 4"}
+
+    with pytest.raises(RuntimeError, match="bad cohort"):
+        list(executor.run_many(payloads))
+
+
+def test_run_many_memo_is_bounded(write_task):
+    import stub_executor_agents.steps as stub_steps
+
+    executor = AgentExecutor(write_task(BATCH_PIPELINE))
+    payloads = [{"gender": "ab"}, {"gender": "abc"}, {"gender": "ab"}]
+
+    stub_steps.CALLS.clear()
+    shared = [output for _, _, output in executor.run_many(payloads, max_pending=1)]
+    assert stub_steps.CALLS == ["ab", "abc"]
+
+    # With one entry kept, "ab" has been evicted by the time it repeats and runs again
+    stub_steps.CALLS.clear()
+    bounded = [output for _, _, output in executor.run_many(payloads, max_pending=1, memo_entries=1)]
+    assert stub_steps.CALLS == ["ab", "abc", "ab"]
+    assert bounded == shared
+    assert executor.batch_stats["unique_payloads"] == 3
+
+
+def test_run_many_process_steps(write_task):
+    path = write_task("""
+        steps:
+          - id: estimate_cost
+            module: stub_executor_agents.steps
+            function: counted_estimate
+          - id: square
+            module: stub_executor_agents.steps
+            function: square_in_process
+            uses: [estimate_cost]
+            executor: process
+    """)
+    executor = AgentExecutor(path, max_workers=2)
+
+    results = {inputs["gender"]: output for _, inputs, output in executor.run_many(
+        [{"gender": "ab"}, {"gender": "abc"}]
+    )}
+
+    assert results["abc"]["square"] == {"square": 9, "pid": results["abc"]["square"]["pid"]}
+    assert results["abc"]["square"]["pid"] != os.getpid()
@@ -1,3 +1,4 @@
+from agents.common.llm_client import LLMClient, StubBackend
 from agents.llm_reasoner.agent import LLMReasonerAgent
 
 mock_results = {
@@ -7,10 +8,15 @@ mock_results = {
     "detect_anomalies": {"anomaly_flag": False, "message": "No anomalies detected."}
 }
 
-agent = LLMReasonerAgent()
-summary = agent.summarize_outputs(mock_results)
-
-print("🧠 LLM Summary:\n")
-print(summary)
-
 
+def test_reasoner_summarizes_outputs():
+    # The reasoner's entry point is reason(); a stub backend stands in for the LLM
+    client = LLMClient(backend=StubBackend(reply="Three points and a recommendation."), cache=None)
+    try:
+        agent = LLMReasonerAgent(client=client)
+        prompt = agent.build_messages({}, mock_results)[-1]["content"]
+        assert "Estimated Cost: {'avg_cost': 2489, 'median_cost': 2432}" in prompt
+        assert "No anomalies detected." in prompt
+        assert agent.reason({}, mock_results) == {"summary": "Three points and a recommendation."}
+    finally:
+        client.close()
@@ -0,0 +1,142 @@
+import numpy as np
+import pandas as pd
+import pytest
+import yaml
+
+from agents.anomaly_detector import agent as anomaly_detector
+from agents.anomaly_detector import engine
+from agents.common.llm_client import LLMClient, StubBackend, set_client
+from agents.cost_estimator.cohorts import cohort_filter
+from agents.cost_estimator.local_backend import LocalBackend
+from config.agent_executor import AgentExecutor
+from config.checkpoints import MemoryCheckpointStore
+
+
+@pytest.fixture(scope="module")
+def frame():
+    rng = np.random.default_rng(5)
+    rows = 20_000
+    cost = np.round(rng.lognormal(6.5, 0.4, rows), 2)
+    insurance = np.round(cost * 0.8, 2)
+    frame = pd.DataFrame({
+        "age": rng.integers(0, 101, rows),
+        "gender": rng.choice(["Female", "Male"], rows),
+        "region": rng.choice(["West", "South"], rows),
+        "visit_type": rng.choice(["Emergency", "Outpatient"], rows),
+        "cost": cost,
+        "insurance_paid": insurance,
+        "member_paid": np.round(cost - insurance, 2),
+    })
+    # Injected problems: one huge claim, one claim whose splits do not add up,
+    # and a whole cell whose costs are ten times its peers'
+    frame.loc[0, ["age", "gender", "region", "visit_type", "cost", "insurance_paid", "member_paid"]] = (
+        42, "Female", "West", "Emergency", 250_000.0, 200_000.0, 50_000.0
+    )
+    frame.loc[1, "member_paid"] += 75.0
+    hot = (frame["gender"] == "Male") & (frame["region"] == "South") & (frame["visit_type"] == "Outpatient") \
+        & frame["age"].between(70, 79)
+    frame.loc[hot, ["cost", "insurance_paid", "member_paid"]] *= 10
+    return frame
+
+
+@pytest.fixture(scope="module")
+def scan(frame):
+    return engine.AnomalyScan(LocalBackend(frame=frame))
+
+
+def test_group_median_matches_pandas(frame, scan):
+    # Statistics run on log(cost), so a cell's median cost is exp(median(log cost))
+    cells = frame.assign(band=np.minimum(frame["age"] // 10, 9), log_cost=np.log(frame["cost"]))
+    expected = np.exp(cells.groupby(
+        [cells["gender"].str.lower(), cells["region"].str.lower(), cells["visit_type"].str.lower(), "band"]
+    )["log_cost"].median())
+    labels = [tuple(scan._cell_label(cell).values()) for cell in range(len(scan.cell_ids))]
+    actual = pd.Series(scan.cell_median_cost, index=labels)
+    for (gender, region, visit_type, band), value in expected.items():
+        age_band = "90+" if band == 9 else f"{band * 10}-{band * 10 + 9}"
+        assert actual[(gender, region, visit_type, age_band)] == pytest.approx(value)
+
+
+def test_row_flags(scan):
+    report = scan.report(max_rows=5)
+    top = report["row_flags"][0]
+    assert top["row"] == 0
+    assert {"robust_z", "iqr_fence"} <= set(top["reasons"])
+    assert report["flag_counts"]["paid_mismatch"] == 1
+    mismatch = scan.report(max_rows=len(scan.rows))["row_flags"]
+    assert [flag["row"] for flag in mismatch if "paid_mismatch" in flag["reasons"]] == [1]
+
+
+def test_cohort_flags_and_filtering(scan):
+    report = scan.report()
+    flagged = {(f["gender"], f["region"], f["visit_type"], f["age_band"]): f for f in report["cohort_flags"]}
+    assert "cost_level" in flagged[("male", "south", "outpatient", "70-79")]["reasons"]
+    assert report["cohort_flags"][0]["age_band"] == "70-79"
+
+    cohort = cohort_filter({"gender": "female", "region": "west", "visit_type": "emergency", "age_min": 40, "age_max": 45})
+    narrowed = scan.report(cohort)
+    assert narrowed["cells"] == 1
+    assert [flag["row"] for flag in narrowed["row_flags"]][:1] == [0]
+    assert narrowed["cohort_flags"] == []
+    assert engine.summarize(narrowed)["rows_scanned"] == narrowed["rows_scanned"]
+
+
+def test_scan_is_cached_per_backend(frame):
+    backend = LocalBackend(frame=frame)
+    assert engine.scan(backend) is engine.scan(backend)
+    assert engine.scan(backend, band_width=5) is not engine.scan(backend)
+
+
+def test_task_step_is_keyed_on_the_cohort(frame, tmp_path, monkeypatch):
+    # Two cohorts with the same KPIs (e.g. both empty) must not share a statistical report
+    package = tmp_path / "stub_anomaly_agents"
+    package.mkdir()
+    (package / "__init__.py").write_text("def estimate(**kwargs):\n    return {}\n")
+    monkeypatch.syspath_prepend(str(tmp_path))
+    with open("task.yaml") as f:
+        steps = {step["id"]: step for step in yaml.safe_load(f)["steps"]}
+    # The stub estimate reads no backend, so it has no data version either
+    steps["estimate_cost"].update(module="stub_anomaly_agents", function="estimate")
+    del steps["estimate_cost"]["data_version"]
+    path = tmp_path / "task.yaml"
+    path.write_text(yaml.safe_dump({"steps": [steps["estimate_cost"], steps["detect_anomalies"]]}))
+
+    backend = LocalBackend(frame=frame)
+    monkeypatch.setattr(anomaly_detector, "_row_source", lambda: backend)
+    llm = StubBackend()
+    set_client(LLMClient(backend=llm, cache=None))
+    try:
+        payloads = [
+            {"gender": "female", "region": "west", "visit_type": "emergency", "age_min": 40, "age_max": 45},
+            {"gender": "male", "region": "south", "visit_type": "outpatient", "age_min": 70, "age_max": 79},
+        ]
+        results = {index: output for index, _, output in AgentExecutor(str(path)).run_many(payloads)}
+        # Detection itself never calls the LLM
+        assert llm.calls == 0
+        # Checkpoint keys hash the upstream results, so the KPIs alone would collide there
+        monkeypatch.setenv("DATASAGE_ANOMALY_EXPLAIN", "on")
+        executor = AgentExecutor(str(path), checkpoint_store=MemoryCheckpointStore())
+        checkpointed = [executor.run(payload) for payload in payloads]
+        assert llm.calls == len(payloads)
+    finally:
+        set_client(None)
+
+    for index, payload in enumerate(payloads):
+        expected = anomaly_detector.run_statistical_anomalies(payload)
+        assert results[index]["detect_anomalies"] == {"anomaly_flags": ["zero_extremes"], "explanation": None,
+                                                     "statistical": expected}
+        assert dict(checkpointed[index]["detect_anomalies"]["statistical"], explanation=None) == expected
+        # The explanation prompt is the compact summary, not the KPIs
+        assert checkpointed[index]["detect_anomalies"]["explanation"].startswith("[stub:gpt-4] A statistical scan")
+    assert results[0]["detect_anomalies"]["statistical"] != results[1]["detect_anomalies"]["statistical"]
+
+
+def test_scan_without_valid_rows(frame):
+    empty = engine.AnomalyScan(LocalBackend(frame=frame.iloc[:0]))
+    assert empty.report() == {
+        "rows_scanned": 0, "cells": 0, "flag_counts": dict.fromkeys(engine.ROW_REASONS, 0),
+        "row_flags": [], "cohort_flags": [],
+    }
+    # Every row with an unknown category: nothing to group, nothing flagged
+    report = engine.AnomalyScan(LocalBackend(frame=frame.head(100).assign(gender=np.nan))).report()
+    assert (report["rows_scanned"], report["row_flags"], report["cohort_flags"]) == (0, [], [])
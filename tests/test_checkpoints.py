@@ -0,0 +1,228 @@
+import importlib
+import os
+import textwrap
+import time
+
+import pytest
+
+from config.agent_executor import AgentExecutor
+from config.checkpoints import LocalCheckpointStore, MemoryCheckpointStore, function_identity
+from config.tracing import Tracer
+
+STUB_AGENTS = '''
+CALLS = []
+STATE = {"fail": False, "rows": 100, "data_version": "v1"}
+
+def data_version():
+    return STATE["data_version"]
+
+def load(region=None, **kwargs):
+    CALLS.append("load")
+    return {"region": region, "rows": STATE["rows"]}
+
+def stats(load_data=None, **kwargs):
+    CALLS.append("stats")
+    return {"mean": load_data["rows"] / 4}
+
+def narrate(stats=None, **kwargs):
+    CALLS.append("narrate")
+    if STATE["fail"]:
+        raise RuntimeError("LLM unavailable")
+    return f"mean {stats['mean']}"
+
+def chart(stats=None, **kwargs):
+    CALLS.append("chart")
+    return [stats["mean"]]
+'''
+
+TASK = """
+steps:
+  - id: load_data
+    module: stub_checkpoint_agents.steps
+    function: load
+  - id: stats
+    module: stub_checkpoint_agents.steps
+    function: stats
+    uses: [load_data]
+  - id: {last}
+    module: stub_checkpoint_agents.steps
+    function: {last}
+    uses: [stats]
+"""
+
+
+@pytest.fixture
+def steps(tmp_path, monkeypatch):
+    package = tmp_path / "stub_checkpoint_agents"
+    package.mkdir()
+    (package / "__init__.py").write_text("")
+    (package / "steps.py").write_text(STUB_AGENTS)
+    monkeypatch.syspath_prepend(str(tmp_path))
+    import stub_checkpoint_agents.steps as module
+    yield module
+    module.CALLS.clear()
+    module.STATE.update(fail=False, rows=100, data_version="v1")
+
+
+@pytest.fixture
+def task(tmp_path):
+    def _task(last="narrate"):
+        path = tmp_path / f"task_{last}.yaml"
+        path.write_text(textwrap.dedent(TASK.format(last=last)))
+        return str(path)
+    return _task
+
+
+@pytest.mark.parametrize("parallel", [False, True])
+def test_failed_run_resumes_from_checkpoints(steps, task, tmp_path, parallel):
+    store = LocalCheckpointStore(str(tmp_path / "checkpoints"))
+    steps.STATE["fail"] = True
+    with pytest.raises(RuntimeError):
+        AgentExecutor(task(), parallel=parallel, checkpoint_store=store).run({"region": "north"})
+    assert steps.CALLS == ["load", "stats", "narrate"]
+
+    steps.CALLS.clear()
+    steps.STATE["fail"] = False
+    tracer = Tracer()
+    executor = AgentExecutor(task(), parallel=parallel, checkpoint_store=store, tracer=tracer)
+    results = executor.run({"region": "north"})
+
+    assert steps.CALLS == ["narrate"]
+    assert results == {"load_data": {"region": "north", "rows": 100}, "stats": {"mean": 25.0},
+                       "narrate": "mean 25.0"}
+    assert executor.checkpoint_stats == {"hits": 2, "misses": 1, "invalidated": 0}
+    run_span = next(s for s in tracer.spans if s.name == "executor.run")
+    assert run_span.attributes["checkpoint_hits"] == 2
+    assert [s.attributes.get("checkpoint") for s in tracer.spans if s.name.startswith("step:")].count("hit") == 2
+
+    # Other inputs get their own checkpoints
+    steps.CALLS.clear()
+    executor.run({"region": "south"})
+    assert steps.CALLS == ["load", "stats", "narrate"]
+
+
+def test_overlapping_tasks_share_checkpoints(steps, task):
+    store = MemoryCheckpointStore()
+    AgentExecutor(task("narrate"), checkpoint_store=store).run({"region": "north"})
+    steps.CALLS.clear()
+    results = AgentExecutor(task("chart"), checkpoint_store=store).run({"region": "north"})
+    assert steps.CALLS == ["chart"]
+    assert results["chart"] == [25.0]
+
+
+def test_refresh_and_downstream_invalidation(steps, task):
+    store = MemoryCheckpointStore()
+    executor = AgentExecutor(task(), checkpoint_store=store, invalidate_downstream=True)
+    executor.run({"region": "north"})
+    stored = len(store)
+
+    # Same upstream result: the refreshed step reruns and everything below is reused
+    steps.CALLS.clear()
+    executor.run({"region": "north"}, refresh=["load_data"])
+    assert steps.CALLS == ["load"]
+    assert len(store) == stored
+
+    # The source changed: the old downstream checkpoints are dropped, not left to pile up
+    steps.CALLS.clear()
+    steps.STATE["rows"] = 200
+    results = executor.run({"region": "north"}, refresh=["load_data"])
+    assert steps.CALLS == ["load", "stats", "narrate"]
+    assert results["narrate"] == "mean 50.0"
+    assert executor.checkpoint_stats["invalidated"] == 2
+    assert len(store) == stored
+
+
+def test_disabled_and_opt_out(steps, task, tmp_path, monkeypatch):
+    monkeypatch.delenv("DATASAGE_CHECKPOINT_DIR", raising=False)
+    assert AgentExecutor(task()).checkpoint_store is None
+    monkeypatch.setenv("DATASAGE_CHECKPOINT_DIR", str(tmp_path / "env"))
+    assert isinstance(AgentExecutor(task()).checkpoint_store, LocalCheckpointStore)
+
+    path = tmp_path / "task_opt_out.yaml"
+    path.write_text(textwrap.dedent(TASK.format(last="narrate")) + "    checkpoint: false\n")
+    executor = AgentExecutor(str(path), checkpoint_store=MemoryCheckpointStore())
+    executor.run({"region": "north"})
+    steps.CALLS.clear()
+    executor.run({"region": "north"})
+    assert steps.CALLS == ["narrate"]
+
+
+def test_function_identity_tracks_source(tmp_path, monkeypatch):
+    package = tmp_path / "stub_identity"
+    package.mkdir()
+    (package / "__init__.py").write_text("def step():\n    return 1\n")
+    monkeypatch.syspath_prepend(str(tmp_path))
+    import stub_identity
+
+    step = {"module": "stub_identity", "function": "step"}
+    before = function_identity(step, stub_identity.step)
+    assert function_identity(step, stub_identity.step) == before
+    assert before.startswith("stub_identity:step@")
+
+    (package / "__init__.py").write_text("def step():\n    return 20\n")
+    importlib.reload(stub_identity)
+    assert function_identity(step, stub_identity.step) != before
+
+
+def test_editing_a_helper_invalidates_checkpoints(tmp_path, monkeypatch):
+    package = tmp_path / "stub_helper_agents"
+    package.mkdir()
+    (package / "__init__.py").write_text("")
+    (package / "prompts.py").write_text("PROMPT = 'v1'\n")
+    (package / "steps.py").write_text("from stub_helper_agents import prompts\n\ndef run(**kwargs):\n"
+                                      "    return prompts.PROMPT\n")
+    monkeypatch.syspath_prepend(str(tmp_path))
+    path = tmp_path / "task.yaml"
+    path.write_text("steps:\n  - id: narrate\n    module: stub_helper_agents.steps\n    function: run\n")
+    store = MemoryCheckpointStore()
+    assert AgentExecutor(str(path), checkpoint_store=store).run({})["narrate"] == "v1"
+
+    # Only the prompt module changes; the step's own function is untouched
+    (package / "prompts.py").write_text("PROMPT = 'v2'\n")
+    import stub_helper_agents.prompts
+    importlib.reload(stub_helper_agents.prompts)
+    executor = AgentExecutor(str(path), checkpoint_store=store)
+    assert executor.run({})["narrate"] == "v2"
+    assert executor.checkpoint_stats["hits"] == 0
+
+    # A declared version covers changes outside the package
+    path.write_text(path.read_text() + "    version: 2\n")
+    executor = AgentExecutor(str(path), checkpoint_store=store)
+    executor.run({})
+    assert executor.checkpoint_stats["hits"] == 0
+
+
+def test_data_version_is_part_of_the_key(steps, task, tmp_path):
+    path = tmp_path / "task_versioned.yaml"
+    path.write_text(textwrap.dedent(TASK.format(last="narrate")).replace(
+        "    function: load\n", "    function: load\n    data_version: stub_checkpoint_agents.steps:data_version\n"
+    ))
+    executor = AgentExecutor(str(path), checkpoint_store=MemoryCheckpointStore(), invalidate_downstream=True)
+    executor.run({"region": "north"})
+    steps.CALLS.clear()
+    executor.run({"region": "north"})
+    assert steps.CALLS == []
+
+    # New data reruns the reader; an unchanged result still lets everything below be reused
+    steps.STATE["data_version"] = "v2"
+    executor.run({"region": "north"})
+    assert steps.CALLS == ["load"]
+    steps.CALLS.clear()
+    steps.STATE.update(data_version="v3", rows=200)
+    assert executor.run({"region": "north"})["narrate"] == "mean 50.0"
+    assert steps.CALLS == ["load", "stats", "narrate"]
+    assert executor.checkpoint_stats["invalidated"] == 2
+
+
+def test_expired_checkpoints_are_misses_and_pruned(tmp_path):
+    store = LocalCheckpointStore(str(tmp_path), max_age=60)
+    store.put("fresh", {"step": "a", "result": 1, "created_at": time.time()})
+    store.put("stale", {"step": "a", "result": 2, "created_at": time.time() - 120})
+    assert store.get("fresh")["result"] == 1
+    assert store.get("stale") is None
+    assert not os.path.exists(tmp_path / "stale.json")
+
+    store.put("old", {"step": "a", "result": 3, "created_at": time.time()})
+    os.utime(tmp_path / "old.json", (time.time() - 120, time.time() - 120))
+    assert store.prune() == 1
+    assert sorted(os.listdir(tmp_path)) == ["fresh.json"]
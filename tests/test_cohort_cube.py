@@ -0,0 +1,117 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from agents.cost_estimator.backends import DataBackend
+from agents.cost_estimator.cohorts import cohort_filter
+from agents.cost_estimator.cube import CohortCube, CubeUnavailableError, Prefetcher, load_cube, neighbor_inputs
+from agents.cost_estimator.kpi_cache import CachedBackend
+from agents.cost_estimator.local_backend import LocalBackend
+from agents.cost_estimator.queries import cube_query
+
+INPUTS = {"age_min": 25, "age_max": 60, "gender": "female", "state": "west", "visit_type": "outpatient"}
+
+
+@pytest.fixture(scope="module")
+def backend():
+    rng = np.random.default_rng(11)
+    rows = 30_000
+    cost = np.round(rng.lognormal(7, 0.5, rows), 2)
+    insurance = np.round(cost * rng.uniform(0.5, 0.9, rows), 2)
+    return LocalBackend(frame=pd.DataFrame({
+        "age": rng.integers(0, 101, rows),
+        "gender": rng.choice(["Female", "Male"], rows),
+        "region": rng.choice(["West", "South", "Midwest"], rows),
+        "visit_type": rng.choice(["Outpatient", "Inpatient"], rows),
+        "cost": cost,
+        "insurance_paid": insurance,
+        "member_paid": np.round(cost - insurance, 2),
+    }))
+
+
+@pytest.fixture(scope="module")
+def cube(backend):
+    return load_cube(CachedBackend(backend))
+
+
+def assert_matches_scan(stats, expected):
+    assert stats["sample_size"] == expected["sample_size"]
+    for key in ("avg_cost", "min_cost", "max_cost", "std_dev", "insurance_coverage_ratio", "member_burden_ratio"):
+        assert stats[key] == pytest.approx(expected[key])
+    # The median is merged from 21 points per age cell
+    assert stats["median_cost"] == pytest.approx(expected["median_cost"], rel=0.03)
+
+
+@pytest.mark.parametrize("age_min, age_max", [(25, 60), (0, 100), (42, 42)])
+def test_cube_matches_full_scan(backend, cube, age_min, age_max):
+    inputs = dict(INPUTS, age_min=age_min, age_max=age_max)
+    assert_matches_scan(cube.estimate(inputs), backend.scan_cost_stats(cohort_filter(inputs)))
+
+
+def test_unknown_cohort_is_empty(cube):
+    assert cube.estimate(dict(INPUTS, state="northeast")) == {"avg_cost": 0, "median_cost": 0, "min_cost": 0, "max_cost": 0}
+    assert cube.estimate(dict(INPUTS, age_min=70, age_max=20))["avg_cost"] == 0
+
+
+def test_cube_from_warehouse_rows(backend, cube):
+    # Rows shaped like queries.cube_query's output, one per non-empty cell
+    frame = pd.DataFrame({
+        "gender": np.array(cube.categories["gender"])[backend.codes["gender"]],
+        "region": np.array(cube.categories["region"])[backend.codes["region"]],
+        "visit_type": np.array(cube.categories["visit_type"])[backend.codes["visit_type"]],
+        "age": backend.age,
+        "cost": backend.cost,
+        "insurance_paid": backend.insurance_paid,
+        "member_paid": backend.member_paid,
+    })
+    rows = []
+    for (gender, region, visit_type, age), cell in frame.groupby(["gender", "region", "visit_type", "age"]):
+        rows.append({
+            "gender": gender, "region": region, "visit_type": visit_type, "age": age,
+            "count": len(cell), "cost_sum": cell["cost"].sum(), "cost_sumsq": (cell["cost"] ** 2).sum(),
+            "cost_min": cell["cost"].min(), "cost_max": cell["cost"].max(),
+            "insurance_sum": cell["insurance_paid"].sum(), "member_sum": cell["member_paid"].sum(),
+            "cost_points": list(np.quantile(cell["cost"], np.linspace(0, 1, 21))),
+        })
+    # BigQuery hands back NULL for a missing category; such cells belong to no cohort
+    null_cell = dict(rows[0], gender=None)
+    from_rows = CohortCube.from_rows(rows + [null_cell])
+    assert from_rows.categories == cube.categories
+    assert "gender IS NOT NULL AND region IS NOT NULL AND visit_type IS NOT NULL" in cube_query()
+    assert_matches_scan(from_rows.estimate(INPUTS), backend.scan_cost_stats(cohort_filter(INPUTS)))
+
+
+def test_saved_cube_is_reused(tmp_path):
+    path = tmp_path / "costs.csv"
+    pd.DataFrame({
+        "age": [30, 31, 32], "gender": ["Female"] * 3, "region": ["West"] * 3, "visit_type": ["Outpatient"] * 3,
+        "cost": [100.0, 200.0, 300.0], "insurance_paid": [80.0, 150.0, 240.0], "member_paid": [20.0, 50.0, 60.0],
+    }).to_csv(path, index=False)
+    backend = LocalBackend(path=str(path))
+
+    saved = load_cube(backend, str(tmp_path / "cube"))
+    loaded = load_cube(backend, str(tmp_path / "cube"))
+    assert loaded is not saved
+    assert isinstance(loaded.points, np.memmap)
+    assert loaded.estimate(INPUTS) == saved.estimate(INPUTS)
+    assert loaded.estimate(INPUTS)["median_cost"] == 200.0
+
+    # The dashboard falls back to per-request queries on this error, and only this one
+    with pytest.raises(CubeUnavailableError):
+        load_cube(type("KPIStoreBackend", (DataBackend,), {"name": "materialized"})())
+
+
+def test_neighbors_and_prefetch(cube):
+    neighbors = neighbor_inputs(INPUTS, cube.categories)
+    assert dict(INPUTS, gender="male") in neighbors
+    assert dict(INPUTS, state="south") in neighbors
+    assert dict(INPUTS, age_min=20) in neighbors and dict(INPUTS, age_max=65) in neighbors
+    assert INPUTS not in neighbors
+
+    prefetcher = Prefetcher(cube.estimate)
+    prefetcher.submit(neighbors)
+    assert prefetcher.wait(timeout=5)
+    assert prefetcher.warmed == len(neighbors)
+    hits = cube._memo.hits
+    cube.estimate(dict(INPUTS, visit_type="inpatient"))
+    assert cube._memo.hits == hits + 1
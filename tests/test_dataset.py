@@ -0,0 +1,64 @@
+import os
+
+import pytest
+
+from agents.cost_estimator import dataset
+from agents.cost_estimator.backends import DEFAULT_DATA_PATH
+from agents.cost_estimator.cohorts import cohort_filter
+from agents.cost_estimator.local_backend import LocalBackend
+
+COHORTS = [
+    cohort_filter({"age_min": 25, "age_max": 60, "gender": "Female", "state": "west", "visit_type": "emergency"}),
+    cohort_filter({"age_min": 0, "age_max": 100, "gender": "male", "region": "South", "visit_type": "Primary Care"}),
+    cohort_filter({"age_min": 10, "age_max": 20, "gender": "nobody", "region": "south", "visit_type": "inpatient"}),
+]
+
+
+@pytest.fixture(scope="module")
+def csv_backend():
+    return LocalBackend(DEFAULT_DATA_PATH)
+
+
+@pytest.mark.parametrize("fmt", ["parquet", "arrow"])
+def test_converted_dataset_matches_csv(tmp_path, csv_backend, fmt):
+    output = dataset.convert(DEFAULT_DATA_PATH, str(tmp_path / fmt), fmt)
+    # Hive partitions: one directory per gender/region/visit_type combination
+    assert sorted(os.listdir(output)) == ["gender=female", "gender=male", "gender=other"]
+
+    local = LocalBackend(output)
+    lazy = dataset.DatasetBackend(output)
+    for cohort in COHORTS:
+        expected = csv_backend.scan_cost_stats(cohort)
+        assert local.scan_cost_stats(cohort) == pytest.approx(expected)
+        assert lazy.cost_stats(cohort) == pytest.approx(expected)
+    assert local.categories == csv_backend.categories
+
+
+def test_cohort_filter_prunes_partitions(tmp_path, csv_backend):
+    output = dataset.convert(DEFAULT_DATA_PATH, str(tmp_path / "parquet"))
+    opened = dataset.open_dataset(output)
+    fragments = list(opened.get_fragments(filter=dataset.cohort_expression(COHORTS[0])))
+    assert len(fragments) == 1
+    assert "gender=female/region=west/visit_type=emergency" in fragments[0].path
+
+    table = dataset.read_table(output, columns=("cost",), cohort=COHORTS[0], dataset=opened)
+    assert table.column_names == ["cost"]
+    assert table.num_rows == int(csv_backend.mask(COHORTS[0]).sum())
+
+
+def test_large_amounts_keep_their_cents(tmp_path):
+    # Above 2**24 cents ($167,772.16) a float32 can no longer hold every cent
+    path = tmp_path / "claims.csv"
+    path.write_text(
+        "member_id,age,gender,region,visit_type,service_date,cost,diagnosis_code,insurance_paid,member_paid\n"
+        "a,40,Female,West,Inpatient,2024-05-01,250000.37,E11.9,200000.21,50000.16\n"
+        "b,41,Female,West,Inpatient,2024-05-01,183456.79,E11.9,150000.01,33456.78\n"
+    )
+    output = dataset.convert(str(path), str(tmp_path / "parquet"))
+    cohort = cohort_filter({"age_min": 0, "age_max": 100, "gender": "female", "region": "west",
+                            "visit_type": "inpatient"})
+    expected = LocalBackend(str(path)).scan_cost_stats(cohort)
+    assert expected["max_cost"] == 250000.37
+    assert LocalBackend(output).scan_cost_stats(cohort) == expected
+    assert dataset.DatasetBackend(output).cost_stats(cohort) == expected
+    assert dataset.read_table(output, columns=("cost",)).column("cost").to_pylist() == [250000.37, 183456.79]
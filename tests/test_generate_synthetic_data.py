@@ -0,0 +1,26 @@
+import pandas as pd
+
+import generate_synthetic_data as gen
+
+
+def test_same_seed_same_rows():
+    first = pd.concat(gen.generate_chunks(5000, seed=7, chunk_size=2000))
+    second = pd.concat(gen.generate_chunks(5000, seed=7, chunk_size=2000))
+    pd.testing.assert_frame_equal(first, second)
+
+
+def test_grid_covers_every_cohort_cell_and_paid_adds_up():
+    frame = pd.concat(gen.generate_chunks(gen.GRID_ROWS + 100, seed=1, chunk_size=1000), ignore_index=True)
+    assert list(frame.columns) == gen.COLUMNS
+    assert len(frame.groupby(["gender", "region", "visit_type", "age"], observed=True)) == gen.GRID_ROWS
+    assert ((frame["insurance_paid"] + frame["member_paid"] - frame["cost"]).abs() < 0.011).all()
+    assert frame["service_date"].nunique() > 300
+    assert frame["member_id"].is_unique
+
+
+def test_cli_streams_csv(tmp_path):
+    output = tmp_path / "claims.csv"
+    gen.main(["--rows", "2500", "--chunk-size", "1000", "--seed", "3", "--output", str(output)])
+    frame = pd.read_csv(output)
+    assert len(frame) == 2500
+    assert list(frame.columns) == gen.COLUMNS
@@ -0,0 +1,91 @@
+import time
+
+import pytest
+
+from agents.common.llm_cache import LLMCache, cache_key
+from agents.common.llm_client import LLMClient, StubBackend
+
+MESSAGES = [{"role": "user", "content": "Average Cost: 2489.0"}]
+
+
+@pytest.fixture
+def make_client():
+    # Clients own a background loop and an HTTP session; close them with the test
+    clients = []
+
+    def _client(**kwargs):
+        clients.append(LLMClient(**kwargs))
+        return clients[-1]
+
+    yield _client
+    for client in clients:
+        client.close()
+
+
+def test_key_covers_model_messages_and_params():
+    base = cache_key("gpt-4", MESSAGES, {"temperature": 0.7})
+    assert base == cache_key("gpt-4", [dict(MESSAGES[0])], {"temperature": 0.7})
+    assert base != cache_key("gpt-3.5-turbo", MESSAGES, {"temperature": 0.7})
+    assert base != cache_key("gpt-4", MESSAGES, {"temperature": 0.2})
+    assert base != cache_key("gpt-4", [{"role": "user", "content": "Average Cost: 2490.0"}], {"temperature": 0.7})
+
+
+def test_repeat_prompt_is_served_from_cache(make_client):
+    backend = StubBackend()
+    client = make_client(backend=backend, cache=LLMCache())
+
+    first = client.complete(MESSAGES)
+    second = client.complete(MESSAGES)
+
+    assert backend.calls == 1
+    assert second.text == first.text
+    assert (first.cached, second.cached) == (False, True)
+    assert client.cache.stats()["hits"] == 1
+
+
+def test_bypass_flag_skips_the_cache(make_client):
+    backend = StubBackend()
+    client = make_client(backend=backend, cache=LLMCache())
+
+    client.complete(MESSAGES)
+    client.complete(MESSAGES, use_cache=False)
+
+    assert backend.calls == 2
+
+
+def test_lru_eviction_and_ttl():
+    cache = LLMCache(max_entries=2, ttl=0.05)
+    cache.put("a", {"text": "a"})
+    cache.put("b", {"text": "b"})
+    cache.get("a")
+    cache.put("c", {"text": "c"})
+
+    assert cache.get("b") is None
+    assert cache.get("a") == {"text": "a"}
+    assert cache.stats()["evictions"] == 1
+
+    time.sleep(0.06)
+    assert cache.get("a") is None
+    assert cache.stats()["expirations"] >= 1
+
+
+def test_disk_tier_survives_restart(tmp_path):
+    path = str(tmp_path / "llm_cache.sqlite")
+    LLMCache(path=path).put("key", {"text": "persisted"})
+
+    fresh = LLMCache(path=path)
+    assert fresh.get("key") == {"text": "persisted"}
+    assert fresh.stats()["disk_hits"] == 1
+    assert fresh.stats()["misses"] == 0
+
+
+def test_promoted_entry_keeps_its_stored_expiry(tmp_path):
+    path = str(tmp_path / "llm_cache.sqlite")
+    LLMCache(path=path, ttl=0.2).put("key", {"text": "persisted"})
+    time.sleep(0.15)
+
+    # Promotion from disk must not re-arm a full TTL in memory
+    fresh = LLMCache(path=path, ttl=0.2)
+    assert fresh.get("key") == {"text": "persisted"}
+    time.sleep(0.1)
+    assert fresh.get("key") is None
@@ -0,0 +1,134 @@
+import asyncio
+import time
+
+import pytest
+
+from agents.anomaly_detector.agent import arun_anomaly_detector, astream_anomaly_detector, run_anomaly_detector
+from agents.benefits_interpreter.agent import (
+    arun_benefits_interpreter,
+    astream_benefits_interpreter,
+    run_benefits_interpreter,
+)
+from agents.common.llm_client import LLMClient, LLMTimeoutError, StubBackend, set_client
+from agents.insight_generator.agent import arun_insight_generator, astream_insight_generator, run_insight_generator
+from agents.llm_reasoner.agent import LLMReasonerAgent
+
+KPIS = {"avg_cost": 2489.0, "median_cost": 2432.0, "min_cost": 101.5, "max_cost": 4990.0}
+
+
+@pytest.fixture
+def stub():
+    backend = StubBackend()
+    set_client(LLMClient(backend=backend))
+    yield backend
+    set_client(None)
+
+
+@pytest.fixture
+def make_client():
+    # Clients own a background loop and an HTTP session; close them with the test
+    clients = []
+
+    def _client(**kwargs):
+        clients.append(LLMClient(**kwargs))
+        return clients[-1]
+
+    yield _client
+    for client in clients:
+        client.close()
+
+
+def test_sync_and_async_agents_agree(stub):
+    async def run_all():
+        return await asyncio.gather(
+            arun_benefits_interpreter(KPIS),
+            arun_anomaly_detector(KPIS),
+            arun_insight_generator(KPIS),
+        )
+
+    assert list(asyncio.run(run_all())) == [
+        run_benefits_interpreter(KPIS),
+        run_anomaly_detector(KPIS),
+        run_insight_generator(KPIS),
+    ]
+    # The sync calls repeat byte-identical prompts and are answered from the cache
+    assert stub.calls == 3
+
+
+def test_guards_skip_the_llm(stub):
+    assert "Not enough KPI data" in run_benefits_interpreter({})["benefit_summary"]
+    assert "Missing cost KPIs" in run_insight_generator({})["insights"]
+    assert stub.calls == 0
+
+
+def test_prompts_stay_in_flight_concurrently(make_client):
+    client = make_client(backend=StubBackend(latency=0.2))
+
+    async def fan_out():
+        messages = [{"role": "user", "content": "hello"}]
+        return await asyncio.gather(*(client.achat(messages) for _ in range(50)))
+
+    start = time.perf_counter()
+    replies = asyncio.run(fan_out())
+    assert len(replies) == 50
+    assert time.perf_counter() - start < 1.0
+
+
+def test_per_call_timeout(make_client):
+    client = make_client(backend=StubBackend(latency=1.0))
+    with pytest.raises(LLMTimeoutError):
+        client.chat([{"role": "user", "content": "slow"}], timeout=0.05)
+
+
+def test_reasoner_uses_injected_client(make_client):
+    agent = LLMReasonerAgent(client=make_client(backend=StubBackend(reply="three points")))
+    assert agent.reason({}, {"estimate_cost": KPIS}) == {"summary": "three points"}
+    assert asyncio.run(agent.areason({}, {"estimate_cost": KPIS})) == {"summary": "three points"}
+
+
+def test_streams_end_with_the_non_streaming_result():
+    set_client(LLMClient(backend=StubBackend(latency=0.05), cache=None))
+    try:
+        async def final(stream):
+            return [partial async for partial in stream(KPIS)]
+
+        for stream, run in (
+            (astream_benefits_interpreter, run_benefits_interpreter),
+            (astream_anomaly_detector, run_anomaly_detector),
+            (astream_insight_generator, run_insight_generator),
+        ):
+            partials = asyncio.run(final(stream))
+            assert len(partials) > 2
+            assert partials[-1] == run(KPIS)
+    finally:
+        set_client(None)
+
+
+def test_streamed_reply_is_cached(make_client):
+    backend = StubBackend(reply="one two three")
+    client = make_client(backend=backend)
+    messages = [{"role": "user", "content": "stream me"}]
+
+    async def collect():
+        return [delta async for delta in client.astream(messages)]
+
+    assert asyncio.run(collect()) == ["one", " two", " three"]
+    assert asyncio.run(collect()) == ["one two three"]
+    assert client.chat(messages) == "one two three"
+    assert backend.calls == 1
+
+
+def test_one_pooled_session_for_every_caller(make_client):
+    client = make_client(backend=StubBackend(), cache=None)
+    messages = [{"role": "user", "content": "hello"}]
+
+    asyncio.run(client.achat(messages))
+    session = client._http
+    asyncio.run(client.achat(messages))
+    client.chat(messages)
+    assert client._http is session and not session.closed
+
+    client.close()
+    assert session.closed and client._loop is None
+    # A closed client starts a new loop on its next call
+    assert client.chat(messages).startswith("[stub:gpt-4]")
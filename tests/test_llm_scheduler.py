@@ -0,0 +1,167 @@
+import asyncio
+import threading
+import time
+
+import pytest
+from aiohttp import web
+
+from agents.common.llm_client import LLMClient, OpenAIBackend
+from agents.common.llm_scheduler import LLMScheduler, TokenBucket, llm_priority, retry_after_seconds
+from config.tracing import Tracer, tracing
+
+MESSAGES = [{"role": "user", "content": "hello"}]
+
+
+@pytest.fixture
+def fake_openai():
+    # A local chat-completions endpoint that answers 429 to the first `throttle` requests
+    state = {"requests": 0, "throttle": 0, "retry_after": "0.2"}
+
+    async def completions(request):
+        state["requests"] += 1
+        if state["requests"] <= state["throttle"]:
+            return web.json_response(
+                {"error": {"message": "Rate limit reached", "type": "requests"}},
+                status=429, headers={"Retry-After": state["retry_after"]},
+            )
+        return web.json_response({
+            "choices": [{"message": {"role": "assistant", "content": "ok"}}],
+            "usage": {"prompt_tokens": 5, "completion_tokens": 1},
+        })
+
+    loop = asyncio.new_event_loop()
+    app = web.Application()
+    app.router.add_post("/v1/chat/completions", completions)
+    runner = web.AppRunner(app)
+    loop.run_until_complete(runner.setup())
+    site = web.TCPSite(runner, "127.0.0.1", 0)
+    loop.run_until_complete(site.start())
+    port = site._server.sockets[0].getsockname()[1]
+    thread = threading.Thread(target=loop.run_forever, daemon=True)
+    thread.start()
+
+    state["api_base"] = f"http://127.0.0.1:{port}/v1"
+    yield state
+
+    asyncio.run_coroutine_threadsafe(runner.cleanup(), loop).result()
+    loop.call_soon_threadsafe(loop.stop)
+    thread.join()
+    loop.close()
+
+
+@pytest.fixture
+def make_client():
+    # Clients own a background loop and an HTTP session; close them with the test
+    clients = []
+
+    def _client(**kwargs):
+        clients.append(LLMClient(**kwargs))
+        return clients[-1]
+
+    yield _client
+    for client in clients:
+        client.close()
+
+
+def test_retries_429_honouring_retry_after(fake_openai, make_client):
+    fake_openai["throttle"] = 2
+    scheduler = LLMScheduler(max_concurrency=8)
+    client = make_client(backend=OpenAIBackend(api_key="test", api_base=fake_openai["api_base"]),
+                         cache=None, scheduler=scheduler)
+    tracer = Tracer()
+
+    start = time.perf_counter()
+    with tracing(tracer):
+        assert client.chat(MESSAGES) == "ok"
+    assert time.perf_counter() - start >= 0.4
+
+    assert fake_openai["requests"] == 3
+    llm_call = next(s for s in tracer.spans if s.name == "llm_call")
+    assert llm_call.attributes["retries"] == 2
+    stats = scheduler.stats()
+    assert (stats["throttled"], stats["retries"], stats["completed"]) == (2, 2, 1)
+    # Both 429s were halvings of the limit, then one success added a little back
+    assert stats["concurrency_limit"] < 8 / 2
+    assert stats["tokens_last_minute"] == 6
+
+
+def test_gives_up_after_max_attempts(fake_openai, make_client):
+    import openai
+
+    fake_openai.update(throttle=10, retry_after="0")
+    client = make_client(backend=OpenAIBackend(api_key="test", api_base=fake_openai["api_base"]),
+                         cache=None, scheduler=LLMScheduler(max_attempts=3, backoff=0.01))
+    with pytest.raises(openai.error.RateLimitError):
+        client.chat(MESSAGES)
+    assert fake_openai["requests"] == 3
+
+
+def test_interactive_lane_goes_first():
+    scheduler = LLMScheduler(max_concurrency=1)
+    order = []
+
+    async def call(name, lane):
+        with llm_priority(lane):
+            ticket = await scheduler.acquire()
+        order.append(name)
+        scheduler.release(ticket)
+
+    async def main():
+        held = await scheduler.acquire()
+        tasks = [asyncio.create_task(call(f"batch{i}", "batch")) for i in range(3)]
+        tasks.append(asyncio.create_task(call("interactive", "interactive")))
+        await asyncio.sleep(0.01)
+        assert scheduler.stats()["queue_depth"] == {"interactive": 1, "batch": 3}
+        scheduler.release(held)
+        await asyncio.gather(*tasks)
+
+    asyncio.run(main())
+    assert order == ["interactive", "batch0", "batch1", "batch2"]
+
+
+def test_request_bucket_spaces_out_calls():
+    scheduler = LLMScheduler(requests_per_minute=600)
+    scheduler.requests.level = 0
+
+    async def main():
+        for _ in range(3):
+            scheduler.release(await scheduler.acquire())
+
+    start = time.perf_counter()
+    asyncio.run(main())
+    # 600/min is one request every 0.1s once the burst is spent
+    assert 0.25 <= time.perf_counter() - start < 1.0
+
+
+def test_token_bucket_and_retry_after():
+    now = [0.0]
+    bucket = TokenBucket(per_minute=6000, clock=lambda: now[0])
+    bucket.take(6000)
+    assert bucket.delay(100) == pytest.approx(1.0)
+    now[0] = 0.5
+    assert bucket.delay(100) == pytest.approx(0.5)
+    assert TokenBucket(0).delay(10 ** 9) == 0
+
+    class Throttled(Exception):
+        headers = {"retry-after": "1.5"}
+
+    assert retry_after_seconds(Throttled()) == 1.5
+    assert retry_after_seconds(ValueError()) is None
+
+
+def test_aimd_cuts_once_per_wave():
+    scheduler = LLMScheduler(max_concurrency=16)
+
+    async def main():
+        tickets = [await scheduler.acquire() for _ in range(4)]
+        for ticket in tickets:
+            scheduler.release(ticket, outcome="throttled")
+        assert scheduler.limit == 8
+        ticket = await scheduler.acquire()
+        scheduler.release(ticket, outcome="throttled")
+        assert scheduler.limit == 4
+        ticket = await scheduler.acquire()
+        scheduler.release(ticket)
+        assert scheduler.limit == pytest.approx(4.25)
+
+    asyncio.run(main())
@@ -0,0 +1,176 @@
+import os
+import time
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from agents.cost_estimator.agent import run_cost_estimator, run_cost_estimator_batch
+from agents.cost_estimator.backends import DEFAULT_DATA_PATH, DataBackend, set_backend
+from agents.cost_estimator.cohorts import cohort_filter
+from agents.cost_estimator.kpi_cache import CachedBackend
+from agents.cost_estimator.local_backend import LocalBackend
+
+
+@pytest.fixture(scope="module")
+def frame():
+    return pd.read_csv(DEFAULT_DATA_PATH)
+
+
+@pytest.fixture
+def backend(frame):
+    backend = LocalBackend(frame=frame)
+    set_backend(backend)
+    yield backend
+    set_backend(None)
+
+
+def brute_force(frame, inputs):
+    cohort = cohort_filter(inputs)
+    rows = frame[
+        frame["age"].between(cohort.age_min, cohort.age_max)
+        & (frame["gender"].str.lower() == cohort.gender)
+        & (frame["region"].str.lower() == cohort.region)
+        & (frame["visit_type"].str.lower() == cohort.visit_type)
+    ]
+    return rows
+
+
+def test_matches_brute_force(backend, frame):
+    inputs = {"age_min": 25, "age_max": 60, "gender": "Female", "state": "west", "visit_type": "emergency"}
+    rows = brute_force(frame, inputs)
+    stats = run_cost_estimator(inputs)
+
+    assert stats["sample_size"] == len(rows)
+    assert stats["avg_cost"] == pytest.approx(rows["cost"].mean())
+    assert stats["median_cost"] == pytest.approx(rows["cost"].median())
+    assert stats["std_dev"] == pytest.approx(rows["cost"].std())
+    assert (stats["min_cost"], stats["max_cost"]) == (rows["cost"].min(), rows["cost"].max())
+    assert stats["insurance_coverage_ratio"] == pytest.approx(rows["insurance_paid"].mean() / rows["cost"].mean())
+    assert stats["member_burden_ratio"] == pytest.approx(rows["member_paid"].mean() / rows["cost"].mean())
+
+
+def test_unknown_category_returns_empty_kpis(backend):
+    assert run_cost_estimator({"gender": "male", "state": "southeast", "visit_type": "emergency"}) == {
+        "avg_cost": 0, "median_cost": 0, "min_cost": 0, "max_cost": 0
+    }
+
+
+def test_batch_matches_single(backend):
+    cohorts = [
+        {"gender": "male", "state": "south", "visit_type": "inpatient"},
+        {"age_min": 10, "age_max": 20, "gender": "other", "region": "midwest", "visit_type": "outpatient"},
+        {"gender": "male", "state": "south", "visit_type": "inpatient"},
+    ]
+    assert run_cost_estimator_batch(cohorts) == [run_cost_estimator(c) for c in cohorts]
+
+
+def test_batch_keeps_input_order_and_shares_duplicates(backend, monkeypatch):
+    cohorts = [
+        {"age_min": 30, "age_max": 50, "gender": "Female", "state": "West", "visit_type": "Emergency"},
+        {"gender": "male", "region": "south", "visit_type": "inpatient"},
+        {"age_min": 10, "age_max": 20, "gender": "other", "region": "midwest", "visit_type": "outpatient"},
+        {"age_min": 30, "age_max": 50, "gender": " female", "region": "WEST", "visit_type": "emergency "},
+        {"gender": "nobody", "region": "south", "visit_type": "inpatient"},
+    ]
+    expected = [run_cost_estimator(c) for c in cohorts]
+    computed = []
+    cost_stats = backend.cost_stats
+    monkeypatch.setattr(backend, "cost_stats", lambda cohort: computed.append(cohort) or cost_stats(cohort))
+
+    results = run_cost_estimator_batch(cohorts)
+    assert len(results) == len(cohorts)
+    assert results == expected
+    assert results[1]["sample_size"] != results[2]["sample_size"]
+    # The first and fourth inputs are the same cohort once canonicalised: one computation
+    assert len(computed) == 4 and results[0] == results[3]
+    assert results[0] is not results[3]
+
+
+def test_kpi_cache_invalidates_on_data_change(tmp_path, frame):
+    path = tmp_path / "costs.csv"
+    frame.to_csv(path, index=False)
+    cached = CachedBackend(LocalBackend(path=str(path)), version_check_interval=0)
+    cohort = cohort_filter({"gender": "male", "state": "west", "visit_type": "emergency"})
+
+    first = cached.cost_stats(cohort)
+    assert cached.cost_stats(cohort) == first
+    assert cached.stats()["hits"] == 1
+
+    changed = frame.copy()
+    changed["cost"] = changed["cost"] * 2
+    changed.to_csv(path, index=False)
+    os.utime(path, ns=(time.time_ns(), time.time_ns() + 1_000_000_000))
+
+    assert cached.cost_stats(cohort)["avg_cost"] == pytest.approx(first["avg_cost"] * 2)
+    assert cached.stats()["invalidations"] == 1
+
+
+def test_kpi_cache_hits_are_private_and_not_billed(backend):
+    class Warehouse(DataBackend):
+        name = "bigquery"
+
+        def cost_stats(self, cohort):
+            return dict(backend.cost_stats(cohort), query_stats={"job_id": "job-1", "cache_hit": False,
+                                                                 "total_bytes_billed": 10_485_760})
+
+        def cost_percentiles(self, cohort, quantiles):
+            return dict(backend.cost_percentiles(cohort, quantiles), query_stats={"job_id": "job-2"})
+
+    cached = CachedBackend(Warehouse())
+    cohort = cohort_filter({"gender": "male", "state": "west", "visit_type": "emergency"})
+    assert cached.cost_stats(cohort)["query_stats"]["job_id"] == "job-1"
+    hit = cached.cost_stats(cohort)
+    assert hit["query_stats"] == {"source": "kpi_cache"}
+    hit["query_stats"]["source"] = "corrupted"
+    assert cached.cost_stats_many([cohort])[0]["query_stats"] == {"source": "kpi_cache"}
+
+    cached.cost_percentiles(cohort, (0.5,))
+    percentiles = cached.cost_percentiles(cohort, (0.5,))
+    percentiles["cost"]["p50"] = -1.0
+    assert cached.cost_percentiles(cohort, (0.5,))["cost"]["p50"] > 0
+
+
+def test_rows_with_a_missing_category_belong_to_no_cell(frame):
+    # pandas reads a blank field as NaN, whose category code is -1
+    sample = frame.head(2000).copy()
+    sample.loc[:9, "gender"] = np.nan
+    sample.loc[10:19, "region"] = None
+    backend = LocalBackend(frame=sample)
+    for inputs in (
+        {"age_min": 0, "age_max": 100, "gender": "male", "state": "northeast", "visit_type": "emergency"},
+        {"age_min": 20, "age_max": 70, "gender": "female", "state": "northeast", "visit_type": "outpatient"},
+    ):
+        cohort = cohort_filter(inputs)
+        expected = backend.scan_cost_stats(cohort)
+        assert backend.cost_stats(cohort) == pytest.approx(expected)
+        assert backend.cost_percentiles(cohort)["sample_size"] == expected["sample_size"]
+    counted = sum(digests["cost"].count for digests in backend.sketches.column(backend, "cost").cells.values())
+    assert counted == len(sample) - 20
+
+
+def test_age_index_matches_full_scan(backend):
+    for inputs in (
+        {"age_min": 0, "age_max": 100, "gender": "female", "state": "northeast", "visit_type": "primary care"},
+        {"age_min": 37, "age_max": 37, "gender": "other", "state": "south", "visit_type": "inpatient"},
+        {"age_min": 90, "age_max": 140, "gender": "male", "state": "west", "visit_type": "outpatient"},
+        {"age_min": 60, "age_max": 30, "gender": "male", "state": "west", "visit_type": "outpatient"},
+    ):
+        cohort = cohort_filter(inputs)
+        indexed, scanned = backend.cost_stats(cohort), backend.scan_cost_stats(cohort)
+        assert indexed.keys() == scanned.keys()
+        for key, value in scanned.items():
+            assert indexed[key] == pytest.approx(value), key
+
+
+def test_age_index_persists_and_memory_maps(tmp_path, frame):
+    path = tmp_path / "costs.csv"
+    frame.to_csv(path, index=False)
+    index_path = str(tmp_path / "age_index")
+    built = LocalBackend(path=str(path), index_path=index_path)
+
+    reloaded = LocalBackend(path=str(path), index_path=index_path)
+    cohort = cohort_filter({"age_min": 18, "age_max": 64, "gender": "female", "state": "west", "visit_type": "emergency"})
+
+    assert isinstance(reloaded.age_index.arrays["count"], np.memmap)
+    assert reloaded.cost_stats(cohort) == built.cost_stats(cohort)
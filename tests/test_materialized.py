@@ -0,0 +1,180 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from agents.cost_estimator.cohorts import cohort_filter
+from agents.cost_estimator.local_backend import LocalBackend
+from agents.cost_estimator.materialized import KPIStore, MaterializedBackend, refresh_from_bigquery
+
+INPUTS = {"age_min": 20, "age_max": 65, "gender": "female", "region": "west", "visit_type": "outpatient"}
+
+
+def claims(rng, rows, service_date):
+    cost = np.round(rng.lognormal(7, 0.5, rows), 2)
+    insurance = np.round(cost * 0.75, 2)
+    return pd.DataFrame({
+        "member_id": [f"m{i}" for i in range(rows)],
+        "age": rng.integers(0, 101, rows),
+        "gender": rng.choice(["Female", "Male"], rows),
+        "region": rng.choice(["West", " south"], rows),
+        "visit_type": rng.choice(["Outpatient", "Inpatient"], rows),
+        "service_date": service_date,
+        "cost": cost,
+        "diagnosis_code": "E11.9",
+        "insurance_paid": insurance,
+        "member_paid": np.round(cost - insurance, 2),
+    })
+
+
+def assert_matches_scan(stats, frame, median_rel=0.02):
+    expected = LocalBackend(frame=frame).scan_cost_stats(cohort_filter(INPUTS))
+    assert stats["sample_size"] == expected["sample_size"]
+    for key in ("avg_cost", "min_cost", "max_cost", "std_dev", "insurance_coverage_ratio", "member_burden_ratio"):
+        assert stats[key] == pytest.approx(expected[key])
+    assert stats["median_cost"] == pytest.approx(expected["median_cost"], rel=median_rel)
+
+
+def test_refresh_folds_in_only_new_rows(tmp_path):
+    rng = np.random.default_rng(3)
+    csv_path, store_path = tmp_path / "costs.csv", tmp_path / "kpis.npz"
+    first = pd.concat([claims(rng, 4000, "2024-05-01"), claims(rng, 4000, "2024-05-02")])
+    first.to_csv(csv_path, index=False)
+
+    backend = MaterializedBackend(str(csv_path), str(store_path))
+    assert backend.store.watermark == "2024-05-02"
+    assert backend.store.rows == 8000
+    assert_matches_scan(backend.cost_stats(cohort_filter(INPUTS)), first)
+    version = backend.data_version()
+    assert backend.refresh() == 0
+
+    # Yesterday's claims arrive; only they are aggregated
+    new = claims(rng, 500, "2024-05-03")
+    new.to_csv(csv_path, mode="a", header=False, index=False)
+    assert backend.data_version() != version
+    assert backend.store.rows == 8500 and backend.store.watermark == "2024-05-03"
+    assert_matches_scan(backend.cost_stats(cohort_filter(INPUTS)), pd.concat([first, new]))
+
+    # A restart picks the store up from disk and has nothing to add
+    restarted = MaterializedBackend(str(csv_path), str(store_path))
+    assert restarted.store.version() == backend.store.version()
+    assert restarted.cost_stats(cohort_filter(INPUTS)) == backend.cost_stats(cohort_filter(INPUTS))
+
+
+def test_unknown_cohort_is_empty():
+    store = KPIStore()
+    assert store.cost_stats(cohort_filter(INPUTS)) == {"avg_cost": 0, "median_cost": 0, "min_cost": 0, "max_cost": 0}
+
+
+def test_percentiles_merge_the_cell_digests(tmp_path):
+    frame = claims(np.random.default_rng(11), 6000, "2024-05-01")
+    path = tmp_path / "costs.csv"
+    frame.to_csv(path, index=False)
+    backend = MaterializedBackend(str(path))
+
+    cohort = cohort_filter(INPUTS)
+    percentiles = backend.cost_percentiles(cohort)
+    expected = LocalBackend(frame=frame).cost_percentiles(cohort)
+    assert percentiles["sample_size"] == expected["sample_size"]
+    assert percentiles["cost"] == pytest.approx(expected["cost"], rel=0.02)
+    assert percentiles["cost"]["p50"] == backend.cost_stats(cohort)["median_cost"]
+    assert backend.cost_percentiles(cohort_filter(dict(INPUTS, gender="unknown"))) == {"sample_size": 0}
+
+
+def test_late_partial_and_rewritten_csv_rows(tmp_path):
+    rng = np.random.default_rng(4)
+    csv_path, store_path = tmp_path / "costs.csv", tmp_path / "kpis.npz"
+    first = pd.concat([claims(rng, 1000, "2024-05-01"), claims(rng, 1000, "2024-05-02")])
+    first.to_csv(csv_path, index=False)
+    backend = MaterializedBackend(str(csv_path), str(store_path))
+
+    # Claims for a date the store has already seen still count
+    late = claims(rng, 300, "2024-05-02")
+    late.to_csv(csv_path, mode="a", header=False, index=False)
+    backend.data_version()
+    assert backend.store.rows == 2300
+    assert_matches_scan(backend.cost_stats(cohort_filter(INPUTS)), pd.concat([first, late]))
+
+    # A line still being written waits for its newline
+    line = claims(rng, 1, "2024-05-03").to_csv(header=False, index=False)
+    with open(csv_path, "a") as f:
+        f.write(line[:10])
+    backend.data_version()
+    assert backend.store.rows == 2300
+    with open(csv_path, "a") as f:
+        f.write(line[10:])
+    backend.data_version()
+    assert (backend.store.rows, backend.store.watermark) == (2301, "2024-05-03")
+
+    # A corrected, shorter file is rebuilt rather than appended to
+    corrected = first.assign(cost=first["cost"] * 2, insurance_paid=first["insurance_paid"] * 2,
+                             member_paid=first["member_paid"] * 2)
+    corrected.to_csv(csv_path, index=False)
+    backend.data_version()
+    assert (backend.store.rows, backend.store.watermark) == (2000, "2024-05-02")
+    assert_matches_scan(backend.cost_stats(cohort_filter(INPUTS)), corrected)
+    restarted = MaterializedBackend(str(csv_path), str(store_path))
+    assert restarted.refresh() == 0 and restarted.store.version() == backend.store.version()
+
+
+class FakeWarehouse:
+    # incremental_cells_query's grouping, run over a claims frame
+    def __init__(self, frame):
+        self.frame = frame
+        self.since = []
+
+    def incremental_cells(self, since, points, lookback_days):
+        self.since.append(since)
+        horizon = (pd.Timestamp(self.frame["service_date"].max()) - pd.Timedelta(days=lookback_days)).strftime("%Y-%m-%d")
+        frame = self.frame if since is None else self.frame[self.frame["service_date"] >= since]
+        frame = frame.assign(
+            gender=frame["gender"].str.lower(), region=frame["region"].str.strip().str.lower(),
+            visit_type=frame["visit_type"].str.lower(),
+            open_date=frame["service_date"].where(frame["service_date"] >= horizon, ""),
+        )
+        rows = []
+        for (gender, region, visit_type, age, open_date), group in frame.groupby(
+            ["gender", "region", "visit_type", "age", "open_date"]
+        ):
+            cost = group["cost"].to_numpy()
+            rows.append({
+                "gender": gender, "region": region, "visit_type": visit_type, "age": age, "count": len(group),
+                "cost_sum": cost.sum(), "cost_sumsq": (cost * cost).sum(), "cost_min": cost.min(),
+                "cost_max": cost.max(), "insurance_sum": group["insurance_paid"].sum(),
+                "member_sum": group["member_paid"].sum(),
+                "cost_points": np.quantile(cost, np.linspace(0, 1, points + 1)).tolist(),
+                "max_service_date": group["service_date"].max(), "open_date": open_date or None,
+                "horizon": horizon,
+            })
+        return rows
+
+
+def test_refresh_from_warehouse_rows(tmp_path):
+    rng = np.random.default_rng(6)
+    frame = pd.concat([claims(rng, 3000, date) for date in ("2024-05-01", "2024-05-02", "2024-05-03")])
+    warehouse = FakeWarehouse(frame)
+    # Medians come from a handful of quantile points per cell, so they are looser here
+    store = KPIStore()
+    assert refresh_from_bigquery(store, warehouse, lookback_days=1) == 9000
+    assert (store.horizon, sorted(store.open_cells)) == ("2024-05-02", ["2024-05-02", "2024-05-03"])
+    assert refresh_from_bigquery(store, warehouse, lookback_days=1) == 0
+    assert_matches_scan(store.cost_stats(cohort_filter(INPUTS)), frame, median_rel=0.05)
+
+    # Late claims inside the open window replace its cells instead of being skipped
+    warehouse.frame = frame = pd.concat([frame, claims(rng, 300, "2024-05-03"), claims(rng, 200, "2024-05-02")])
+    assert refresh_from_bigquery(store, warehouse, lookback_days=1) == 500
+    assert_matches_scan(store.cost_stats(cohort_filter(INPUTS)), frame, median_rel=0.05)
+
+    # A new day moves the window; 2024-05-02 is folded in for good
+    warehouse.frame = frame = pd.concat([frame, claims(rng, 400, "2024-05-04")])
+    assert refresh_from_bigquery(store, warehouse, lookback_days=1) == 400
+    assert (store.horizon, sorted(store.open_cells)) == ("2024-05-03", ["2024-05-03", "2024-05-04"])
+    assert store.rows == len(frame) and store.watermark == "2024-05-04"
+    assert_matches_scan(store.cost_stats(cohort_filter(INPUTS)), frame, median_rel=0.05)
+    assert warehouse.since == [None, "2024-05-02", "2024-05-02", "2024-05-02"]
+
+    # Open cells survive a save and load
+    store.save(str(tmp_path / "kpis.npz"))
+    loaded = KPIStore.load(str(tmp_path / "kpis.npz"))
+    assert (loaded.version(), loaded.horizon, sorted(loaded.open_cells)) == \
+        (store.version(), store.horizon, sorted(store.open_cells))
+    assert loaded.cost_stats(cohort_filter(INPUTS)) == store.cost_stats(cohort_filter(INPUTS))
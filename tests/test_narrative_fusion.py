@@ -0,0 +1,69 @@
+import json
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from agents.anomaly_detector import agent as anomaly_detector
+from agents.benefits_interpreter import agent as benefits_interpreter
+from agents.common.llm_client import LLMClient, StubBackend, set_client
+from agents.insight_generator import agent as insight_generator
+from agents.narrative_fusion import agent as narrative_fusion
+
+KPIS = {"avg_cost": 2489.0, "median_cost": 2432.0, "min_cost": 101.5, "max_cost": 4990.0}
+REPLY = {"benefit_summary": " Members use benefits evenly. ", "explanation": "No red flags.", "insights": "ER drives the tail."}
+
+
+@pytest.fixture
+def fused(monkeypatch):
+    monkeypatch.setenv("DATASAGE_NARRATIVE_MODE", "fused")
+    # Keep the anomaly step on its KPI path so all three steps share the fused call
+    monkeypatch.setattr(anomaly_detector, "_row_source", lambda: None)
+    narrative_fusion._recent.clear()
+
+    def _client(reply):
+        backend = StubBackend(latency=0.1, reply=reply)
+        set_client(LLMClient(backend=backend, cache=None))
+        return backend
+
+    yield _client
+    set_client(None)
+    narrative_fusion._recent.clear()
+
+
+def run_steps():
+    # The executor runs benefits and anomalies side by side, insights after them
+    with ThreadPoolExecutor(max_workers=2) as pool:
+        benefits = pool.submit(benefits_interpreter.run, estimate_cost=KPIS)
+        anomalies = pool.submit(anomaly_detector.run, estimate_cost=KPIS)
+        return benefits.result(), anomalies.result(), insight_generator.run(estimate_cost=KPIS)
+
+
+def test_one_call_feeds_all_three_steps(fused):
+    backend = fused(json.dumps(REPLY))
+
+    benefits, anomalies, insights = run_steps()
+
+    assert backend.calls == 1
+    assert benefits == {"benefit_summary": "Members use benefits evenly."}
+    assert anomalies == {"anomaly_flags": [], "explanation": "No red flags."}
+    assert insights == {"insights": "ER drives the tail."}
+
+
+def test_unparseable_reply_falls_back_to_separate_calls(fused):
+    backend = fused("Sorry, here is some prose instead of JSON.")
+
+    benefits, anomalies, insights = run_steps()
+
+    assert backend.calls == 1 + 3
+    assert benefits == benefits_interpreter.run_benefits_interpreter(KPIS)
+    assert anomalies == anomaly_detector.run_anomaly_detector(KPIS)
+    assert insights == insight_generator.run_insight_generator(KPIS)
+
+
+def test_parse_response():
+    fenced = "```json\n" + json.dumps(REPLY) + "\n```"
+    assert narrative_fusion.parse_response(fenced) == REPLY
+    with pytest.raises(narrative_fusion.NarrativeParseError):
+        narrative_fusion.parse_response(json.dumps(dict(REPLY, insights="")))
+    with pytest.raises(narrative_fusion.NarrativeParseError):
+        narrative_fusion.parse_response(json.dumps({"benefit_summary": "only one"}))
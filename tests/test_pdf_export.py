@@ -0,0 +1,60 @@
+import io
+import zipfile
+
+from streamlit_app.pdf_export import ReportCache, export_reports, generate_pdf_report, report_key, to_latin1
+
+RESULTS = {
+    "estimate_cost": {"avg_cost": 2489.0, "median_cost": 2432.0},
+    "generate_insights": {"insights": "⚠️ Emergency visits — not primary care — drive the tail…"},
+}
+
+
+def cohort(i):
+    return dict(RESULTS, estimate_cost={"avg_cost": float(i)})
+
+
+def test_to_latin1_keeps_text_readable():
+    assert to_latin1("⚠️ costs — “high”…") == '! costs - "high"...'
+    assert to_latin1("日本") == "??"
+
+
+def test_identical_results_share_cached_bytes():
+    first = generate_pdf_report(RESULTS)
+    assert first.startswith(b"%PDF")
+    assert generate_pdf_report(dict(RESULTS)) is first
+    assert report_key(RESULTS) != report_key(cohort(1))
+    # Sections render in insertion order, so a different order is a different report
+    assert report_key(dict(reversed(list(RESULTS.items())))) != report_key(RESULTS)
+
+
+def test_export_to_directory_dedupes(tmp_path):
+    reports = [(f"cohort_{i}", cohort(i % 3)) for i in range(6)]
+    stats = export_reports(reports, str(tmp_path / "out"), workers=1, cache=ReportCache())
+
+    assert sorted(p.name for p in (tmp_path / "out").iterdir()) == [f"cohort_{i}.pdf" for i in range(6)]
+    assert (stats["reports"], stats["rendered"], stats["cache_hits"]) == (6, 3, 3)
+    assert stats["pages"] >= 6 and stats["pages_per_second"] > 0
+    assert (tmp_path / "out" / "cohort_4.pdf").read_bytes() == (tmp_path / "out" / "cohort_1.pdf").read_bytes()
+
+
+def test_export_to_zip_stream_across_processes(tmp_path):
+    buffer = io.BytesIO()
+    cache = ReportCache(directory=str(tmp_path / "cache"))
+    reports = [("r0", cohort(0)), ("r0_copy", cohort(0))] + [(f"r{i}", cohort(i)) for i in range(1, 4)]
+    stats = export_reports(reports, buffer, workers=2, cache=cache)
+
+    archive = zipfile.ZipFile(buffer)
+    assert sorted(archive.namelist()) == ["r0.pdf", "r0_copy.pdf", "r1.pdf", "r2.pdf", "r3.pdf"]
+    # The copy joined r0's render while it was still running; that is not a cache hit
+    assert (stats["rendered"], stats["deduplicated"], stats["cache_hits"]) == (4, 1, 0)
+    # A fresh in-memory cache over the same directory renders nothing
+    again = export_reports([("r0", cohort(0))], str(tmp_path / "again"),
+                           cache=ReportCache(directory=str(tmp_path / "cache")))
+    assert again["rendered"] == 0 and again["cache_hits"] == 1
+
+
+def test_pdf_without_page_count_is_a_miss(tmp_path):
+    cache = ReportCache(directory=str(tmp_path))
+    cache.put("key", (b"%PDF-1.3", 1))
+    (tmp_path / "key.pdf.pages").unlink()
+    assert ReportCache(directory=str(tmp_path)).get("key") is None
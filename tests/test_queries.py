@@ -0,0 +1,59 @@
+from google.cloud import bigquery
+
+from agents.cost_estimator.cohorts import cohort_filter
+from agents.cost_estimator.queries import (
+    batch_cost_stats_query,
+    cohort_parameters,
+    cohorts_parameter,
+    cost_stats_query,
+    percentiles_query,
+)
+
+HOSTILE = "M' OR 1=1 --"
+COHORT = {"age_min": 30, "age_max": 40, "gender": HOSTILE, "region": "West'; DROP TABLE claims; --",
+          "visit_type": "emergency"}
+
+
+def values(parameters):
+    return {parameter.name: parameter.value for parameter in parameters}
+
+
+def test_templates_hold_no_cohort_values():
+    for query in (cost_stats_query(), batch_cost_stats_query(), percentiles_query()):
+        for value in ("M'", "1=1", "DROP", "West", "emergency", "30", "40"):
+            assert value not in query
+    assert "@gender" in cost_stats_query() and "@gender" in percentiles_query()
+    assert "UNNEST(@cohorts)" in batch_cost_stats_query()
+
+
+def test_equivalent_cohorts_share_parameters():
+    canonical = {"age_min": 25, "age_max": 60, "gender": "female", "region": "west", "visit_type": "primary care"}
+    variants = [
+        {"age_min": "25", "age_max": 60, "gender": " Female ", "state": "WEST", "visit_type": "Primary   Care"},
+        {"age_min": 25, "age_max": 60, "gender": "FEMALE", "region": "West", "visit_type": "primary care"},
+    ]
+    expected = values(cohort_parameters(cohort_filter(canonical)))
+    assert expected == {"age_min": 25, "age_max": 60, "gender": "female", "region": "west",
+                        "visit_type": "primary care"}
+    for variant in variants:
+        assert values(cohort_parameters(cohort_filter(variant))) == expected
+    # A negative age_min is clamped, so it cannot widen the scan differently from 0
+    assert values(cohort_parameters(cohort_filter(dict(canonical, age_min=-5))))["age_min"] == 0
+
+    batch = cohorts_parameter([cohort_filter(v) for v in variants])
+    assert batch.to_api_repr() == cohorts_parameter([cohort_filter(canonical)] * 2).to_api_repr()
+
+
+def test_hostile_input_only_reaches_parameter_values():
+    cohort = cohort_filter(COHORT)
+    parameters = cohort_parameters(cohort)
+    assert all(isinstance(parameter, bigquery.ScalarQueryParameter) for parameter in parameters)
+    by_name = {parameter.name: parameter for parameter in parameters}
+    assert by_name["gender"].value == HOSTILE.lower()
+    assert by_name["gender"].type_ == "STRING"
+
+    batch = cohorts_parameter([cohort]).to_api_repr()
+    struct = batch["parameterValue"]["arrayValues"][0]["structValues"]
+    assert struct["gender"]["value"] == HOSTILE.lower()
+    for query in (cost_stats_query(), batch_cost_stats_query(), percentiles_query()):
+        assert HOSTILE.lower() not in query.lower()
@@ -0,0 +1,152 @@
+import asyncio
+import json
+import textwrap
+
+import pytest
+from aiohttp.test_utils import TestClient, TestServer
+
+from config.agent_executor import AgentExecutor
+from service import create_app
+from service.server import AnalysisService
+
+STUB_AGENTS = '''
+import time
+
+CALLS = []
+
+def estimate(**kwargs):
+    CALLS.append(kwargs.get("gender"))
+    time.sleep(0.2)
+    return {"avg_cost": 100}
+
+def narrate(estimate_cost=None, **kwargs):
+    return {"text": f"cost {estimate_cost['avg_cost']}"}
+
+def fail(**kwargs):
+    raise RuntimeError("warehouse unavailable")
+'''
+
+TASK = """
+steps:
+  - id: estimate_cost
+    module: stub_service_agents.steps
+    function: {estimate}
+  - id: summarize
+    module: stub_service_agents.steps
+    function: narrate
+    uses: [estimate_cost]
+"""
+
+
+@pytest.fixture
+def make_executor(tmp_path, monkeypatch):
+    package = tmp_path / "stub_service_agents"
+    package.mkdir()
+    (package / "__init__.py").write_text("")
+    (package / "steps.py").write_text(STUB_AGENTS)
+    monkeypatch.syspath_prepend(str(tmp_path))
+
+    def _executor(estimate="estimate"):
+        path = tmp_path / f"task_{estimate}.yaml"
+        path.write_text(textwrap.dedent(TASK.format(estimate=estimate)))
+        return AgentExecutor(str(path))
+
+    yield _executor
+    import stub_service_agents.steps
+    stub_service_agents.steps.CALLS.clear()
+
+
+def serve(app, scenario):
+    async def main():
+        async with TestClient(TestServer(app)) as client:
+            return await scenario(client)
+
+    return asyncio.run(main())
+
+
+async def post_lines(client, payload):
+    response = await client.post("/analyze", json=payload)
+    lines = [json.loads(line) async for line in response.content if line.strip()]
+    return response, lines
+
+
+async def collect(events):
+    return [event async for event in events]
+
+
+def test_streams_each_step_then_done(make_executor):
+    async def scenario(client):
+        response, lines = await post_lines(client, {"gender": "female"})
+        assert response.status == 200
+        assert response.headers["Content-Type"] == "application/x-ndjson"
+        return lines
+
+    lines = serve(create_app(make_executor()), scenario)
+    assert lines[0] == {"step": "estimate_cost", "result": {"avg_cost": 100}}
+    assert lines[1] == {"step": "summarize", "result": {"text": "cost 100"}}
+    assert lines[2]["done"] is True and lines[2]["coalesced"] is False
+
+
+def test_identical_requests_share_one_execution(make_executor):
+    import stub_service_agents.steps as steps
+
+    async def scenario(client):
+        results = await asyncio.gather(*(post_lines(client, {"gender": "female"}) for _ in range(5)))
+        other = await post_lines(client, {"gender": "male"})
+        metrics = await (await client.get("/metrics")).json()
+        return [lines for _, lines in results], other[1], metrics
+
+    app = create_app(make_executor())
+    streams, other, metrics = serve(app, scenario)
+
+    assert steps.CALLS == ["female", "male"]
+    assert all(lines[:2] == streams[0][:2] for lines in streams)
+    assert sorted(lines[-1]["coalesced"] for lines in streams) == [False] + [True] * 4
+    assert other[0]["step"] == "estimate_cost"
+    assert (metrics["requests"], metrics["executions"], metrics["coalesced"]) == (6, 2, 4)
+    assert metrics["inflight"] == 0
+
+
+def test_sheds_load_when_saturated(make_executor):
+    async def scenario(client):
+        first = asyncio.create_task(post_lines(client, {"gender": "female"}))
+        await asyncio.sleep(0.05)
+        rejected = await client.post("/analyze", json={"gender": "male"})
+        joined = await post_lines(client, {"gender": "female"})
+        return rejected.status, rejected.headers.get("Retry-After"), (await first)[1], joined[1]
+
+    app = create_app(make_executor(), max_concurrent=1, max_queued=0)
+    status, retry_after, first, joined = serve(app, scenario)
+    assert (status, retry_after) == (503, "1")
+    # A request for the cohort already running still joins it
+    assert first[:2] == joined[:2] and joined[-1]["coalesced"] is True
+
+
+def test_errors_and_health(make_executor):
+    async def scenario(client):
+        bad = await client.post("/analyze", data="not json")
+        not_object = await client.post("/analyze", json=[1, 2])
+        health = await (await client.get("/healthz")).json()
+        _, failed = await post_lines(client, {"gender": "female"})
+        return bad.status, not_object.status, health, failed
+
+    bad, not_object, health, failed = serve(create_app(make_executor("fail")), scenario)
+    assert (bad, not_object) == (400, 400)
+    assert health == {"status": "ok"}
+    assert failed == [{"error": "RuntimeError: warehouse unavailable"}]
+
+
+def test_queued_execution_cancelled_on_shutdown(make_executor):
+    async def scenario():
+        service = AnalysisService(make_executor(), max_concurrent=1)
+        running = service._start("female", {"gender": "female"})
+        queued = service._start("male", {"gender": "male"})
+        await service.close()
+        replayed = await asyncio.wait_for(collect(queued.follow()), timeout=5)
+        await asyncio.wait_for(collect(running.follow()), timeout=5)
+        return service, queued, replayed
+
+    service, queued, replayed = asyncio.run(scenario())
+    assert replayed == [] and isinstance(queued.error, asyncio.CancelledError)
+    assert (service.counters["cancelled"], service.counters["completed"]) == (1, 1)
+    assert service.inflight == {}
@@ -0,0 +1,58 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from agents.cost_estimator.cohorts import cohort_filter
+from agents.cost_estimator.local_backend import LocalBackend
+from agents.cost_estimator.sketches import TDigest
+
+QUANTILES = (0.5, 0.9, 0.95, 0.99)
+
+
+def relative_rank_error(values, estimate, q):
+    return abs(np.searchsorted(np.sort(values), estimate) / values.size - q)
+
+
+def test_digest_tracks_skewed_distribution():
+    values = np.random.default_rng(7).lognormal(mean=7, sigma=1.0, size=200_000)
+    digest = TDigest.from_values(values)
+
+    assert digest.means.size < 400
+    for q, estimate in zip(QUANTILES, digest.quantiles(QUANTILES)):
+        assert relative_rank_error(values, estimate, q) < 0.005
+
+
+def test_merged_digests_match_single_digest():
+    rng = np.random.default_rng(11)
+    parts = [rng.lognormal(mean=6 + i % 3, sigma=0.8, size=5_000) for i in range(40)]
+    merged = TDigest.merge_all([TDigest.from_values(part) for part in parts])
+    values = np.concatenate(parts)
+
+    assert merged.count == values.size
+    assert (merged.min, merged.max) == (values.min(), values.max())
+    for q, estimate in zip(QUANTILES, merged.quantiles(QUANTILES)):
+        assert relative_rank_error(values, estimate, q) < 0.01
+
+
+def test_cohort_percentiles_from_cell_sketches():
+    rng = np.random.default_rng(3)
+    size = 50_000
+    frame = pd.DataFrame({
+        "age": rng.integers(0, 101, size),
+        "gender": rng.choice(["Male", "Female"], size),
+        "region": rng.choice(["West", "South"], size),
+        "visit_type": rng.choice(["Emergency", "Inpatient"], size),
+        "cost": rng.lognormal(7, 1.0, size),
+    })
+    frame["insurance_paid"] = frame["cost"] * 0.8
+    frame["member_paid"] = frame["cost"] * 0.2
+    backend = LocalBackend(frame=frame)
+    cohort = cohort_filter({"age_min": 20, "age_max": 64, "gender": "female", "state": "west", "visit_type": "emergency"})
+
+    result = backend.cost_percentiles(cohort, QUANTILES)
+    cost = backend.cost[backend.mask(cohort)]
+
+    assert result["sample_size"] == cost.size
+    assert set(result) == {"sample_size", "cost", "insurance_paid", "member_paid"}
+    for q in QUANTILES:
+        assert result["cost"][f"p{q * 100:g}"] == pytest.approx(np.quantile(cost, q), rel=0.02)
@@ -0,0 +1,96 @@
+import json
+import textwrap
+
+import pytest
+
+from agents.common.llm_client import LLMClient, StubBackend, set_client
+from config.agent_executor import AgentExecutor
+from config.tracing import JsonLinesSink, NULL_SPAN, Tracer, current_span, span, to_chrome_trace
+
+STUB_AGENTS = '''
+from agents.common.llm_client import get_client
+
+def estimate(**kwargs):
+    return {"avg_cost": 100}
+
+def narrate(estimate_cost=None, **kwargs):
+    return {"text": get_client().chat([{"role": "user", "content": f"cost {estimate_cost['avg_cost']}"}])}
+'''
+
+TASK = """
+steps:
+  - id: estimate_cost
+    module: stub_tracing_agents.steps
+    function: estimate
+  - id: interpret_benefits
+    module: stub_tracing_agents.steps
+    function: narrate
+    uses: [estimate_cost]
+  - id: detect_anomalies
+    module: stub_tracing_agents.steps
+    function: narrate
+    uses: [estimate_cost]
+"""
+
+
+@pytest.fixture
+def task_path(tmp_path, monkeypatch):
+    package = tmp_path / "stub_tracing_agents"
+    package.mkdir()
+    (package / "__init__.py").write_text("")
+    (package / "steps.py").write_text(STUB_AGENTS)
+    monkeypatch.syspath_prepend(str(tmp_path))
+    path = tmp_path / "task.yaml"
+    path.write_text(textwrap.dedent(TASK))
+    set_client(LLMClient(backend=StubBackend()))
+    yield str(path)
+    set_client(None)
+
+
+def test_executor_records_step_import_and_llm_spans(task_path):
+    tracer = Tracer()
+    AgentExecutor(task_path, tracer=tracer).run({"gender": "female"})
+
+    by_id = {s.span_id: s for s in tracer.spans}
+    names = sorted(s.name for s in tracer.spans)
+    assert names.count("import") == 3
+    assert names.count("llm_call") == 2
+    assert {"executor.run", "step:estimate_cost", "step:interpret_benefits", "step:detect_anomalies"} <= set(names)
+
+    root = next(s for s in tracer.spans if s.name == "executor.run")
+    for s in tracer.spans:
+        assert s.trace_id == tracer.trace_id
+        assert s.wall_ms >= 0 and s.cpu_ms >= 0
+        if s.name.startswith("step:"):
+            assert s.parent_id == root.span_id
+        if s.name == "import":
+            assert by_id[s.parent_id].name == "executor.resolve"
+        if s.name == "llm_call":
+            assert by_id[s.parent_id].name.startswith("step:")
+
+    llm_calls = [s for s in tracer.spans if s.name == "llm_call"]
+    # Both steps send the same prompt, so whichever finishes second is served from the cache
+    assert all(s.attributes["prompt_tokens"] > 0 for s in llm_calls)
+    assert {s.attributes["cache"] for s in llm_calls} <= {"hit", "miss"}
+
+
+def test_exports(task_path, tmp_path):
+    path = tmp_path / "spans.jsonl"
+    tracer = Tracer(sink=JsonLinesSink(str(path)))
+    AgentExecutor(task_path, tracer=tracer).run({})
+
+    lines = [json.loads(line) for line in path.read_text().splitlines()]
+    assert {"name", "span_id", "parent_id", "wall_ms", "cpu_ms", "attributes"} <= set(lines[0])
+
+    memory = Tracer()
+    AgentExecutor(task_path, tracer=memory).run({})
+    events = to_chrome_trace(memory.spans)["traceEvents"]
+    assert len(events) == len(memory.spans)
+    assert all(e["ph"] == "X" and e["dur"] >= 0 for e in events)
+
+
+def test_disabled_tracing_is_a_no_op():
+    with span("anything", key="value") as s:
+        assert s is NULL_SPAN
+        s.set(tokens=10)
+    assert current_span() is NULL_SPAN